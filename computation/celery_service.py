@@ -1,5 +1,11 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
+
+from computation_service import warm_sandbox
+from result_serialization import CELERY_RESULT_SETTINGS, register as register_result_serializer
+
+register_result_serializer()
 
 queue_name = os.environ.get('CELERY_COMPUTATION_QUEUE', 'computation_queue')
 
@@ -14,6 +20,14 @@ celery.conf.update(
     task_routes={
         'tasks.*': {'queue': queue_name},
     },
+    **CELERY_RESULT_SETTINGS,
 )
 
+
+@worker_process_init.connect
+def warm_computation_sandbox(**_kwargs):
+    # One template per pool process: its forkserver cannot be shared across forks.
+    warm_sandbox()
+
+
 import tasks  # noqa: E402,F401
\ No newline at end of file
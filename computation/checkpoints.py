@@ -0,0 +1,224 @@
+"""
+checkpoints.py
+~~~~~~~~~~~~~~
+Checkpoint and resume for long computation jobs.
+
+User code gets a `checkpoint` object:
+
+    state = checkpoint.load(default={'next': 0})
+    for n in range(state['next'], limit):
+        ...
+        if checkpoint.due(60):
+            checkpoint.save({'next': n + 1})
+
+States are JSON, written atomically (temporary file + rename) to
+`COMPUTATION_CHECKPOINT_ROOT/<job key>/state.json`.  The job key is the
+result-cache key of the job (program, entrypoint, input, target, runtime),
+so running the same job again, on any worker sharing the volume, resumes
+from its last checkpoint; `resume: false` starts over.  The worker records
+the runtime of every attempt in `meta.json`; results carry the accumulated
+runtime over all attempts.  The checkpoint is dropped once the job
+completes, and abandoned ones after `COMPUTATION_CHECKPOINT_TTL_SECONDS`.
+
+A run holds an exclusive lock on `<job key>.lock` next to the directory for
+as long as it uses the checkpoint, so a second run of the same job while the
+first is still going is rejected instead of sharing or deleting its state.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import time
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+CHECKPOINT_ROOT = os.environ.get('COMPUTATION_CHECKPOINT_ROOT', '/var/lib/coproof/checkpoints')
+CHECKPOINT_TTL_SECONDS = int(os.environ.get('COMPUTATION_CHECKPOINT_TTL_SECONDS', str(7 * 24 * 3600)))
+PRUNE_INTERVAL_SECONDS = 3600
+
+STATE_FILE = 'state.json'
+META_FILE = 'meta.json'
+
+_last_prune = 0.0
+
+
+def _write_json_atomic(path: str, value):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(handle, 'w', encoding='utf-8') as temp_file:
+            json.dump(value, temp_file, ensure_ascii=True)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _read_json(path: str, default=None):
+    try:
+        with open(path, 'r', encoding='utf-8') as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return default
+
+
+def _lock_file(path: str):
+    """
+    Take an exclusive lock on *path* without waiting. Returns the open file,
+    or None when another run holds it.
+    """
+    while True:
+        handle = open(path, 'a')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            return None
+        # A finishing run or the pruner may have unlinked the file meanwhile.
+        try:
+            if os.fstat(handle.fileno()).st_ino == os.stat(path).st_ino:
+                return handle
+        except FileNotFoundError:
+            pass
+        handle.close()
+
+
+def _unlink_and_unlock(handle):
+    try:
+        os.unlink(handle.name)
+    except OSError:
+        pass
+    handle.close()
+
+
+class CheckpointBusy(Exception):
+    """Raised when another run of the same job is using its checkpoint."""
+
+
+class Checkpoint:
+    """The `checkpoint` object of user code; without a directory it keeps nothing."""
+
+    def __init__(self, directory: str = None):
+        self.directory = directory
+        self.state_path = os.path.join(directory, STATE_FILE) if directory else None
+        self.resumed = bool(self.state_path) and os.path.isfile(self.state_path)
+        self.saves = 0
+        self._last_save = time.monotonic()
+
+    def load(self, default=None):
+        """The last saved state, or *default* when the job starts fresh."""
+        if not self.state_path:
+            return default
+        saved = _read_json(self.state_path)
+        return saved['state'] if saved else default
+
+    def save(self, state):
+        """Persist *state* (JSON-serializable) atomically."""
+        self._last_save = time.monotonic()
+        if not self.state_path:
+            return
+        _write_json_atomic(self.state_path, {'state': state, 'saved_at': time.time()})
+        self.saves += 1
+
+    def due(self, interval_seconds: float = 60):
+        """True once *interval_seconds* passed since the start or the last save."""
+        return time.monotonic() - self._last_save >= interval_seconds
+
+
+def checkpoint_root():
+    root = CHECKPOINT_ROOT
+    try:
+        os.makedirs(root, exist_ok=True)
+    except OSError:
+        root = os.path.join(tempfile.gettempdir(), 'coproof-checkpoints')
+        os.makedirs(root, exist_ok=True)
+    return root
+
+
+class JobCheckpoint:
+    """Worker-side bookkeeping of one job's checkpoint directory."""
+
+    def __init__(self, job_key: str, resume: bool = True):
+        prune_checkpoints()
+        self.directory = os.path.join(checkpoint_root(), job_key)
+        self._lock = _lock_file(self.directory + '.lock')
+        if self._lock is None:
+            raise CheckpointBusy('The same job is already running; try again once it has finished.')
+        if not resume:
+            shutil.rmtree(self.directory, ignore_errors=True)
+        self.resumed = os.path.isfile(os.path.join(self.directory, STATE_FILE))
+        meta = _read_json(os.path.join(self.directory, META_FILE), {}) if self.resumed else {}
+        self.previous_seconds = float(meta.get('accumulated_seconds') or 0.0)
+        self.previous_attempts = int(meta.get('attempts') or 0)
+
+    def finish_attempt(self, elapsed_seconds: float, completed: bool):
+        """
+        Account one attempt and release the lock. The checkpoint is kept only
+        when the job did not complete and saved a state. Returns the runtime
+        fields for the result.
+        """
+        accumulated = self.previous_seconds + elapsed_seconds
+        attempts = self.previous_attempts + 1
+        kept = not completed and os.path.isfile(os.path.join(self.directory, STATE_FILE))
+        try:
+            if kept:
+                _write_json_atomic(
+                    os.path.join(self.directory, META_FILE),
+                    {'accumulated_seconds': accumulated, 'attempts': attempts, 'updated_at': time.time()},
+                )
+            else:
+                shutil.rmtree(self.directory, ignore_errors=True)
+        finally:
+            if kept:
+                self._lock.close()
+            else:
+                _unlink_and_unlock(self._lock)
+        return {
+            'accumulated_runtime_seconds': round(accumulated, 6),
+            'attempts': attempts,
+            'resumed_from_checkpoint': self.resumed,
+            'checkpoint_available': kept,
+        }
+
+
+def prune_checkpoints():
+    """
+    Remove checkpoints untouched for longer than the TTL, and their lock
+    files, unless a run holds them; at most once per PRUNE_INTERVAL_SECONDS.
+    """
+    global _last_prune
+    now = time.time()
+    if now - _last_prune < PRUNE_INTERVAL_SECONDS:
+        return
+    _last_prune = now
+    for entry in os.scandir(checkpoint_root()):
+        try:
+            if now - entry.stat().st_mtime <= CHECKPOINT_TTL_SECONDS:
+                continue
+            if entry.name.endswith('.lock'):
+                # Lock files of checkpoints that are already gone.
+                if os.path.isdir(entry.path[:-len('.lock')]):
+                    continue
+                directory = None
+            elif entry.is_dir():
+                directory = entry.path
+            else:
+                continue
+            lock = _lock_file(entry.path if directory is None else directory + '.lock')
+            if lock is None:
+                continue
+            if directory is not None:
+                shutil.rmtree(directory, ignore_errors=True)
+            _unlink_and_unlock(lock)
+        except OSError:
+            pass
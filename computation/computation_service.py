@@ -1,155 +1,290 @@
+import contextlib
+import fcntl
 import json
+import logging
+import math
+import multiprocessing
+import multiprocessing.forkserver
+import os
+import shutil
 import subprocess
 import sys
 import tempfile
-import textwrap
 import time
-from pathlib import Path
-
-
-RUNNER_SOURCE = textwrap.dedent(
-    """
-    import contextlib
-    import io
-    import json
-    import traceback
-    from pathlib import Path
-
-    def normalize_result(value):
-        if isinstance(value, dict):
-            sufficient = value.get('sufficient')
-            if not isinstance(sufficient, bool):
-                raise ValueError("Computation result dict must contain a boolean 'sufficient' field.")
-            records = value.get('records')
-            if records is not None and not isinstance(records, list):
-                raise ValueError("Computation result dict optional 'records' field must be a list.")
-            return {
-                'evidence': value.get('evidence'),
-                'sufficient': sufficient,
-                'summary': value.get('summary'),
-                'records': records,
-            }
-
-        if isinstance(value, (list, tuple)) and len(value) == 2 and isinstance(value[1], bool):
-            return {
-                'evidence': value[0],
-                'sufficient': value[1],
-                'summary': None,
-            }
-
-        raise ValueError(
-            "Computation entrypoint must return {'evidence': ..., 'sufficient': bool} or (evidence, sufficient)."
-        )
+from concurrent.futures import ThreadPoolExecutor
 
-    def main():
-        payload = json.loads(Path('payload.json').read_text(encoding='utf-8'))
-        source_code = Path('user_code.py').read_text(encoding='utf-8')
-        global_scope = {'__name__': '__main__'}
-        stdout_buffer = io.StringIO()
-        stderr_buffer = io.StringIO()
+import sandbox_runner
+from checkpoints import CheckpointBusy, JobCheckpoint
+from log_store import store_log
+from progress import PROGRESS_FILE, PROGRESS_INTERVAL_SECONDS, ComputationCancelled, ProgressMonitor
+from record_stream import merge_handles, new_stream_dir, remove_stream
+from resource_usage import ProcessTreeSampler, combine_usage, finish_usage
+from result_cache import computation_cache_key
+from workspace_pool import get_workspace_pool
 
-        try:
-            with contextlib.redirect_stdout(stdout_buffer), contextlib.redirect_stderr(stderr_buffer):
-                exec(compile(source_code, 'user_code.py', 'exec'), global_scope)
-                entrypoint = global_scope.get(payload['entrypoint'])
-                if not callable(entrypoint):
-                    raise ValueError(f"Entrypoint '{payload['entrypoint']}' is not defined or not callable.")
-
-                value = entrypoint(payload.get('input_data'), payload.get('target'))
-                normalized = normalize_result(value)
-
-            response = {
-                'completed': True,
-                'sufficient': normalized['sufficient'],
-                'evidence': normalized['evidence'],
-                'summary': normalized.get('summary'),
-                'records': normalized.get('records') or [],
-                'stdout': stdout_buffer.getvalue(),
-                'stderr': stderr_buffer.getvalue(),
-                'error': None,
-            }
-        except Exception as error:
-            response = {
-                'completed': False,
-                'sufficient': False,
-                'evidence': None,
-                'summary': None,
-                'records': [],
-                'stdout': stdout_buffer.getvalue(),
-                'stderr': stderr_buffer.getvalue(),
-                'error': str(error),
-                'traceback': traceback.format_exc(),
-            }
-
-        print(json.dumps(response, ensure_ascii=True))
-
-    if __name__ == '__main__':
-        main()
-    """
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+MAX_LOG_CHARS = int(os.environ.get('COMPUTATION_MAX_LOG_CHARS', '65536'))
+# 'forkserver' runs jobs in children of a warm template, 'subprocess' in a new interpreter.
+SANDBOX_MODE = os.environ.get('COMPUTATION_SANDBOX', 'forkserver').strip().lower()
+SANDBOX_PRELOAD = tuple(
+    name.strip() for name in os.environ.get('COMPUTATION_SANDBOX_PRELOAD', 'numpy,scipy,sympy,networkx').split(',')
+    if name.strip()
+)
+MAX_SHARDS = int(os.environ.get('COMPUTATION_MAX_SHARDS', '64'))
+LOCAL_SHARD_WORKERS = int(os.environ.get('COMPUTATION_SHARD_WORKERS', str(os.cpu_count() or 1)))
+# Sandboxes running at once across all pool processes of this worker.
+MAX_SANDBOXES = int(os.environ.get('COMPUTATION_MAX_SANDBOXES', str(os.cpu_count() or 1)))
+SANDBOX_SLOT_DIR = os.environ.get(
+    'COMPUTATION_SANDBOX_SLOT_DIR', os.path.join(tempfile.gettempdir(), 'coproof-sandbox-slots')
 )
+# A local sharded run (plan, shards, reduce) gets this many timeouts in total.
+SHARDED_TIMEOUT_FACTOR = int(os.environ.get('COMPUTATION_SHARDED_TIMEOUT_FACTOR', '4'))
+RUNNER_PATH = os.path.abspath(sandbox_runner.__file__)
 
+# Payload fields handed to sandbox_runner.execute besides the source.
+RUNNER_JOB_FIELDS = ('entrypoint', 'input_data', 'target', 'call', 'shard_count', 'results', 'records_dir',
+                     'checkpoint_dir', 'rank', 'world_size', 'progress_file')
 
-def run_python_job(payload: dict):
-    timeout_seconds = int(payload.get('timeout_seconds') or 120)
+_sandbox_context = None
+
+
+def get_sandbox_context():
+    """
+    Return the multiprocessing context whose forkserver is the warm sandbox
+    template, or None when jobs run in a fresh interpreter instead.
+
+    The forkserver imports `sandbox_runner`, the `coproof.compute` helpers and
+    the modules listed in `COMPUTATION_SANDBOX_PRELOAD` once (missing ones are
+    skipped); each job is
+    then a new child forked from it, so jobs never share state with each
+    other or with the worker.
+
+    Job children re-import the worker's main module unless it is a package
+    `__main__`, which is why the worker runs as `python -m celery`.
+    """
+    global _sandbox_context
+    if SANDBOX_MODE != 'forkserver' or 'forkserver' not in multiprocessing.get_all_start_methods():
+        return None
+    if _sandbox_context is None:
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['sandbox_runner', 'coproof.compute', *SANDBOX_PRELOAD])
+        _sandbox_context = context
+    return _sandbox_context
+
+
+def warm_sandbox():
+    """Start the forkserver template ahead of the first job."""
+    if get_sandbox_context() is None:
+        return
+    try:
+        multiprocessing.forkserver.ensure_running()
+    except (OSError, ValueError) as error:
+        logger.warning('Could not start the computation sandbox template: %s', error)
+
+
+@contextlib.contextmanager
+def sandbox_slot(timeout_seconds: float):
+    """
+    Hold one of the `COMPUTATION_MAX_SANDBOXES` slots for the duration of a
+    sandbox run. Slots are file locks in SANDBOX_SLOT_DIR, so every pool
+    process and shard thread of the worker draws from the same set, and the
+    kernel frees the slot of a process that dies. Raises TimeoutExpired when
+    no slot frees up within *timeout_seconds*.
+    """
+    os.makedirs(SANDBOX_SLOT_DIR, exist_ok=True)
+    deadline = time.monotonic() + timeout_seconds
+    while True:
+        for slot in range(max(1, MAX_SANDBOXES)):
+            handle = open(os.path.join(SANDBOX_SLOT_DIR, f'slot-{slot}.lock'), 'a')
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                handle.close()
+                continue
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+                handle.close()
+            return
+        if time.monotonic() >= deadline:
+            raise subprocess.TimeoutExpired('sandbox slot', timeout_seconds)
+        time.sleep(0.05)
+
+
+def runner_job(payload: dict):
+    return {field: payload.get(field) for field in RUNNER_JOB_FIELDS}
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        workdir = Path(temp_dir)
-        (workdir / 'user_code.py').write_text(payload['source_code'], encoding='utf-8')
-        (workdir / 'payload.json').write_text(json.dumps({
-            'entrypoint': payload['entrypoint'],
-            'input_data': payload.get('input_data'),
-            'target': payload.get('target'),
-        }, ensure_ascii=True), encoding='utf-8')
-        (workdir / 'runner.py').write_text(RUNNER_SOURCE, encoding='utf-8')
-
-        completed_process = subprocess.run(
-            [sys.executable, 'runner.py'],
-            capture_output=True,
-            text=True,
-            cwd=temp_dir,
-            timeout=timeout_seconds,
+
+def _progress_monitor(payload: dict):
+    part = {name: payload[name] for name in ('shard_index', 'rank') if payload.get(name) is not None}
+    return ProgressMonitor(payload.get('run_id'), payload.get('progress_file'), part)
+
+
+def _run_in_sandbox(context, workspace, payload: dict, timeout_seconds: int, sampler: ProcessTreeSampler):
+    """
+    Run the job in a child of the warm template. Returns (stdout, stderr, exit
+    code); stdout is the runner's reply and stderr whatever the child wrote to
+    fd 1 or fd 2.
+    """
+    monitor = _progress_monitor(payload)
+    stdio_fd, stdio_path = tempfile.mkstemp(prefix='coproof-sandbox-', suffix='.log')
+    os.close(stdio_fd)
+    try:
+        parent_conn, child_conn = context.Pipe()
+        process = context.Process(
+            target=sandbox_runner.serve_job,
+            args=(child_conn, workspace.path, stdio_path),
+            daemon=True,
         )
+        process.start()
+        sampler.pid = process.pid
+        child_conn.close()
+        try:
+            parent_conn.send({'source_code': payload['source_code'], **runner_job(payload)})
+            deadline = time.monotonic() + timeout_seconds
+            while not parent_conn.poll(max(0.0, min(PROGRESS_INTERVAL_SECONDS, deadline - time.monotonic()))):
+                if time.monotonic() >= deadline:
+                    raise subprocess.TimeoutExpired('sandbox_runner', timeout_seconds)
+                sampler.sample()
+                monitor.poll()
+            try:
+                output = parent_conn.recv_bytes().decode('utf-8', errors='replace')
+            except EOFError:
+                output = ''
+            monitor.publish()
+        finally:
+            parent_conn.close()
+            process.join(1)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        with open(stdio_path, encoding='utf-8', errors='replace') as stdio:
+            stderr = stdio.read()
+    finally:
+        os.unlink(stdio_path)
+    return output, stderr, process.exitcode
+
+
+def _run_in_subprocess(workspace, payload: dict, timeout_seconds: int, sampler: ProcessTreeSampler):
+    """Run the job in a new interpreter. Returns (stdout, stderr, exit code)."""
+    workspace.sync({
+        'user_code.py': payload['source_code'],
+        'payload.json': json.dumps(runner_job(payload), ensure_ascii=True),
+    })
+
+    monitor = _progress_monitor(payload)
+    process = subprocess.Popen(
+        [sys.executable, RUNNER_PATH],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        cwd=workspace.path,
+    )
+    sampler.pid = process.pid
+    try:
+        deadline = time.monotonic() + timeout_seconds
+        while True:
+            try:
+                stdout, stderr = process.communicate(
+                    timeout=max(0.0, min(PROGRESS_INTERVAL_SECONDS, deadline - time.monotonic()))
+                )
+                break
+            except subprocess.TimeoutExpired:
+                if time.monotonic() >= deadline:
+                    raise subprocess.TimeoutExpired(RUNNER_PATH, timeout_seconds)
+                sampler.sample()
+                monitor.poll()
+        monitor.publish()
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.communicate()
+    return stdout, stderr, process.returncode
 
-        stdout = completed_process.stdout.strip()
-        if not stdout:
-            return {
-                'completed': False,
-                'sufficient': False,
-                'evidence': None,
-                'summary': None,
-                'records': [],
-                'stdout': '',
-                'stderr': completed_process.stderr.strip(),
-                'error': 'Runner produced no structured output.',
-                'exit_code': completed_process.returncode,
-            }
 
+def run_python_job(payload: dict):
+    """
+    Run one call of the user code; timeouts and cancellations become failed
+    results. Entrypoint calls get a directory for streamed records and a
+    checkpoint keyed by the job, whose runtime accounting is added to the
+    result.
+    """
+    records_dir = None
+    checkpoint = None
+    if (payload.get('call') or 'run') == 'run':
+        records_dir = new_stream_dir()
+        job_key = computation_cache_key(payload)
+        if payload.get('rank') is not None:
+            job_key = f"{job_key}-{payload['rank']}"
+        elif payload.get('shard_index') is not None:
+            job_key = f"{job_key}-s{payload['shard_index']}"
         try:
-            payload = json.loads(stdout)
-        except json.JSONDecodeError:
-            return {
-                'completed': False,
-                'sufficient': False,
-                'evidence': None,
-                'summary': None,
-                'records': [],
-                'stdout': stdout,
-                'stderr': completed_process.stderr.strip(),
-                'error': 'Runner returned malformed JSON output.',
-                'exit_code': completed_process.returncode,
-            }
-
-        payload['exit_code'] = completed_process.returncode
-        if completed_process.stderr.strip():
-            payload['stderr'] = ((payload.get('stderr') or '') + completed_process.stderr).strip()
-        return payload
-
-
-def run_computation_job(payload: dict):
+            checkpoint = JobCheckpoint(job_key, resume=bool(payload.get('resume', True)))
+        except CheckpointBusy as error:
+            shutil.rmtree(records_dir, ignore_errors=True)
+            return {**_timeout_result(payload), 'error': str(error)}
+        payload = {**payload, 'records_dir': records_dir, 'checkpoint_dir': checkpoint.directory}
+
+    result = None
+    sampler = ProcessTreeSampler()
     start = time.perf_counter()
-    language = (payload.get('language') or 'python').strip().lower()
+    try:
+        result = _execute_python_job(payload, sampler)
+    except subprocess.TimeoutExpired:
+        result = _timeout_result(payload)
+    except ComputationCancelled:
+        result = {**_timeout_result(payload), 'error': 'Computation cancelled.', 'cancelled': True}
+    finally:
+        # Partial streams of failed, killed or timed-out jobs are dropped.
+        if records_dir and not (result or {}).get('records_stream'):
+            shutil.rmtree(records_dir, ignore_errors=True)
+        if result is not None:
+            finish_usage(result, sampler)
+        if checkpoint is not None:
+            attempt = checkpoint.finish_attempt(
+                time.perf_counter() - start,
+                completed=bool((result or {}).get('completed')),
+            )
+            if result is not None:
+                result.update(attempt)
+                if attempt['checkpoint_available']:
+                    result['error'] = (
+                        f"{result.get('error') or 'Computation failed.'} "
+                        'Progress is checkpointed; run the job again to resume.'
+                    )
+    return result
 
-    if language != 'python':
+
+def _execute_python_job(payload: dict, sampler: ProcessTreeSampler):
+    timeout_seconds = int(payload.get('timeout_seconds') or 120)
+    context = get_sandbox_context()
+    deadline = time.monotonic() + timeout_seconds
+
+    # Waiting for a free sandbox counts against the job's timeout.
+    with sandbox_slot(timeout_seconds), get_workspace_pool().lease() as workspace:
+        timeout_seconds = max(1, math.ceil(deadline - time.monotonic()))
+        if payload.get('run_id'):
+            payload = {**payload, 'progress_file': os.path.join(workspace.path, PROGRESS_FILE)}
+        output = None
+        if context is not None:
+            # The source is still written so tracebacks can show its lines.
+            workspace.sync({'user_code.py': payload['source_code']})
+            try:
+                output = _run_in_sandbox(context, workspace, payload, timeout_seconds, sampler)
+            except (OSError, ValueError, AssertionError) as error:
+                logger.warning('Computation sandbox unavailable, using a fresh interpreter: %s', error)
+        if output is None:
+            output = _run_in_subprocess(workspace, payload, timeout_seconds, sampler)
+
+    raw_stdout, raw_stderr, exit_code = output
+    stdout = raw_stdout.strip()
+    if not stdout:
         return {
             'completed': False,
             'sufficient': False,
@@ -157,24 +292,183 @@ def run_computation_job(payload: dict):
             'summary': None,
             'records': [],
             'stdout': '',
-            'stderr': '',
-            'error': f'Unsupported computation language: {language}',
-            'processing_time_seconds': round(time.perf_counter() - start, 6),
+            'stderr': raw_stderr.strip(),
+            'error': 'Runner produced no structured output.',
+            'exit_code': exit_code,
         }
 
     try:
-        result = run_python_job(payload)
-    except subprocess.TimeoutExpired:
+        result = json.loads(stdout)
+    except json.JSONDecodeError:
+        return {
+            'completed': False,
+            'sufficient': False,
+            'evidence': None,
+            'summary': None,
+            'records': [],
+            'stdout': stdout,
+            'stderr': raw_stderr.strip(),
+            'error': 'Runner returned malformed JSON output.',
+            'exit_code': exit_code,
+        }
+
+    result['exit_code'] = exit_code
+    if raw_stderr.strip():
+        result['stderr'] = ((result.get('stderr') or '') + raw_stderr).strip()
+    return result
+
+
+def cap_logs(result: dict):
+    """
+    Cap `stdout`/`stderr` of *result* to MAX_LOG_CHARS each. When anything is
+    cut, the complete logs are stored on the side and referenced by `log_ref`.
+    """
+    streams = {name: result.get(name) or '' for name in ('stdout', 'stderr')}
+    if all(len(text) <= MAX_LOG_CHARS for text in streams.values()):
+        return result
+
+    log_ref = store_log(''.join(f'=== {name} ===\n{text}\n' for name, text in streams.items()))
+    for name, text in streams.items():
+        if len(text) > MAX_LOG_CHARS:
+            result[name] = text[:MAX_LOG_CHARS] + f'\n... [{len(text) - MAX_LOG_CHARS} characters truncated]'
+    if log_ref:
+        result['log_ref'] = log_ref
+    return result
+
+
+def _timeout_result(payload: dict):
+    return {
+        'completed': False,
+        'sufficient': False,
+        'evidence': None,
+        'summary': None,
+        'records': [],
+        'stdout': '',
+        'stderr': '',
+        'error': f'Computation timeout after {payload.get("timeout_seconds") or 120} seconds.',
+    }
+
+
+def plan_shards(payload: dict):
+    """
+    Call the user's `shard(input_data, target, k)`. The result carries the
+    list of shard inputs under `shards`, or is a failed result as usual.
+    """
+    shard_count = int(payload.get('shards') or 1)
+    result = run_python_job({**payload, 'call': 'shard', 'shard_count': shard_count})
+    if result.get('completed') and len(result['shards']) > MAX_SHARDS:
+        result.update({
+            'completed': False,
+            'error': f"shard() returned {len(result['shards'])} shards; at most {MAX_SHARDS} are allowed.",
+        })
+    if not result.get('completed'):
+        result.pop('shards', None)
+    return result
+
+
+def shard_payloads(payload: dict, shard_inputs: list):
+    """One plain (unsharded) job payload per shard input."""
+    return [
+        {**payload, 'input_data': shard_input, 'shards': 1, 'shard_index': index}
+        for index, shard_input in enumerate(shard_inputs)
+    ]
+
+
+def reduce_shards(payload: dict, shard_results: list, plan: dict = None, unit: str = 'shard'):
+    """
+    Combine shard results with the user's `reduce(results)` (or the default
+    combination of sandbox_runner). Any failed shard fails the whole job.
+    `reduce` sees inline records only; streamed records of all shards are
+    merged into one `records_stream`. Logs of the plan, every shard and the
+    reduction are concatenated. *unit* names the parts in logs and errors
+    (cluster jobs reduce their ranks the same way).
+    """
+    records_stream = merge_handles([shard.get('records_stream') for shard in shard_results])
+    start = time.perf_counter()
+    logs = [('plan', plan or {})] + [(f'{unit} {index}', result) for index, result in enumerate(shard_results)]
+    failed = [(index, result) for index, result in enumerate(shard_results) if not result.get('completed')]
+
+    if failed:
+        index, first = failed[0]
         result = {
             'completed': False,
             'sufficient': False,
             'evidence': None,
             'summary': None,
             'records': [],
-            'stdout': '',
-            'stderr': '',
-            'error': f'Computation timeout after {payload.get("timeout_seconds") or 120} seconds.',
+            'error': f"{len(failed)} of {len(shard_results)} {unit}s failed; {unit} {index}: {first.get('error')}",
         }
+    else:
+        results = [
+            {field: shard.get(field) for field in ('evidence', 'sufficient', 'summary', 'records')}
+            for shard in shard_results
+        ]
+        result = run_python_job({**payload, 'call': 'reduce', 'results': results})
+        logs.append(('reduce', dict(result)))
+        if result.get('completed') and records_stream:
+            result['records_stream'] = records_stream
+    if not result.get('records_stream'):
+        remove_stream(records_stream)
+
+    for stream in ('stdout', 'stderr'):
+        result[stream] = ''.join(
+            f'=== {name} ===\n{entry.get(stream)}\n' for name, entry in logs if entry.get(stream)
+        )
+    result['shards'] = len(shard_results)
+    result['shard_processing_seconds'] = [shard.get('processing_time_seconds') for shard in shard_results]
+    result['reduce_time_seconds'] = round(time.perf_counter() - start, 6)
+    result['resources'] = combine_usage(
+        [(plan or {}).get('resources'), *[shard.get('resources') for shard in shard_results], result.get('resources')]
+    )
+    shard_runtimes = [shard.get('accumulated_runtime_seconds') for shard in shard_results]
+    if all(runtime is not None for runtime in shard_runtimes):
+        result['accumulated_runtime_seconds'] = round(sum(shard_runtimes), 6)
+    return result
+
+
+def budget_timeout(payload: dict, deadline: float):
+    """*payload* with its timeout cut to what is left before *deadline* (at least one second)."""
+    timeout_seconds = int(payload.get('timeout_seconds') or 120)
+    remaining = math.ceil(deadline - time.monotonic())
+    return {**payload, 'timeout_seconds': max(1, min(timeout_seconds, remaining))}
+
+
+def run_local_parts(part_payloads: list, deadline: float, unit: str = 'shard'):
+    """
+    Run every part (a shard or a rank) as its own job, at most
+    `COMPUTATION_SHARD_WORKERS` at once, each within what is left before
+    *deadline*. Parts that would start after the deadline fail as timed out.
+    """
+    def run_part(part_payload):
+        part_start = time.perf_counter()
+        if time.monotonic() >= deadline:
+            result = {**_timeout_result(part_payload), 'error': f'The job ran out of time before this {unit} started.'}
+        else:
+            result = run_python_job(budget_timeout(part_payload, deadline))
+        result['processing_time_seconds'] = round(time.perf_counter() - part_start, 6)
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, min(LOCAL_SHARD_WORKERS, len(part_payloads)))) as executor:
+        return list(executor.map(run_part, part_payloads))
+
+
+def parts_deadline(payload: dict):
+    """End of the budget of a job made of several local parts: SHARDED_TIMEOUT_FACTOR timeouts."""
+    return time.monotonic() + int(payload.get('timeout_seconds') or 120) * SHARDED_TIMEOUT_FACTOR
+
+
+def run_sharded_job(payload: dict):
+    """
+    Plan, run every shard on a local thread pool (one sandbox child each) and
+    reduce. The whole run must finish within SHARDED_TIMEOUT_FACTOR times the
+    job's timeout; each step gets at most one timeout of what is left.
+    """
+    deadline = parts_deadline(payload)
+    plan = plan_shards(budget_timeout(payload, deadline))
+    if not plan.get('completed'):
+        return plan
 
-    result['processing_time_seconds'] = round(time.perf_counter() - start, 6)
-    return result
\ No newline at end of file
+    shard_results = run_local_parts(shard_payloads(payload, plan['shards']), deadline)
+    result = reduce_shards(budget_timeout(payload, deadline), shard_results, plan)
+    result['shard_backend'] = 'local'
+    return result
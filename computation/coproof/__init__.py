@@ -0,0 +1,9 @@
+"""
+coproof
+~~~~~~~
+Helpers importable by user code in computation sandboxes.
+
+    from coproof import compute
+"""
+
+__version__ = '1.0'
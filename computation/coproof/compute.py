@@ -0,0 +1,250 @@
+"""
+coproof.compute
+~~~~~~~~~~~~~~~
+NumPy-backed batched primitives for computation nodes.
+
+Instead of a Python loop over every integer up to a bound, nodes hand a
+vectorized predicate to `check_range`, which evaluates it on chunks of
+`DEFAULT_CHUNK_SIZE` integers (memory stays bounded) and stops at the first
+counterexamples:
+
+    from coproof import compute
+
+    def run(input_data, target):
+        # Fermat: every prime p = 1 (mod 4) below the limit is a sum of two squares.
+        primes = compute.sieve_primes(input_data['limit'])
+        return compute.check_values(
+            lambda p: (p % 4 != 1) | compute.is_sum_of_two_squares(p),
+            primes,
+        )
+
+The `check_*` functions return `{'evidence', 'sufficient', 'summary',
+'records'}` as `normalize_result` expects, with counterexamples as records,
+so they can be returned from the entrypoint directly.  Arithmetic is int64:
+`mulmod`/`powmod` switch to exact Python integers for moduli whose products
+would overflow.
+"""
+
+import math
+import time
+
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+# (m - 1) ** 2 must fit in int64 for the vectorized modular product.
+_MAX_INT64_MODULUS = 3037000499
+# is_prime sieves values below this bound and runs Miller-Rabin above it.
+PRIME_SIEVE_LIMIT = 1 << 24
+# Witnesses that make Miller-Rabin deterministic for every n < 3.3 * 10**24.
+_MILLER_RABIN_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+
+
+def integers(start: int, stop: int, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Yield [start, stop) as consecutive int64 arrays of at most *chunk_size* values."""
+    if chunk_size <= 0:
+        raise ValueError('chunk_size must be positive.')
+    for chunk_start in range(start, stop, chunk_size):
+        yield np.arange(chunk_start, min(chunk_start + chunk_size, stop), dtype=np.int64)
+
+
+def _holds(predicate, values):
+    mask = np.asarray(predicate(values))
+    if mask.shape != values.shape:
+        raise ValueError(
+            f'Predicate must return one boolean per value (got shape {mask.shape} for {values.shape[0]} values).'
+        )
+    return mask.astype(bool, copy=False)
+
+
+def _check(predicate, chunks, max_counterexamples: int, description: str):
+    if max_counterexamples <= 0:
+        raise ValueError('max_counterexamples must be positive.')
+    started = time.perf_counter()
+    counterexamples = []
+    checked = 0
+    first = last = None
+    for values in chunks:
+        if not values.size:
+            continue
+        if first is None:
+            first = values[0].item()
+        failing = np.flatnonzero(~_holds(predicate, values))
+        needed = max_counterexamples - len(counterexamples)
+        if failing.size >= needed:
+            # Early exit: the chunk counts up to the last counterexample kept.
+            stop_index = int(failing[needed - 1])
+            counterexamples.extend(values[failing[:needed]].tolist())
+            checked += stop_index + 1
+            last = values[stop_index].item()
+            break
+        counterexamples.extend(values[failing].tolist())
+        checked += int(values.size)
+        last = values[-1].item()
+
+    sufficient = not counterexamples
+    evidence = {
+        'checked': checked,
+        'first': first,
+        'last': last,
+        'counterexamples': counterexamples,
+        'seconds': round(time.perf_counter() - started, 6),
+    }
+    if sufficient:
+        summary = f'{description}: property holds for all {checked} values checked.'
+    else:
+        summary = f'{description}: {len(counterexamples)} counterexample(s), first {counterexamples[0]}.'
+    return {
+        'evidence': evidence,
+        'sufficient': sufficient,
+        'summary': summary,
+        'records': [{'n': value} for value in counterexamples],
+    }
+
+
+def check_range(predicate, start: int, stop: int, chunk_size: int = DEFAULT_CHUNK_SIZE, max_counterexamples: int = 1):
+    """
+    Check a vectorized *predicate* (int64 array -> bool array, True where the
+    property holds) for every integer in [start, stop). Stops once
+    *max_counterexamples* counterexamples were found.
+    """
+    return _check(
+        predicate,
+        integers(start, stop, chunk_size),
+        max_counterexamples,
+        f'Checked [{start}, {stop})',
+    )
+
+
+def check_values(predicate, values, chunk_size: int = DEFAULT_CHUNK_SIZE, max_counterexamples: int = 1):
+    """`check_range` over given *values* (e.g. the output of `sieve_primes`)."""
+    values = np.asarray(values)
+    chunks = (values[offset:offset + chunk_size] for offset in range(0, values.size, chunk_size))
+    return _check(predicate, chunks, max_counterexamples, f'Checked {values.size} values')
+
+
+def find_counterexample(predicate, start: int, stop: int, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """The first integer in [start, stop) where *predicate* fails, or None."""
+    for values in integers(start, stop, chunk_size):
+        failures = np.flatnonzero(~_holds(predicate, values))
+        if failures.size:
+            return values[failures[0]].item()
+    return None
+
+
+def count_where(predicate, start: int, stop: int, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """How many integers in [start, stop) satisfy *predicate*."""
+    return sum(int(np.count_nonzero(_holds(predicate, values))) for values in integers(start, stop, chunk_size))
+
+
+def prime_mask(limit: int):
+    """Boolean array of length *limit*: index n is True iff n is prime (sieve of Eratosthenes)."""
+    mask = np.ones(max(limit, 0), dtype=bool)
+    mask[:2] = False
+    mask[4::2] = False
+    for p in range(3, math.isqrt(max(limit - 1, 0)) + 1, 2):
+        if mask[p]:
+            mask[p * p::2 * p] = False
+    return mask
+
+
+def sieve_primes(limit: int):
+    """All primes below *limit*, ascending, as an int64 array."""
+    return np.flatnonzero(prime_mask(limit)).astype(np.int64)
+
+
+def is_prime(values):
+    """
+    Elementwise primality of an int64 array. Values below PRIME_SIEVE_LIMIT
+    are looked up in a sieve, larger ones get deterministic Miller-Rabin.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    result = np.zeros(values.shape, dtype=bool)
+    if not values.size:
+        return result
+    small = (values >= 0) & (values < PRIME_SIEVE_LIMIT)
+    if small.any():
+        mask = prime_mask(int(values[small].max()) + 1)
+        result[small] = mask[values[small]]
+    large = values >= PRIME_SIEVE_LIMIT
+    if large.any():
+        result[large] = _miller_rabin(values[large])
+    return result
+
+
+def _miller_rabin(values):
+    """Primality of odd or even int64 values above the sieve bound."""
+    result = values % 2 == 1
+    candidates = values[result]
+    if not candidates.size:
+        return result
+    # candidates - 1 = d * 2**s with d odd.
+    d = candidates - 1
+    s = np.zeros(candidates.shape, dtype=np.int64)
+    while True:
+        even = d % 2 == 0
+        if not even.any():
+            break
+        d[even] //= 2
+        s[even] += 1
+    minus_one = candidates - 1
+    prime = np.ones(candidates.shape, dtype=bool)
+    for base in _MILLER_RABIN_BASES:
+        x = powmod(base, d, candidates)
+        passes = np.asarray((x == 1) | (x == minus_one), dtype=bool)
+        for r in range(1, int(s.max())):
+            x = mulmod(x, x, candidates)
+            passes |= np.asarray(x == minus_one, dtype=bool) & (r < s)
+        prime &= passes
+    result[result] = prime
+    return result
+
+
+def is_square(values):
+    """Elementwise test for perfect squares (exact below 2**62)."""
+    values = np.asarray(values, dtype=np.int64)
+    roots = np.sqrt(np.clip(values, 0, None).astype(np.float64)).astype(np.int64)
+    # The float root can be off by one for large values.
+    roots -= roots * roots > values
+    roots += (roots + 1) * (roots + 1) <= values
+    return (values >= 0) & (roots * roots == values)
+
+
+def is_sum_of_two_squares(values):
+    """Elementwise: can n be written as a^2 + b^2? (Brute force over a up to sqrt(max n).)"""
+    values = np.asarray(values, dtype=np.int64)
+    result = np.zeros(values.shape, dtype=bool)
+    if not values.size:
+        return result
+    for a in range(math.isqrt(max(int(values.max()), 0)) + 1):
+        remainder = values - a * a
+        result |= (remainder >= 0) & is_square(remainder)
+    return result
+
+
+def _exact(values):
+    return np.asarray(values, dtype=object)
+
+
+def mulmod(a, b, modulus):
+    """Elementwise (a * b) mod *modulus* for non-negative arrays or scalars."""
+    a, b, modulus = np.asarray(a), np.asarray(b), np.asarray(modulus)
+    if modulus.size and int(modulus.max()) <= _MAX_INT64_MODULUS:
+        modulus = modulus.astype(np.int64)
+        return (a.astype(np.int64) % modulus) * (b.astype(np.int64) % modulus) % modulus
+    return (_exact(a) * _exact(b)) % _exact(modulus)
+
+
+def powmod(base, exponent, modulus):
+    """Elementwise base ** exponent mod *modulus* (square-and-multiply over the whole array)."""
+    base, exponent, modulus = np.broadcast_arrays(np.asarray(base), np.asarray(exponent), np.asarray(modulus))
+    if exponent.size and int(exponent.min()) < 0:
+        raise ValueError('powmod exponents must be non-negative.')
+    result = np.ones(base.shape, dtype=np.int64) % modulus
+    base = mulmod(base, 1, modulus)
+    exponent = exponent.astype(np.int64).copy()
+    while exponent.size and exponent.max() > 0:
+        odd = (exponent & 1).astype(bool)
+        result = np.where(odd, mulmod(result, base, modulus), result)
+        base = mulmod(base, base, modulus)
+        exponent >>= 1
+    return result
@@ -0,0 +1,440 @@
+"""
+executors.py
+~~~~~~~~~~~~
+Where computation jobs run.
+
+`payload['executor']` selects the backend (`COMPUTATION_DEFAULT_EXECUTOR`
+when absent):
+
+* `local` runs the job in this worker's sandbox, sharded or not.
+* `local_slurm` is a single-machine stand-in for a Slurm/MPI allocation:
+  `tasks` ranks of the entrypoint run one sandbox process each, with
+  `RANK`/`WORLD_SIZE` (and `SLURM_PROCID`/`SLURM_NTASKS`) set, and their
+  results are combined by the user's `reduce(results)` like shards.  Like
+  local shards, at most `COMPUTATION_SHARD_WORKERS` ranks run at once and the
+  whole job gets `COMPUTATION_SHARDED_TIMEOUT_FACTOR` timeouts, so ranks
+  must not wait for each other.
+* `slurm` submits the same job with `sbatch` and runs the ranks with `srun`.
+  Job directories live under `COMPUTATION_SLURM_WORKDIR`, which must be
+  shared with the compute nodes (the NFS export of docs/ClusterEnabling.md).
+  Ranks have no records stream or checkpoint there: records come back inline.
+
+Synchronous runs (`tasks.run_computation`) block until the result.  Jobs can
+also be submitted (`tasks.submit_computation`) and polled
+(`tasks.computation_job_status`); their state lives in Redis under
+`computation:job:<job id>`:
+
+    queued -> running -> completed | failed
+
+Slurm jobs leave the worker right after `sbatch`; each status poll asks
+`squeue`/`sacct` and collects the rank outputs once the job has ended.
+Jobs without a `run_id` (progress reports and cancellation, see
+progress.py) use their job id; cancelled Slurm jobs are `scancel`ed.
+"""
+
+import json
+import logging
+import math
+import os
+import shlex
+import shutil
+import subprocess
+import time
+
+import redis
+
+import sandbox_runner
+from computation_service import (
+    budget_timeout,
+    cap_logs,
+    parts_deadline,
+    reduce_shards,
+    run_local_parts,
+    run_python_job,
+    run_sharded_job,
+    runner_job,
+)
+from progress import clear_cancel, is_cancelled
+from result_cache import cached_computation, computation_cache_key
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
+DEFAULT_EXECUTOR = os.environ.get('COMPUTATION_DEFAULT_EXECUTOR', 'local').strip().lower()
+MAX_TASKS = int(os.environ.get('COMPUTATION_MAX_TASKS', '64'))
+JOB_TTL_SECONDS = int(os.environ.get('COMPUTATION_JOB_TTL_SECONDS', str(7 * 24 * 3600)))
+
+SLURM_WORKDIR = os.environ.get('COMPUTATION_SLURM_WORKDIR', '/var/lib/coproof/slurm')
+SLURM_PYTHON = os.environ.get('COMPUTATION_SLURM_PYTHON', 'python3')
+SLURM_PARTITION = os.environ.get('COMPUTATION_SLURM_PARTITION', '')
+SLURM_SBATCH_ARGS = shlex.split(os.environ.get('COMPUTATION_SLURM_SBATCH_ARGS', ''))
+# e.g. '--mpi=pmi2' for mpi4py programs.
+SLURM_SRUN_ARGS = shlex.split(os.environ.get('COMPUTATION_SLURM_SRUN_ARGS', ''))
+SLURM_POLL_SECONDS = float(os.environ.get('COMPUTATION_SLURM_POLL_SECONDS', '5'))
+
+JOB_KEY_PREFIX = 'computation:job:'
+# Modules the runner needs next to the user code on the compute nodes.
+RUNNER_MODULES = ('sandbox_runner.py', 'checkpoints.py', 'record_stream.py', 'resource_usage.py')
+RUNNER_PACKAGES = ('coproof',)
+SLURM_ACTIVE_STATES = {
+    'PENDING': 'queued',
+    'CONFIGURING': 'queued',
+    'REQUEUED': 'queued',
+    'RUNNING': 'running',
+    'COMPLETING': 'running',
+    'SUSPENDED': 'running',
+    'STAGE_OUT': 'running',
+}
+TERMINAL_STATES = ('completed', 'failed')
+
+_client = None
+
+
+def _redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL)
+    return _client
+
+
+def _failed_result(error: str):
+    return {
+        'completed': False,
+        'sufficient': False,
+        'evidence': None,
+        'summary': None,
+        'records': [],
+        'stdout': '',
+        'stderr': '',
+        'error': error,
+    }
+
+
+def combine_ranks(payload: dict, rank_results: list):
+    """One result for all ranks, reduced like shards."""
+    if len(rank_results) == 1:
+        result = rank_results[0]
+    else:
+        result = reduce_shards(payload, rank_results, unit='rank')
+        result.pop('shards', None)
+        result['rank_processing_seconds'] = result.pop('shard_processing_seconds', None)
+    result['world_size'] = len(rank_results)
+    return result
+
+
+class LocalExecutor:
+    name = 'local'
+    asynchronous = False
+
+    def run(self, payload: dict):
+        if int(payload.get('shards') or 1) > 1:
+            return run_sharded_job(payload)
+        return run_python_job(payload)
+
+
+class LocalSlurmExecutor:
+    """Every rank is its own sandbox process on this machine, run like local shards."""
+
+    name = 'local_slurm'
+    asynchronous = False
+
+    def run(self, payload: dict):
+        world_size = int(payload.get('tasks') or 1)
+        deadline = parts_deadline(payload)
+        rank_results = run_local_parts(
+            [{**payload, 'rank': rank, 'world_size': world_size} for rank in range(world_size)],
+            deadline,
+            unit='rank',
+        )
+        return combine_ranks(budget_timeout(payload, deadline), rank_results)
+
+
+class SlurmExecutor:
+    """`sbatch` + `srun` on a real cluster; the worker only needs the Slurm client tools."""
+
+    name = 'slurm'
+    asynchronous = True
+
+    @staticmethod
+    def _job_dir(job_id: str):
+        return os.path.join(SLURM_WORKDIR, job_id)
+
+    def submit(self, job_id: str, payload: dict):
+        """Write the job directory and `sbatch` it; returns the Slurm job id."""
+        job_dir = self._job_dir(job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        runner_dir = os.path.dirname(os.path.abspath(sandbox_runner.__file__))
+        for module in RUNNER_MODULES:
+            shutil.copy(os.path.join(runner_dir, module), job_dir)
+        for package in RUNNER_PACKAGES:
+            shutil.copytree(
+                os.path.join(runner_dir, package),
+                os.path.join(job_dir, package),
+                ignore=shutil.ignore_patterns('__pycache__'),
+                dirs_exist_ok=True,
+            )
+
+        world_size = int(payload.get('tasks') or 1)
+        job = {**runner_job(payload), 'call': 'run', 'world_size': world_size}
+        with open(os.path.join(job_dir, 'user_code.py'), 'w', encoding='utf-8') as handle:
+            handle.write(payload['source_code'])
+        with open(os.path.join(job_dir, 'payload.json'), 'w', encoding='utf-8') as handle:
+            json.dump(job, handle, ensure_ascii=True)
+
+        minutes = max(1, math.ceil(int(payload.get('timeout_seconds') or 120) / 60))
+        directives = [
+            f'--job-name=coproof-{job_id[:8]}',
+            f'--ntasks={world_size}',
+            f'--time={minutes}',
+            f'--chdir={job_dir}',
+            '--output=slurm.log',
+        ]
+        if SLURM_PARTITION:
+            directives.append(f'--partition={SLURM_PARTITION}')
+        srun = ['srun', *SLURM_SRUN_ARGS, '--output=rank-%t.out', '--error=rank-%t.err', SLURM_PYTHON, 'sandbox_runner.py']
+        script = '\n'.join(
+            ['#!/bin/bash'] + [f'#SBATCH {directive}' for directive in directives] + [shlex.join(srun), '']
+        )
+        script_path = os.path.join(job_dir, 'job.sh')
+        with open(script_path, 'w', encoding='utf-8') as handle:
+            handle.write(script)
+
+        submitted = subprocess.run(
+            ['sbatch', '--parsable', *SLURM_SBATCH_ARGS, script_path],
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+        if submitted.returncode != 0:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise RuntimeError(f'sbatch failed: {submitted.stderr.strip() or submitted.stdout.strip()}')
+        return submitted.stdout.strip().split(';', 1)[0]
+
+    @staticmethod
+    def _slurm_state(backend_job_id: str):
+        """Slurm's state of the job (e.g. 'RUNNING', 'COMPLETED'), or None when unknown."""
+        for command in (
+            ['squeue', '-h', '-j', backend_job_id, '-o', '%T'],
+            ['sacct', '-n', '-X', '-P', '-j', backend_job_id, '-o', 'State'],
+        ):
+            try:
+                output = subprocess.run(command, capture_output=True, text=True, timeout=30).stdout.strip()
+            except (OSError, subprocess.SubprocessError):
+                continue
+            if output:
+                # sacct reports e.g. 'CANCELLED by 0'.
+                return output.split()[0].rstrip('+')
+        return None
+
+    def poll(self, job_id: str, backend_job_id: str):
+        """Return ('queued' | 'running', None) or ('finished', Slurm state)."""
+        slurm_state = self._slurm_state(backend_job_id)
+        if slurm_state in SLURM_ACTIVE_STATES:
+            return SLURM_ACTIVE_STATES[slurm_state], None
+        if slurm_state is None and not os.path.exists(os.path.join(self._job_dir(job_id), 'slurm.log')):
+            # Not visible to squeue yet and not started.
+            return 'queued', None
+        return 'finished', slurm_state
+
+    def collect(self, job_id: str, payload: dict, slurm_state: str = None):
+        """Read every rank's response, combine them and remove the job directory."""
+        job_dir = self._job_dir(job_id)
+        rank_results = []
+        for rank in range(int(payload.get('tasks') or 1)):
+            lines = []
+            try:
+                with open(os.path.join(job_dir, f'rank-{rank}.out'), 'r', encoding='utf-8', errors='replace') as handle:
+                    lines = [line for line in handle.read().splitlines() if line.strip()]
+            except OSError:
+                pass
+            try:
+                result = json.loads(lines[-1]) if lines else None
+            except json.JSONDecodeError:
+                result = None
+            if not isinstance(result, dict):
+                result = _failed_result(
+                    f'Rank {rank} produced no structured output (Slurm state {slurm_state or "unknown"}).'
+                )
+            try:
+                with open(os.path.join(job_dir, f'rank-{rank}.err'), 'r', encoding='utf-8', errors='replace') as handle:
+                    stderr = handle.read().strip()
+            except OSError:
+                stderr = ''
+            if stderr:
+                result['stderr'] = ((result.get('stderr') or '') + stderr).strip()
+            rank_results.append(result)
+
+        shutil.rmtree(job_dir, ignore_errors=True)
+        result = combine_ranks(payload, rank_results)
+        result['slurm_state'] = slurm_state
+        return result
+
+    def cancel(self, backend_job_id: str):
+        subprocess.run(['scancel', backend_job_id], capture_output=True, timeout=30)
+
+    def run(self, payload: dict):
+        """Submit and wait, for at most `timeout_seconds` including queue time."""
+        job_id = os.urandom(16).hex()
+        timeout_seconds = int(payload.get('timeout_seconds') or 120)
+        try:
+            backend_job_id = self.submit(job_id, payload)
+        except (OSError, RuntimeError, subprocess.SubprocessError) as error:
+            return _failed_result(f'Slurm submission failed: {error}')
+
+        deadline = time.monotonic() + timeout_seconds
+        state = 'queued'
+        while time.monotonic() < deadline:
+            time.sleep(SLURM_POLL_SECONDS)
+            if is_cancelled(payload.get('run_id')):
+                self.cancel(backend_job_id)
+                shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+                return {**_failed_result('Computation cancelled.'), 'cancelled': True}
+            state, slurm_state = self.poll(job_id, backend_job_id)
+            if state == 'finished':
+                return self.collect(job_id, payload, slurm_state)
+
+        self.cancel(backend_job_id)
+        shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+        return _failed_result(
+            f'Slurm job {backend_job_id} did not finish within {timeout_seconds} seconds (last state: {state}). '
+            'Submit it as a computation job to wait for the cluster queue.'
+        )
+
+
+EXECUTORS = {executor.name: executor for executor in (LocalExecutor(), LocalSlurmExecutor(), SlurmExecutor())}
+
+
+def get_executor(payload: dict):
+    name = (payload.get('executor') or DEFAULT_EXECUTOR).strip().lower()
+    executor = EXECUTORS.get(name)
+    if executor is None:
+        raise ValueError(f'Unsupported computation executor: {name}')
+    return executor
+
+
+def _validate(payload: dict):
+    """Return an error message for payloads no executor can run, else None."""
+    language = (payload.get('language') or 'python').strip().lower()
+    if language != 'python':
+        return f'Unsupported computation language: {language}'
+    try:
+        executor = get_executor(payload)
+    except ValueError as error:
+        return str(error)
+    tasks = int(payload.get('tasks') or 1)
+    if tasks < 1 or tasks > MAX_TASKS:
+        return f'tasks must be between 1 and {MAX_TASKS}.'
+    if executor.name == 'local' and tasks > 1:
+        return 'tasks > 1 needs the local_slurm or slurm executor.'
+    if executor.name != 'local' and int(payload.get('shards') or 1) > 1:
+        return f'The {executor.name} executor runs ranks, not shards; use tasks instead.'
+    return None
+
+
+def run_computation_job(payload: dict):
+    start = time.perf_counter()
+    error = _validate(payload)
+    if error:
+        result = _failed_result(error)
+        result['processing_time_seconds'] = round(time.perf_counter() - start, 6)
+        return result
+
+    def compute():
+        result = get_executor(payload).run(payload)
+        result['processing_time_seconds'] = round(time.perf_counter() - start, 6)
+        return cap_logs(result)
+
+    return cached_computation(computation_cache_key(payload), compute, force=bool(payload.get('force')))
+
+
+# ---------------------------------------------------------------------------
+# Asynchronous jobs
+# ---------------------------------------------------------------------------
+
+def _save_job(job: dict):
+    job['updated_at'] = time.time()
+    _redis().set(JOB_KEY_PREFIX + job['job_id'], json.dumps(job), ex=JOB_TTL_SECONDS)
+    return job
+
+
+def _load_job(job_id: str):
+    raw = _redis().get(JOB_KEY_PREFIX + job_id)
+    return json.loads(raw) if raw is not None else None
+
+
+def _public_job(job: dict):
+    return {key: value for key, value in job.items() if key != 'payload'}
+
+
+def _finish_job(job: dict, result: dict):
+    job['state'] = 'completed' if result.get('completed') else 'failed'
+    job['result'] = result
+    job.pop('payload', None)
+    clear_cancel(job.get('run_id'))
+    return _save_job(job)
+
+
+def submit_job(job_id: str, payload: dict):
+    """
+    Start job *job_id*. Local executors run it right here (the caller does not
+    wait for this task); Slurm jobs return once `sbatch` accepted them.
+    """
+    payload = {**payload, 'run_id': payload.get('run_id') or job_id}
+    job = {
+        'job_id': job_id,
+        'run_id': payload['run_id'],
+        'executor': (payload.get('executor') or DEFAULT_EXECUTOR).strip().lower(),
+        'state': 'queued',
+        'submitted_at': time.time(),
+    }
+    error = _validate(payload)
+    if error:
+        return _public_job(_finish_job(job, _failed_result(error)))
+
+    executor = get_executor(payload)
+    if not executor.asynchronous:
+        _save_job({**job, 'state': 'running'})
+        return _public_job(_finish_job(job, run_computation_job(payload)))
+
+    try:
+        job['backend_job_id'] = executor.submit(job_id, payload)
+    except (OSError, RuntimeError, subprocess.SubprocessError) as error:
+        logger.warning('Slurm submission of computation job %s failed: %s', job_id, error)
+        return _public_job(_finish_job(job, _failed_result(f'Slurm submission failed: {error}')))
+    job['payload'] = payload
+    return _public_job(_save_job(job))
+
+
+def job_status(job_id: str):
+    """Current state of job *job_id*; polls the cluster and collects finished jobs."""
+    job = _load_job(job_id)
+    if job is None:
+        return {'job_id': job_id, 'state': 'unknown'}
+    if job['state'] in TERMINAL_STATES or 'backend_job_id' not in job:
+        return _public_job(job)
+
+    executor = EXECUTORS[job['executor']]
+    if is_cancelled(job['run_id']) and not job.get('cancel_requested'):
+        # Slurm reports the job as CANCELLED; it is collected as failed below.
+        executor.cancel(job['backend_job_id'])
+        job['cancel_requested'] = True
+        _save_job(job)
+    state, slurm_state = executor.poll(job_id, job['backend_job_id'])
+    if state != 'finished':
+        if state != job['state']:
+            job['state'] = state
+            _save_job(job)
+        return _public_job(job)
+
+    # Only one poller collects; the others report the state stored so far.
+    if not _redis().set(f'{JOB_KEY_PREFIX}{job_id}:collect', '1', nx=True, ex=300):
+        return _public_job(job)
+    payload = job['payload']
+    result = executor.collect(job_id, payload, slurm_state)
+    result['processing_time_seconds'] = round(time.time() - job['submitted_at'], 6)
+    result = cached_computation(computation_cache_key(payload), lambda: cap_logs(result), force=True)
+    return _public_job(_finish_job(job, result))
@@ -0,0 +1,84 @@
+"""
+log_store.py
+~~~~~~~~~~~~
+Side store for complete job logs.
+
+Task results only carry capped logs.  While a job runs its full output is
+collected in a `LogBuffer` (in memory up to 1 MB, then a temporary file, and
+never more than `COPROOF_MAX_LOG_BYTES`).  When the capped result lost
+anything, `store_log` writes the complete log zlib-compressed to Redis under
+`coproof:log:<ref>` for `COPROOF_LOG_TTL_SECONDS`, and the result carries
+`log_ref` so the API can fetch it on demand.
+
+The same module is shipped with the lean and the computation worker.  The
+copies, lean/log_store.py and computation/log_store.py, must stay identical.
+"""
+
+import logging
+import os
+import tempfile
+import threading
+import uuid
+import zlib
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
+LOG_TTL_SECONDS = int(os.environ.get('COPROOF_LOG_TTL_SECONDS', str(24 * 3600)))
+MAX_LOG_BYTES = int(os.environ.get('COPROOF_MAX_LOG_BYTES', str(16 * 1024 * 1024)))
+LOG_KEY_PREFIX = 'coproof:log:'
+
+_client = None
+
+
+def _redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL)
+    return _client
+
+
+class LogBuffer:
+    """Thread-safe append-only log, bounded by `COPROOF_MAX_LOG_BYTES`."""
+
+    def __init__(self):
+        self._file = tempfile.SpooledTemporaryFile(max_size=1024 * 1024, mode='w+b')
+        self._lock = threading.Lock()
+        self.size = 0
+        self.dropped = 0
+
+    def write(self, text: str):
+        data = text.encode('utf-8', errors='replace')
+        with self._lock:
+            room = MAX_LOG_BYTES - self.size
+            kept = data[:max(room, 0)]
+            if kept:
+                self._file.write(kept)
+                self.size += len(kept)
+            self.dropped += len(data) - len(kept)
+
+    def getvalue(self):
+        with self._lock:
+            self._file.seek(0)
+            text = self._file.read().decode('utf-8', errors='replace')
+            self._file.seek(0, os.SEEK_END)
+        if self.dropped:
+            text += f'\n... [{self.dropped} bytes beyond the {MAX_LOG_BYTES} byte log limit]'
+        return text
+
+
+def store_log(text: str):
+    """Store *text* compressed in Redis; returns its ref, or None when Redis is unavailable."""
+    ref = uuid.uuid4().hex
+    try:
+        _redis().set(LOG_KEY_PREFIX + ref, zlib.compress(text.encode('utf-8', errors='replace')), ex=LOG_TTL_SECONDS)
+    except redis.RedisError as error:
+        logger.warning('Could not store full log: %s', error)
+        return None
+    return ref
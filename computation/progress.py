@@ -0,0 +1,118 @@
+"""
+progress.py
+~~~~~~~~~~~
+Live progress and cancellation of running computation jobs.
+
+User code reports progress and interim counters (or partial evidence):
+
+    report_progress(done=n, total=limit, message='sieving', found=len(hits))
+
+The sandbox child (`sandbox_runner.ProgressReporter`) writes the latest
+report atomically to a file in its workspace.  While the worker waits for
+the child it polls that file every `COMPUTATION_PROGRESS_INTERVAL_SECONDS`
+and, for jobs with a `run_id`, publishes each new report as JSON
+
+* under `computation:progress:<run id>` (latest report, for pollers), and
+* on the Redis channel of the same name (for subscribers).
+
+Setting `computation:cancel:<run id>` (the API's cancel endpoint) makes the
+worker kill the child at its next poll; the job fails with
+'Computation cancelled.' instead of running out its time budget.  The flag
+is deleted when a run with that id starts or ends (the API does so for
+synchronous runs, `clear_cancel` for submitted jobs), so a reused run id
+is not cancelled again.
+"""
+
+import json
+import logging
+import os
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
+PROGRESS_INTERVAL_SECONDS = float(os.environ.get('COMPUTATION_PROGRESS_INTERVAL_SECONDS', '1'))
+PROGRESS_TTL_SECONDS = 3600
+
+PROGRESS_FILE = '.progress.json'
+PROGRESS_KEY_PREFIX = 'computation:progress:'
+CANCEL_KEY_PREFIX = 'computation:cancel:'
+
+_client = None
+
+
+def _redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL)
+    return _client
+
+
+class ComputationCancelled(Exception):
+    """The run was cancelled through `computation:cancel:<run id>`."""
+
+
+def is_cancelled(run_id: str = None):
+    if not run_id:
+        return False
+    try:
+        return bool(_redis().exists(CANCEL_KEY_PREFIX + run_id))
+    except redis.RedisError as error:
+        logger.warning('Could not check cancellation of %s: %s', run_id, error)
+        return False
+
+
+def clear_cancel(run_id: str = None):
+    if not run_id:
+        return
+    try:
+        _redis().delete(CANCEL_KEY_PREFIX + run_id)
+    except redis.RedisError as error:
+        logger.warning('Could not clear the cancel flag of %s: %s', run_id, error)
+
+
+class ProgressMonitor:
+    """Worker side: publish new reports of one child, watch for cancellation."""
+
+    def __init__(self, run_id: str = None, path: str = None, part: dict = None):
+        self.run_id = run_id
+        self.path = path
+        self.part = part or {}
+        self._last_mtime = None
+
+    def poll(self):
+        """Publish the latest report when it changed; raise ComputationCancelled when asked to stop."""
+        if is_cancelled(self.run_id):
+            raise ComputationCancelled()
+        self.publish()
+
+    def publish(self):
+        if not self.run_id:
+            return
+        try:
+            report = self._read_report()
+            if report is not None:
+                message = json.dumps({'run_id': self.run_id, **self.part, **report}, ensure_ascii=True)
+                pipeline = _redis().pipeline()
+                pipeline.set(PROGRESS_KEY_PREFIX + self.run_id, message, ex=PROGRESS_TTL_SECONDS)
+                pipeline.publish(PROGRESS_KEY_PREFIX + self.run_id, message)
+                pipeline.execute()
+        except redis.RedisError as error:
+            logger.warning('Could not publish computation progress for %s: %s', self.run_id, error)
+
+    def _read_report(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self._last_mtime:
+                return None
+            with open(self.path, 'r', encoding='utf-8') as handle:
+                report = json.load(handle)
+        except (OSError, TypeError, ValueError):
+            return None
+        self._last_mtime = mtime
+        return report
@@ -0,0 +1,142 @@
+"""
+record_stream.py
+~~~~~~~~~~~~~~~~
+Streamed record output of computation jobs.
+
+Instead of returning one list, user code can hand records over as they are
+produced, either with `emit_record(record)` or by returning a generator (any
+non-list iterable) under `records`.  Lists longer than
+`COMPUTATION_INLINE_RECORDS_MAX` are streamed as well.  Records are written
+as JSON lines into gzip chunks of `COMPUTATION_RECORDS_PER_CHUNK` records
+under `COMPUTATION_RECORDS_ROOT/<stream id>/`.  That directory is a volume
+shared with the API, so memory stays bounded however many records a job
+produces, and only a handle travels back through Celery:
+
+    {'format': 'jsonl.gz', 'chunks': ['<id>/records-00000.jsonl.gz', ...], 'count': n, 'bytes': n}
+
+Chunk paths are relative to the records root; handles of several shards are
+merged by concatenating their chunks.  Streams older than
+`COMPUTATION_RECORDS_TTL_SECONDS` are pruned.
+"""
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+RECORDS_ROOT = os.environ.get('COMPUTATION_RECORDS_ROOT', '/var/lib/coproof/records')
+RECORDS_PER_CHUNK = int(os.environ.get('COMPUTATION_RECORDS_PER_CHUNK', '50000'))
+INLINE_RECORDS_MAX = int(os.environ.get('COMPUTATION_INLINE_RECORDS_MAX', '1000'))
+RECORDS_TTL_SECONDS = int(os.environ.get('COMPUTATION_RECORDS_TTL_SECONDS', str(7 * 24 * 3600)))
+PRUNE_INTERVAL_SECONDS = 3600
+
+_last_prune = 0.0
+
+
+class RecordStreamWriter:
+    """Append-only writer of one stream directory; chunks are created lazily."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.stream_id = os.path.basename(directory)
+        self.chunks = []
+        self.count = 0
+        self.bytes = 0
+        self._file = None
+        self._in_chunk = 0
+
+    def _next_chunk(self):
+        self._close_chunk()
+        os.makedirs(self.directory, exist_ok=True)
+        name = f'records-{len(self.chunks):05d}.jsonl.gz'
+        self._file = gzip.open(os.path.join(self.directory, name), 'wb', compresslevel=6)
+        self.chunks.append(f'{self.stream_id}/{name}')
+        self._in_chunk = 0
+
+    def _close_chunk(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def write(self, record):
+        data = (json.dumps(record, ensure_ascii=True) + '\n').encode('utf-8')
+        if self._file is None or self._in_chunk >= RECORDS_PER_CHUNK:
+            self._next_chunk()
+        self._file.write(data)
+        self._in_chunk += 1
+        self.count += 1
+        self.bytes += len(data)
+
+    def write_all(self, records):
+        for record in records:
+            self.write(record)
+
+    def close(self):
+        """Finish the stream; returns its handle, or None when nothing was written."""
+        self._close_chunk()
+        if not self.count:
+            return None
+        return {'format': 'jsonl.gz', 'chunks': list(self.chunks), 'count': self.count, 'bytes': self.bytes}
+
+    def discard(self):
+        self._close_chunk()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def records_root():
+    root = RECORDS_ROOT
+    try:
+        os.makedirs(root, exist_ok=True)
+    except OSError:
+        root = os.path.join(tempfile.gettempdir(), 'coproof-records')
+        os.makedirs(root, exist_ok=True)
+    return root
+
+
+def new_stream_dir():
+    """Path for a new stream (created on its first record)."""
+    prune_streams()
+    return os.path.join(records_root(), uuid.uuid4().hex)
+
+
+def merge_handles(handles):
+    handles = [handle for handle in handles if handle]
+    if not handles:
+        return None
+    return {
+        'format': 'jsonl.gz',
+        'chunks': [chunk for handle in handles for chunk in handle['chunks']],
+        'count': sum(handle['count'] for handle in handles),
+        'bytes': sum(handle['bytes'] for handle in handles),
+    }
+
+
+def remove_stream(handle):
+    if not handle:
+        return
+    root = records_root()
+    for stream_id in {chunk.split('/', 1)[0] for chunk in handle['chunks']}:
+        shutil.rmtree(os.path.join(root, stream_id), ignore_errors=True)
+
+
+def prune_streams():
+    """Remove streams older than the TTL; runs at most once per PRUNE_INTERVAL_SECONDS."""
+    global _last_prune
+    now = time.time()
+    if now - _last_prune < PRUNE_INTERVAL_SECONDS:
+        return
+    _last_prune = now
+    root = records_root()
+    for entry in os.scandir(root):
+        try:
+            if entry.is_dir() and now - entry.stat().st_mtime > RECORDS_TTL_SECONDS:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except OSError:
+            pass
@@ -0,0 +1,120 @@
+"""
+resource_usage.py
+~~~~~~~~~~~~~~~~~
+Resource accounting of computation jobs.
+
+Every result carries
+
+    'resources': {
+        'cpu_user_seconds': ..., 'cpu_system_seconds': ...,
+        'peak_rss_bytes': ..., 'io_read_bytes': ..., 'io_write_bytes': ...,
+        'processes': ...,
+    }
+
+The sandbox child measures itself when the job returns (`getrusage` of the
+process and of the processes it waited for, and `/proc/self/io`, which
+includes reaped children).  The worker samples the child's process tree at
+every progress poll and reports the peak number of processes.  Jobs killed
+on timeout or cancellation have no child report; their CPU time and I/O
+are unknown (None).  Shards and ranks add up, except `peak_rss_bytes`, which
+is the largest of any one part.
+"""
+
+import os
+
+try:
+    import resource
+except ImportError:  # not POSIX
+    resource = None
+
+ADDITIVE_FIELDS = ('cpu_user_seconds', 'cpu_system_seconds', 'io_read_bytes', 'io_write_bytes', 'processes')
+RESOURCE_FIELDS = ('cpu_user_seconds', 'cpu_system_seconds', 'peak_rss_bytes', 'io_read_bytes', 'io_write_bytes',
+                   'processes')
+
+
+def _proc_io():
+    """(read bytes, write bytes) of this process and its reaped children, from storage and pipes."""
+    try:
+        with open('/proc/self/io', 'r', encoding='ascii') as handle:
+            counters = dict(line.split(': ', 1) for line in handle.read().splitlines() if ': ' in line)
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def self_usage():
+    """Resources used so far by this process and the children it waited for."""
+    usage = {field: None for field in RESOURCE_FIELDS}
+    usage['processes'] = 1
+    if resource is not None:
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        usage['cpu_user_seconds'] = round(own.ru_utime + children.ru_utime, 6)
+        usage['cpu_system_seconds'] = round(own.ru_stime + children.ru_stime, 6)
+        # ru_maxrss is in KiB on Linux.
+        usage['peak_rss_bytes'] = max(own.ru_maxrss, children.ru_maxrss) * 1024
+    usage['io_read_bytes'], usage['io_write_bytes'] = _proc_io()
+    return usage
+
+
+def _parent_pids():
+    parents = {}
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return parents
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r', encoding='ascii', errors='replace') as handle:
+                stat = handle.read()
+        except OSError:
+            continue
+        # The command name (field 2) may contain spaces; the parent pid follows the state.
+        fields = stat[stat.rfind(')') + 2:].split()
+        if len(fields) > 1:
+            parents[int(entry)] = int(fields[1])
+    return parents
+
+
+class ProcessTreeSampler:
+    """Peak size of the process tree rooted at one pid, sampled on demand."""
+
+    def __init__(self, pid: int = None):
+        self.pid = pid
+        self.peak = 1
+
+    def sample(self):
+        if self.pid is None:
+            return
+        parents = _parent_pids()
+        tree = {self.pid}
+        grew = True
+        while grew:
+            descendants = {pid for pid, parent in parents.items() if parent in tree}
+            grew = not descendants <= tree
+            tree |= descendants
+        self.peak = max(self.peak, len(tree))
+
+
+def finish_usage(result: dict, sampler: ProcessTreeSampler):
+    """Merge the worker's process count into the child's report (or a placeholder for killed jobs)."""
+    usage = result.get('resources') or {field: None for field in RESOURCE_FIELDS}
+    usage['processes'] = max(usage.get('processes') or 1, sampler.peak)
+    result['resources'] = usage
+    return result
+
+
+def combine_usage(usages):
+    """Add up the resources of shards or ranks; unknown values make the total unknown."""
+    usages = [usage for usage in usages if usage]
+    if not usages:
+        return None
+    combined = {}
+    for field in ADDITIVE_FIELDS:
+        values = [usage.get(field) for usage in usages]
+        combined[field] = None if None in values else round(sum(values), 6)
+    peaks = [usage.get('peak_rss_bytes') for usage in usages]
+    combined['peak_rss_bytes'] = None if None in peaks else max(peaks)
+    return {field: combined[field] for field in RESOURCE_FIELDS}
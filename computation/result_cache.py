@@ -0,0 +1,195 @@
+"""
+result_cache.py
+~~~~~~~~~~~~~~~
+Memoized results of computation jobs.
+
+Keys are the SHA-256 of everything that determines a result: language,
+the source exactly as submitted, entrypoint, canonical JSON of `input_data`
+and `target`, the shard and task (world size) counts, and the runtime (Python version,
+`COMPUTATION_RUNTIME_VERSION`, the `coproof` helpers version and the versions
+of the preloaded scientific packages), so an image upgrade invalidates every
+entry.  Only completed results are stored: timeouts and
+failures are re-run.  Requests with `force` skip the lookup and overwrite the
+entry.
+
+Entries live zlib-compressed in Redis; a sorted set ordered by last access
+bounds the cache to `COMPUTATION_RESULT_CACHE_MAX_ENTRIES`.  A hit whose
+streamed records have already been pruned counts as a miss.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+import zlib
+from importlib import metadata
+
+import redis
+
+import coproof
+from record_stream import records_root
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
+CACHE_ENABLED = os.environ.get('COMPUTATION_RESULT_CACHE_ENABLED', '1') == '1'
+CACHE_MAX_ENTRIES = int(os.environ.get('COMPUTATION_RESULT_CACHE_MAX_ENTRIES', '5000'))
+CACHE_TTL_SECONDS = int(os.environ.get('COMPUTATION_RESULT_CACHE_TTL_SECONDS', str(30 * 24 * 3600)))
+RUNTIME_VERSION = os.environ.get('COMPUTATION_RUNTIME_VERSION', '')
+RUNTIME_PACKAGES = ('numpy', 'scipy', 'sympy', 'networkx')
+
+KEY_PREFIX = 'computation:result:'
+INDEX_KEY = 'computation:result:index'
+STATS_KEY = 'computation:result:stats'
+
+_client = None
+_runtime_fingerprint = None
+
+
+def _redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL)
+    return _client
+
+
+def runtime_fingerprint():
+    """Identify the interpreter and packages user code runs against."""
+    global _runtime_fingerprint
+    if _runtime_fingerprint is None:
+        packages = []
+        for name in RUNTIME_PACKAGES:
+            try:
+                packages.append(f'{name}={metadata.version(name)}')
+            except metadata.PackageNotFoundError:
+                continue
+        _runtime_fingerprint = '|'.join(
+            [sys.version.split()[0], RUNTIME_VERSION, f'coproof={coproof.__version__}', *packages]
+        )
+    return _runtime_fingerprint
+
+
+def _canonical_json(value):
+    return json.dumps(value, sort_keys=True, ensure_ascii=True, separators=(',', ':'))
+
+
+def computation_cache_key(payload: dict):
+    digest = hashlib.sha256()
+    digest.update(b'computation\0' + runtime_fingerprint().encode('utf-8') + b'\0')
+    for part in (
+        (payload.get('language') or 'python').strip().lower(),
+        # Not normalized: whitespace inside string literals changes what a program does.
+        payload.get('source_code') or '',
+        payload.get('entrypoint') or 'run',
+        _canonical_json(payload.get('input_data')),
+        _canonical_json(payload.get('target')),
+        str(int(payload.get('shards') or 1)),
+        str(int(payload.get('tasks') or 1)),
+    ):
+        digest.update(hashlib.sha256(part.encode('utf-8')).digest())
+    return digest.hexdigest()
+
+
+def _records_available(result: dict):
+    """True unless the result's streamed records were pruned; refreshes their age."""
+    records_stream = result.get('records_stream')
+    if not records_stream:
+        return True
+    root = records_root()
+    stream_dirs = {chunk.split('/', 1)[0] for chunk in records_stream['chunks']}
+    if not all(os.path.isfile(os.path.join(root, chunk)) for chunk in records_stream['chunks']):
+        return False
+    for stream_dir in stream_dirs:
+        try:
+            os.utime(os.path.join(root, stream_dir))
+        except OSError:
+            return False
+    return True
+
+
+def _get(cache_key: str):
+    client = _redis()
+    raw = client.get(KEY_PREFIX + cache_key)
+    result = json.loads(zlib.decompress(raw)) if raw is not None else None
+    if result is None or not _records_available(result):
+        client.hincrby(STATS_KEY, 'misses', 1)
+        return None
+
+    pipeline = client.pipeline()
+    pipeline.zadd(INDEX_KEY, {cache_key: time.time()}, xx=True)
+    pipeline.hincrby(STATS_KEY, 'hits', 1)
+    pipeline.execute()
+    return result
+
+
+def _put(cache_key: str, result: dict):
+    client = _redis()
+    pipeline = client.pipeline()
+    pipeline.set(KEY_PREFIX + cache_key, zlib.compress(json.dumps(result).encode('utf-8')), ex=CACHE_TTL_SECONDS)
+    pipeline.zadd(INDEX_KEY, {cache_key: time.time()})
+    pipeline.zcard(INDEX_KEY)
+    size = pipeline.execute()[-1]
+
+    overflow = size - CACHE_MAX_ENTRIES
+    if overflow > 0:
+        evicted = [member for member, _score in client.zpopmin(INDEX_KEY, overflow)]
+        if evicted:
+            client.delete(*[KEY_PREFIX + member.decode('utf-8') for member in evicted])
+            client.hincrby(STATS_KEY, 'evictions', len(evicted))
+
+
+def cached_computation(cache_key: str, compute, force: bool = False):
+    """
+    Return the memoized result for *cache_key*, or run *compute* and store its
+    result when it completed. *force* always runs *compute*.
+    """
+    if not CACHE_ENABLED:
+        return compute()
+
+    started = time.time()
+    cached = None
+    if not force:
+        try:
+            cached = _get(cache_key)
+        except redis.RedisError as error:
+            logger.warning('Computation cache lookup failed: %s', error)
+
+    if cached is not None:
+        cached['cached_processing_time_seconds'] = cached.get('processing_time_seconds', 0.0)
+        cached['processing_time_seconds'] = round(time.time() - started, 6)
+        cached['cache_hit'] = True
+        return cached
+
+    result = compute()
+    if result.get('completed'):
+        try:
+            _put(cache_key, result)
+        except redis.RedisError as error:
+            logger.warning('Computation cache store failed: %s', error)
+
+    result['cache_hit'] = False
+    return result
+
+
+def cache_stats():
+    client = _redis()
+    stats = {key.decode('utf-8'): int(value) for key, value in client.hgetall(STATS_KEY).items()}
+    hits = stats.get('hits', 0)
+    misses = stats.get('misses', 0)
+    lookups = hits + misses
+    return {
+        'enabled': CACHE_ENABLED,
+        'hits': hits,
+        'misses': misses,
+        'evictions': stats.get('evictions', 0),
+        'entries': client.zcard(INDEX_KEY),
+        'max_entries': CACHE_MAX_ENTRIES,
+        'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+        'runtime': runtime_fingerprint(),
+    }
@@ -0,0 +1,261 @@
+"""
+sandbox_runner.py
+~~~~~~~~~~~~~~~~~
+Executes one user computation job and produces its JSON response.
+
+A job calls one function of the user code: the entrypoint (`run`), or for
+sharded jobs `shard(input_data, target, k)` and `reduce(results)`.  The
+entrypoint can stream its records with `emit_record` (see record_stream.py)
+and persist progress with `checkpoint` (see checkpoints.py).  Ranks of
+cluster jobs (see executors.py) see `RANK` and `WORLD_SIZE`, also exported
+as `SLURM_PROCID`/`SLURM_NTASKS`; under `srun` they come from Slurm itself.
+Progress goes to the worker with `report_progress` (see progress.py).
+NumPy-backed batched helpers are importable as `from coproof import compute`.
+Responses carry the job's resource usage (see resource_usage.py).
+
+Two entry points share `execute()`:
+
+* `serve_job(conn, work_dir)` runs in a fresh child forked from the warm
+  forkserver template (this module and the common scientific packages are
+  already imported there).  The payload arrives over the pipe and the JSON
+  response goes back over it.
+* `python sandbox_runner.py` is the fallback: a new interpreter reads
+  `payload.json` and `user_code.py` from its working directory and prints
+  the JSON response.
+
+The response always travels as JSON text, never pickled, since the child
+runs untrusted code.
+"""
+
+import contextlib
+import io
+import json
+import os
+import time
+import traceback
+from pathlib import Path
+
+from checkpoints import Checkpoint
+from record_stream import INLINE_RECORDS_MAX, RecordStreamWriter
+from resource_usage import self_usage
+
+# Progress reports written more often than this are dropped, except the final one.
+MIN_PROGRESS_INTERVAL_SECONDS = 0.1
+
+
+def normalize_result(value):
+    if isinstance(value, dict):
+        sufficient = value.get('sufficient')
+        if not isinstance(sufficient, bool):
+            raise ValueError("Computation result dict must contain a boolean 'sufficient' field.")
+        records = value.get('records')
+        if records is not None and (isinstance(records, (str, bytes, dict)) or not hasattr(records, '__iter__')):
+            raise ValueError("Computation result dict optional 'records' field must be a list or an iterable of records.")
+        return {
+            'evidence': value.get('evidence'),
+            'sufficient': sufficient,
+            'summary': value.get('summary'),
+            'records': records,
+        }
+
+    if isinstance(value, (list, tuple)) and len(value) == 2 and isinstance(value[1], bool):
+        return {
+            'evidence': value[0],
+            'sufficient': value[1],
+            'summary': None,
+        }
+
+    raise ValueError(
+        "Computation entrypoint must return {'evidence': ..., 'sufficient': bool} or (evidence, sufficient)."
+    )
+
+
+def combine_results(results):
+    """Default `reduce`: sufficient only if every shard is, evidence and records concatenated."""
+    summaries = [result.get('summary') for result in results if result.get('summary')]
+    return {
+        'evidence': [result.get('evidence') for result in results],
+        'sufficient': all(result.get('sufficient') for result in results),
+        'summary': '\n'.join(str(summary) for summary in summaries) or None,
+        'records': [record for result in results for record in result.get('records') or []],
+    }
+
+
+def _function(global_scope, name):
+    function = global_scope.get(name)
+    if not callable(function):
+        raise ValueError(f"Entrypoint '{name}' is not defined or not callable.")
+    return function
+
+
+def _call(global_scope, job):
+    """
+    Call the user function selected by job['call']:
+    'run' (the entrypoint), 'shard' (split the input) or 'reduce' (combine shard results).
+    """
+    call = job.get('call') or 'run'
+    if call == 'shard':
+        shards = _function(global_scope, 'shard')(job.get('input_data'), job.get('target'), job['shard_count'])
+        if not isinstance(shards, (list, tuple)) or not shards:
+            raise ValueError('shard(input_data, target, k) must return a non-empty list of shard inputs.')
+        return {'evidence': None, 'sufficient': False, 'summary': None, 'records': None, 'shards': list(shards)}
+    if call == 'reduce':
+        reduce = global_scope.get('reduce')
+        value = reduce(job['results']) if callable(reduce) else combine_results(job['results'])
+        return normalize_result(value)
+    return normalize_result(_function(global_scope, job['entrypoint'])(job.get('input_data'), job.get('target')))
+
+
+class ProgressReporter:
+    """The `report_progress` function of user code; without a file it does nothing."""
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self._last_write = 0.0
+
+    def __call__(self, done=None, total=None, message: str = None, **counters):
+        if not self.path:
+            return
+        now = time.monotonic()
+        final = done is not None and total is not None and done >= total
+        if now - self._last_write < MIN_PROGRESS_INTERVAL_SECONDS and not final:
+            return
+        self._last_write = now
+        report = {
+            'done': done,
+            'total': total,
+            'fraction': round(done / total, 6) if done is not None and total else None,
+            'message': message,
+            'counters': counters,
+            'reported_at': time.time(),
+        }
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as handle:
+            json.dump(report, handle, ensure_ascii=True)
+        os.replace(temp_path, self.path)
+
+
+def _no_record_stream(_record):
+    raise RuntimeError('emit_record() is only available while the entrypoint runs.')
+
+
+def _collect_records(records, writer):
+    """
+    Stream *records* (plus anything already emitted) when there is a writer and
+    they are not a short list; returns (inline records, stream handle).
+    """
+    records = records if records is not None else []
+    if writer is None:
+        return list(records), None
+    if writer.count or not isinstance(records, list) or len(records) > INLINE_RECORDS_MAX:
+        writer.write_all(records)
+        records = []
+    return records, writer.close()
+
+
+def _cluster_rank(job):
+    """(rank, world size) of this process: from the job, else from the Slurm environment."""
+    if job.get('rank') is not None:
+        os.environ.update({'SLURM_PROCID': str(job['rank']), 'SLURM_NTASKS': str(job['world_size'])})
+        return int(job['rank']), int(job['world_size'])
+    return int(os.environ.get('SLURM_PROCID') or 0), int(job.get('world_size') or os.environ.get('SLURM_NTASKS') or 1)
+
+
+def execute(source_code: str, job: dict):
+    writer = RecordStreamWriter(job['records_dir']) if job.get('records_dir') else None
+    rank, world_size = _cluster_rank(job)
+    global_scope = {
+        '__name__': '__main__',
+        'emit_record': writer.write if writer is not None else _no_record_stream,
+        'checkpoint': Checkpoint(job.get('checkpoint_dir')),
+        'report_progress': ProgressReporter(job.get('progress_file')),
+        'RANK': rank,
+        'WORLD_SIZE': world_size,
+    }
+    stdout_buffer = io.StringIO()
+    stderr_buffer = io.StringIO()
+
+    try:
+        with contextlib.redirect_stdout(stdout_buffer), contextlib.redirect_stderr(stderr_buffer):
+            exec(compile(source_code, 'user_code.py', 'exec'), global_scope)
+            normalized = _call(global_scope, job)
+            # Generators run user code too, so they are drained under the same redirect.
+            records, records_stream = _collect_records(normalized.get('records'), writer)
+
+        response = {
+            'completed': True,
+            'sufficient': normalized['sufficient'],
+            'evidence': normalized['evidence'],
+            'summary': normalized.get('summary'),
+            'records': records,
+            'stdout': stdout_buffer.getvalue(),
+            'stderr': stderr_buffer.getvalue(),
+            'error': None,
+        }
+        if records_stream is not None:
+            response['records_stream'] = records_stream
+        if 'shards' in normalized:
+            response['shards'] = normalized['shards']
+        return response
+    except Exception as error:
+        if writer is not None:
+            writer.discard()
+        return {
+            'completed': False,
+            'sufficient': False,
+            'evidence': None,
+            'summary': None,
+            'records': [],
+            'stdout': stdout_buffer.getvalue(),
+            'stderr': stderr_buffer.getvalue(),
+            'error': str(error),
+            'traceback': traceback.format_exc(),
+        }
+
+
+def _encode_response(response: dict):
+    try:
+        return json.dumps(response, ensure_ascii=True)
+    except (TypeError, ValueError) as error:
+        return json.dumps({
+            'completed': False,
+            'sufficient': False,
+            'evidence': None,
+            'summary': None,
+            'records': [],
+            'stdout': response.get('stdout', ''),
+            'stderr': response.get('stderr', ''),
+            'error': f'Computation result is not JSON serializable: {error}',
+            'resources': response.get('resources'),
+        }, ensure_ascii=True)
+
+
+def serve_job(conn, work_dir: str, stdio_path: str = None):
+    """
+    Forkserver child: receive one job over *conn*, run it in *work_dir*, reply,
+    exit. With *stdio_path*, fd 1 and fd 2 are appended to that file so output
+    written below Python's sys.stdout/sys.stderr reaches the job's stderr.
+    """
+    if stdio_path:
+        fd = os.open(stdio_path, os.O_WRONLY | os.O_APPEND)
+        os.dup2(fd, 1)
+        os.dup2(fd, 2)
+        os.close(fd)
+    os.chdir(work_dir)
+    job = conn.recv()
+    response = execute(job.pop('source_code'), job)
+    response['resources'] = self_usage()
+    conn.send_bytes(_encode_response(response).encode('utf-8'))
+    conn.close()
+
+
+def main():
+    payload = json.loads(Path('payload.json').read_text(encoding='utf-8'))
+    source_code = Path('user_code.py').read_text(encoding='utf-8')
+    response = execute(source_code, payload)
+    response['resources'] = self_usage()
+    print(_encode_response(response))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,34 @@
 from celery_service import celery
-from computation_service import run_computation_job
+from computation_service import cap_logs, plan_shards, reduce_shards
+from executors import job_status, run_computation_job, submit_job
+from result_cache import cache_stats
 
 
 @celery.task(name='tasks.run_computation')
 def run_computation(payload: dict):
-    return run_computation_job(payload)
\ No newline at end of file
+    return run_computation_job(payload)
+
+
+@celery.task(name='tasks.submit_computation')
+def submit_computation(job_id: str, payload: dict):
+    return submit_job(job_id, payload)
+
+
+@celery.task(name='tasks.computation_job_status')
+def computation_job_status(job_id: str):
+    return job_status(job_id)
+
+
+@celery.task(name='tasks.plan_computation_shards')
+def plan_computation_shards(payload: dict):
+    return plan_shards(payload)
+
+
+@celery.task(name='tasks.reduce_computation_shards')
+def reduce_computation_shards(payload: dict, shard_results: list):
+    return cap_logs(reduce_shards(payload, shard_results))
+
+
+@celery.task(name='tasks.computation_cache_stats')
+def computation_cache_stats():
+    return cache_stats()
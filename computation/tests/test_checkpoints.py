@@ -0,0 +1,112 @@
+"""
+Unit tests for checkpoint and resume of computation jobs.
+
+Run from the computation/ directory: python -m pytest tests/ -v
+"""
+
+import os
+import time
+
+import pytest
+
+import checkpoints
+from checkpoints import Checkpoint, CheckpointBusy, JobCheckpoint
+
+
+@pytest.fixture
+def checkpoint_root(tmp_path, monkeypatch):
+    monkeypatch.setattr(checkpoints, 'CHECKPOINT_ROOT', str(tmp_path))
+    # Pruning is tested on its own; skip it when jobs start.
+    monkeypatch.setattr(checkpoints, '_last_prune', time.time())
+    return tmp_path
+
+
+def _save_state(job, state):
+    Checkpoint(job.directory).save(state)
+
+
+class TestJobCheckpointLock:
+    def test_second_run_of_a_running_job_is_rejected(self, checkpoint_root):
+        first = JobCheckpoint('job')
+        with pytest.raises(CheckpointBusy):
+            JobCheckpoint('job')
+        first.finish_attempt(1.0, completed=True)
+        JobCheckpoint('job').finish_attempt(1.0, completed=True)
+
+    def test_other_jobs_are_not_blocked(self, checkpoint_root):
+        first = JobCheckpoint('job-a')
+        second = JobCheckpoint('job-b')
+        first.finish_attempt(1.0, completed=True)
+        second.finish_attempt(1.0, completed=True)
+
+    def test_busy_job_keeps_its_state_even_without_resume(self, checkpoint_root):
+        first = JobCheckpoint('job')
+        _save_state(first, {'next': 5})
+        with pytest.raises(CheckpointBusy):
+            JobCheckpoint('job', resume=False)
+        assert Checkpoint(first.directory).load() == {'next': 5}
+        first.finish_attempt(1.0, completed=False)
+
+
+class TestFinishAttempt:
+    def test_incomplete_attempt_with_state_is_kept_and_resumed(self, checkpoint_root):
+        first = JobCheckpoint('job')
+        _save_state(first, {'next': 5})
+        report = first.finish_attempt(2.5, completed=False)
+
+        assert report == {
+            'accumulated_runtime_seconds': 2.5,
+            'attempts': 1,
+            'resumed_from_checkpoint': False,
+            'checkpoint_available': True,
+        }
+        second = JobCheckpoint('job')
+        assert second.resumed
+        assert Checkpoint(second.directory).load() == {'next': 5}
+        report = second.finish_attempt(1.5, completed=True)
+        assert (report['accumulated_runtime_seconds'], report['attempts']) == (4.0, 2)
+        assert report['resumed_from_checkpoint'] is True
+
+    def test_completed_attempt_drops_checkpoint_and_lock_file(self, checkpoint_root):
+        job = JobCheckpoint('job')
+        _save_state(job, {'next': 5})
+        report = job.finish_attempt(1.0, completed=True)
+
+        assert report['checkpoint_available'] is False
+        assert not os.path.exists(job.directory)
+        assert not os.path.exists(job.directory + '.lock')
+
+    def test_incomplete_attempt_without_state_is_dropped(self, checkpoint_root):
+        job = JobCheckpoint('job')
+        assert job.finish_attempt(1.0, completed=False)['checkpoint_available'] is False
+        assert not os.path.exists(job.directory)
+
+    def test_resume_false_starts_over(self, checkpoint_root):
+        first = JobCheckpoint('job')
+        _save_state(first, {'next': 5})
+        first.finish_attempt(1.0, completed=False)
+
+        second = JobCheckpoint('job', resume=False)
+        assert not second.resumed
+        assert second.previous_attempts == 0
+        second.finish_attempt(1.0, completed=True)
+
+
+class TestPruneCheckpoints:
+    def test_stale_checkpoints_are_removed_unless_held(self, checkpoint_root, monkeypatch):
+        stale = JobCheckpoint('stale')
+        _save_state(stale, {'next': 1})
+        stale.finish_attempt(1.0, completed=False)
+        held = JobCheckpoint('held')
+        _save_state(held, {'next': 1})
+        old = time.time() - checkpoints.CHECKPOINT_TTL_SECONDS - 60
+        for name in ('stale', 'stale.lock', 'held', 'held.lock'):
+            os.utime(checkpoint_root / name, (old, old))
+
+        monkeypatch.setattr(checkpoints, '_last_prune', 0.0)
+        checkpoints.prune_checkpoints()
+
+        assert not (checkpoint_root / 'stale').exists()
+        assert not (checkpoint_root / 'stale.lock').exists()
+        assert Checkpoint(held.directory).load() == {'next': 1}
+        held.finish_attempt(1.0, completed=True)
@@ -0,0 +1,122 @@
+"""
+Unit tests for the coproof.compute numeric helpers.
+
+Run from the computation/ directory: python -m pytest tests/ -v
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+from coproof import compute
+
+
+def _is_prime_naive(n):
+    return n >= 2 and all(n % p for p in range(2, math.isqrt(n) + 1))
+
+
+class TestMulmodPowmod:
+    @pytest.mark.parametrize("modulus", [
+        compute._MAX_INT64_MODULUS,
+        compute._MAX_INT64_MODULUS + 1,
+        2 ** 61 - 1,
+    ])
+    def test_mulmod_is_exact_on_both_sides_of_the_int64_bound(self, modulus):
+        a = [modulus - 1, modulus - 2, modulus // 2, 0]
+        b = [modulus - 1, modulus - 3, modulus // 3, 5]
+        got = compute.mulmod(a, b, modulus)
+        assert [int(value) for value in got] == [x * y % modulus for x, y in zip(a, b)]
+
+    def test_mulmod_stays_int64_up_to_the_bound(self):
+        assert compute.mulmod([3], [4], compute._MAX_INT64_MODULUS).dtype == np.int64
+        assert compute.mulmod([3], [4], compute._MAX_INT64_MODULUS + 1).dtype == object
+
+    @pytest.mark.parametrize("modulus", [7, compute._MAX_INT64_MODULUS, compute._MAX_INT64_MODULUS + 2, 2 ** 62 - 57])
+    def test_powmod_matches_pow(self, modulus):
+        bases = [0, 1, 2, modulus - 1, 123456789]
+        exponents = [0, 5, 64, modulus - 2, 10 ** 6]
+        got = compute.powmod(bases, exponents, modulus)
+        assert [int(value) for value in got] == [pow(x, e, modulus) for x, e in zip(bases, exponents)]
+
+    def test_powmod_modulus_one_is_zero(self):
+        assert compute.powmod([5, 0], [0, 3], 1).tolist() == [0, 0]
+
+    def test_powmod_rejects_negative_exponents(self):
+        with pytest.raises(ValueError):
+            compute.powmod([2], [-1], 7)
+
+
+class TestIsSquare:
+    def test_squares_and_neighbours_below_2_62(self):
+        roots = np.arange(2 ** 31 - 4, 2 ** 31, dtype=np.int64)
+        squares = roots * roots
+        assert compute.is_square(squares).all()
+        assert not compute.is_square(squares - 1).any()
+        assert not compute.is_square(squares + 1).any()
+
+    def test_small_and_negative_values(self):
+        assert compute.is_square([-4, -1, 0, 1, 2, 3, 4, 15, 16]).tolist() == [
+            False, False, True, True, False, False, True, False, True,
+        ]
+
+
+class TestPrimes:
+    @pytest.mark.parametrize("limit", [-1, 0, 1, 2, 3, 4, 5])
+    def test_prime_mask_small_limits(self, limit):
+        mask = compute.prime_mask(limit)
+        assert mask.tolist() == [_is_prime_naive(n) for n in range(max(limit, 0))]
+
+    def test_prime_mask_matches_trial_division(self):
+        assert compute.prime_mask(1000).tolist() == [_is_prime_naive(n) for n in range(1000)]
+
+    def test_sieve_primes(self):
+        assert compute.sieve_primes(30).tolist() == [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
+
+    def test_is_prime_across_the_sieve_bound(self):
+        values = np.arange(compute.PRIME_SIEVE_LIMIT - 300, compute.PRIME_SIEVE_LIMIT + 300, dtype=np.int64)
+        assert compute.is_prime(values).tolist() == [_is_prime_naive(int(n)) for n in values]
+
+    def test_is_prime_large_values(self):
+        # 3215031751 and 3825123056546413051 are strong pseudoprimes to several small bases.
+        values = [2 ** 61 - 1, 2 ** 62 - 57, 2 ** 63 - 25, 3215031751, 3825123056546413051, 2 ** 63 - 1, 2 ** 40]
+        assert compute.is_prime(values).tolist() == [True, True, True, False, False, False, False]
+
+    def test_is_prime_small_and_negative_values(self):
+        assert compute.is_prime([-7, 0, 1, 2, 3, 4, 97]).tolist() == [False, False, False, True, True, False, True]
+        assert compute.is_prime([]).tolist() == []
+
+
+class TestCheck:
+    def test_early_exit_counts_up_to_the_last_counterexample(self):
+        result = compute.check_range(lambda v: v % 10 != 7, 0, 100, chunk_size=8, max_counterexamples=2)
+        assert result["evidence"]["counterexamples"] == [7, 17]
+        assert result["evidence"]["checked"] == 18
+        assert result["evidence"]["last"] == 17
+        assert not result["sufficient"]
+        assert result["records"] == [{"n": 7}, {"n": 17}]
+
+    def test_first_counterexample_stops_in_its_chunk(self):
+        result = compute.check_range(lambda v: v != 3, 0, 100, chunk_size=8)
+        assert result["evidence"]["checked"] == 4
+        assert (result["evidence"]["first"], result["evidence"]["last"]) == (0, 3)
+
+    def test_several_counterexamples_in_one_chunk(self):
+        result = compute.check_range(lambda v: v % 2 == 0, 10, 30, chunk_size=100, max_counterexamples=3)
+        assert result["evidence"]["counterexamples"] == [11, 13, 15]
+        assert result["evidence"]["checked"] == 6
+
+    def test_holding_property_checks_everything(self):
+        result = compute.check_range(lambda v: v >= 0, 0, 21, chunk_size=8)
+        assert result["sufficient"]
+        assert result["evidence"]["checked"] == 21
+        assert (result["evidence"]["first"], result["evidence"]["last"]) == (0, 20)
+
+    def test_empty_values(self):
+        result = compute.check_values(lambda v: v > 0, [])
+        assert result["sufficient"]
+        assert result["evidence"]["checked"] == 0
+
+    def test_rejects_non_positive_max_counterexamples(self):
+        with pytest.raises(ValueError):
+            compute.check_range(lambda v: v > 0, 0, 10, max_counterexamples=0)
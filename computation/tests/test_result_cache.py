@@ -0,0 +1,157 @@
+"""
+Unit tests for the memoized computation results.
+
+Run from the computation/ directory: python -m pytest tests/ -v
+"""
+
+import pytest
+
+import result_cache
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+class FakeRedis:
+    """The subset of redis.Redis used by result_cache, in memory."""
+
+    def __init__(self):
+        self.values = {}
+        self.sorted_sets = {}
+        self.hashes = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+        return True
+
+    def delete(self, *keys):
+        return sum(self.values.pop(key, None) is not None for key in keys)
+
+    def zadd(self, key, mapping, xx=False):
+        members = self.sorted_sets.setdefault(key, {})
+        for member, score in mapping.items():
+            if not xx or member in members:
+                members[member] = score
+        return len(mapping)
+
+    def zcard(self, key):
+        return len(self.sorted_sets.get(key, {}))
+
+    def zpopmin(self, key, count):
+        members = self.sorted_sets.get(key, {})
+        popped = sorted(members.items(), key=lambda item: item[1])[:count]
+        for member, _score in popped:
+            del members[member]
+        return [(member.encode('utf-8'), score) for member, score in popped]
+
+    def hincrby(self, key, field, amount):
+        fields = self.hashes.setdefault(key, {})
+        fields[field] = fields.get(field, 0) + amount
+        return fields[field]
+
+    def hgetall(self, key):
+        return {field.encode('utf-8'): str(value).encode('utf-8') for field, value in self.hashes.get(key, {}).items()}
+
+
+PAYLOAD = {
+    'language': 'python',
+    'source_code': 'def run(input_data, target):\n    return {"n": input_data["n"] * 2}\n',
+    'entrypoint': 'run',
+    'input_data': {'n': 21, 'options': {'a': 1, 'b': 2}},
+    'target': {'evidence': 'n'},
+}
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    client = FakeRedis()
+    monkeypatch.setattr(result_cache, '_client', client)
+    monkeypatch.setattr(result_cache, '_runtime_fingerprint', '3.11.9||coproof=1')
+    monkeypatch.setattr(result_cache, 'CACHE_ENABLED', True)
+    return client
+
+
+def _computation(result):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return dict(result)
+    return compute, calls
+
+
+class TestComputationCacheKey:
+    def test_key_is_stable_across_dict_order(self, fake_redis):
+        reordered = dict(PAYLOAD, input_data={'options': {'b': 2, 'a': 1}, 'n': 21})
+        assert result_cache.computation_cache_key(reordered) == result_cache.computation_cache_key(PAYLOAD)
+
+    def test_defaults_match_explicit_values(self, fake_redis):
+        explicit = dict(PAYLOAD, shards=1, tasks=1)
+        implicit = {key: value for key, value in PAYLOAD.items() if key != 'entrypoint'}
+        assert result_cache.computation_cache_key(explicit) == result_cache.computation_cache_key(implicit)
+
+    @pytest.mark.parametrize('change', [
+        {'source_code': PAYLOAD['source_code'].replace('    return', '     return')},
+        {'input_data': {'n': 22, 'options': {'a': 1, 'b': 2}}},
+        {'target': None},
+        {'entrypoint': 'main'},
+        {'shards': 4},
+        {'tasks': 2},
+    ])
+    def test_every_input_changes_the_key(self, fake_redis, change):
+        assert (result_cache.computation_cache_key(dict(PAYLOAD, **change))
+                != result_cache.computation_cache_key(PAYLOAD))
+
+    def test_runtime_changes_the_key(self, fake_redis, monkeypatch):
+        before = result_cache.computation_cache_key(PAYLOAD)
+        monkeypatch.setattr(result_cache, '_runtime_fingerprint', '3.12.4||coproof=1')
+        assert result_cache.computation_cache_key(PAYLOAD) != before
+
+
+class TestCachedComputation:
+    def test_completed_result_is_reused(self, fake_redis):
+        compute, calls = _computation({'completed': True, 'evidence': 42, 'processing_time_seconds': 3.0})
+
+        first = result_cache.cached_computation('key', compute)
+        second = result_cache.cached_computation('key', compute)
+
+        assert len(calls) == 1
+        assert (first['cache_hit'], second['cache_hit']) == (False, True)
+        assert second['evidence'] == 42
+        assert second['cached_processing_time_seconds'] == 3.0
+
+    def test_force_bypasses_and_overwrites_the_entry(self, fake_redis):
+        result_cache.cached_computation('key', _computation({'completed': True, 'evidence': 1})[0])
+        compute, calls = _computation({'completed': True, 'evidence': 2})
+
+        forced = result_cache.cached_computation('key', compute, force=True)
+        after = result_cache.cached_computation('key', compute)
+
+        assert len(calls) == 1
+        assert forced['cache_hit'] is False
+        assert (after['cache_hit'], after['evidence']) == (True, 2)
+
+    def test_incomplete_result_is_not_stored(self, fake_redis):
+        compute, calls = _computation({'completed': False, 'error': 'timeout'})
+        result_cache.cached_computation('key', compute)
+        result_cache.cached_computation('key', compute)
+        assert len(calls) == 2
+        assert fake_redis.values == {}
@@ -0,0 +1,199 @@
+"""
+workspace_pool.py
+~~~~~~~~~~~~~~~~~
+Reusable RAM-backed job directories.
+
+Each worker process keeps a small pool of directories under
+`COPROOF_WORKSPACE_ROOT/<pid>` (tmpfs `/dev/shm` by default).  A job leases
+one, `sync`s its input files into it and runs there.  Syncing is
+incremental: a manifest remembers the digest of every file written, so a
+file whose content did not change since the workspace's last job is not
+rewritten, and everything that is not part of the new input — stale inputs
+as well as outputs of the previous job — is removed.  Jobs run untrusted
+code that can write to the workspace (and restore sizes and mtimes), so a
+file is only kept when it is still a regular file with the recorded
+content.
+
+The same module is shipped with the lean and the computation worker.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from stat import S_ISREG
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+WORKSPACE_ROOT = os.environ.get('COPROOF_WORKSPACE_ROOT', '/dev/shm/coproof-workspaces')
+WORKSPACE_POOL_SIZE = int(os.environ.get('COPROOF_WORKSPACE_POOL_SIZE', '4'))
+
+
+class Workspace:
+    """One leased job directory plus the manifest of the files synced into it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.manifest = {}
+
+    def _resolve(self, rel_path: str):
+        full_path = os.path.normpath(os.path.join(self.path, rel_path))
+        if os.path.commonpath([self.path, full_path]) != self.path or full_path == self.path:
+            raise ValueError(f'Path escapes the workspace: {rel_path}')
+        return full_path
+
+    def _unchanged_on_disk(self, full_path: str, entry: tuple):
+        try:
+            stat = os.lstat(full_path)
+            if not S_ISREG(stat.st_mode) or stat.st_size != entry[1]:
+                return False
+            with open(full_path, 'rb') as handle:
+                return hashlib.sha256(handle.read()).hexdigest() == entry[0]
+        except OSError:
+            return False
+
+    def _remove_untracked(self, keep: set):
+        removed = 0
+        for root, dirs, files in os.walk(self.path, topdown=False):
+            for file_name in files:
+                full_path = os.path.join(root, file_name)
+                rel_path = os.path.relpath(full_path, self.path)
+                if rel_path not in keep:
+                    os.remove(full_path)
+                    self.manifest.pop(rel_path, None)
+                    removed += 1
+            for dir_name in dirs:
+                full_path = os.path.join(root, dir_name)
+                if os.path.islink(full_path):
+                    os.remove(full_path)
+                    continue
+                try:
+                    os.rmdir(full_path)
+                except OSError:
+                    pass
+        return removed
+
+    def sync(self, files: dict):
+        """
+        Make the workspace contain exactly *files* ({relative path: str or
+        bytes}). Returns counts of written, skipped and removed files.
+        """
+        normalized = {}
+        for rel_path, content in files.items():
+            full_path = self._resolve(rel_path)
+            normalized[os.path.relpath(full_path, self.path)] = content
+
+        report = {'written': 0, 'skipped': 0, 'removed': self._remove_untracked(set(normalized))}
+        for rel_path, content in normalized.items():
+            data = content.encode('utf-8') if isinstance(content, str) else content
+            digest = hashlib.sha256(data).hexdigest()
+            full_path = os.path.join(self.path, rel_path)
+
+            entry = self.manifest.get(rel_path)
+            if entry is not None and entry[0] == digest and self._unchanged_on_disk(full_path, entry):
+                report['skipped'] += 1
+                continue
+
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if os.path.islink(full_path) or os.path.isdir(full_path):
+                # Never write through a symlink (or into a directory) a job left in place.
+                _remove_path(full_path)
+            with open(full_path, 'wb') as handle:
+                handle.write(data)
+            self.manifest[rel_path] = (digest, len(data))
+            report['written'] += 1
+        return report
+
+    def reset(self):
+        """Empty the workspace completely."""
+        self._remove_untracked(set())
+        self.manifest.clear()
+
+
+def _remove_path(path: str):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+class WorkspacePool:
+    """Per-process pool of workspaces; idle ones are reused most-recently-used first."""
+
+    def __init__(self, root: str, size: int):
+        self.root = os.path.join(root, str(os.getpid()))
+        self.size = size
+        self._idle = []
+        self._created = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        _remove_dead_process_roots(root)
+
+    def _create(self):
+        with self._lock:
+            self._created += 1
+            number = self._created
+        path = os.path.join(self.root, f'ws{number}')
+        os.makedirs(path, exist_ok=True)
+        return Workspace(path)
+
+    @contextmanager
+    def lease(self):
+        with self._lock:
+            workspace = self._idle.pop() if self._idle else None
+        if workspace is None:
+            workspace = self._create()
+
+        broken = False
+        try:
+            yield workspace
+        except BaseException:
+            broken = True
+            raise
+        finally:
+            if broken:
+                workspace.reset()
+            with self._lock:
+                if len(self._idle) < self.size:
+                    self._idle.append(workspace)
+                    workspace = None
+            if workspace is not None:
+                shutil.rmtree(workspace.path, ignore_errors=True)
+
+
+def _remove_dead_process_roots(root: str):
+    """Drop workspace roots left behind by worker processes that no longer exist."""
+    for entry in os.listdir(root):
+        if not entry.isdigit() or int(entry) == os.getpid():
+            continue
+        try:
+            os.kill(int(entry), 0)
+        except ProcessLookupError:
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+        except PermissionError:
+            pass
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_workspace_pool():
+    """Return this process's workspace pool (re-created after a fork)."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            root = WORKSPACE_ROOT
+            try:
+                os.makedirs(root, exist_ok=True)
+            except OSError:
+                root = os.path.join(tempfile.gettempdir(), 'coproof-workspaces')
+                os.makedirs(root, exist_ok=True)
+            _pool = WorkspacePool(root, WORKSPACE_POOL_SIZE)
+            _pool_pid = os.getpid()
+        return _pool
@@ -109,6 +109,16 @@ export interface VerifyCompilerResult {
   return_code?: number;
   message_count?: number;
   theorem_count?: number;
+  syntax_only?: boolean;
+  log_ref?: string;
+}
+
+export interface VerificationSessionResult extends Partial<VerifyCompilerResult> {
+  session_id: string;
+  worker: string;
+  reused_blocks?: number;
+  rechecked_blocks?: number;
+  rechecked_from_line?: number | null;
 }
 
 export interface SorryLocationItem {
@@ -221,6 +231,40 @@ export interface ComputeNodePayload {
   target: Record<string, unknown>;
   lean_statement: string;
   timeout_seconds?: number;
+  // Sharded runs: the code also defines shard(input_data, target, k) and optionally reduce(results).
+  shards?: number;
+  shard_backend?: 'local' | 'celery';
+  // Cluster runs: `tasks` ranks see RANK / WORLD_SIZE; local_slurm simulates an allocation on one worker.
+  executor?: 'local' | 'local_slurm' | 'slurm';
+  tasks?: number;
+  // Re-run even when the worker has a memoized result for the same program and inputs.
+  force?: boolean;
+  // Continue a timed-out or crashed run from its last checkpoint (default true).
+  resume?: boolean;
+  // Room id for 'computation_progress' socket events and the cancel endpoint; tied to the first user who uses it.
+  run_id?: string;
+}
+
+export interface ComputationProgress {
+  run_id: string;
+  done: number | null;
+  total: number | null;
+  fraction: number | null;
+  message: string | null;
+  counters: Record<string, unknown>;
+  reported_at: number;
+  shard_index?: number;
+  rank?: number;
+}
+
+// Measured by the worker; null where unknown (e.g. jobs killed on timeout).
+export interface ComputationResources {
+  cpu_user_seconds: number | null;
+  cpu_system_seconds: number | null;
+  peak_rss_bytes: number | null;
+  io_read_bytes: number | null;
+  io_write_bytes: number | null;
+  processes: number | null;
 }
 
 // --- NL2FL / Translation ---
@@ -19,6 +19,7 @@ import {
   TranslationResult,
   SuggestPayload,
   SuggestResult,
+  VerificationSessionResult,
   VerifyCompilerResult,
   VerifyNodeResponse,
   PullRequestFilesResponse,
@@ -263,6 +264,39 @@ export class TaskService {
     );
   }
 
+  checkLeanSyntax(code: string): Observable<VerifyCompilerResult> {
+    return this.http.post<VerifyCompilerResult>(
+      `${this.apiBaseUrl}/nodes/tools/check-syntax`,
+      { code }
+    );
+  }
+
+  openVerificationSession(code?: string): Observable<VerificationSessionResult> {
+    return this.http.post<VerificationSessionResult>(
+      `${this.apiBaseUrl}/nodes/tools/sessions`,
+      code ? { code } : {},
+      { headers: this.authHeaders() }
+    );
+  }
+
+  updateVerificationSession(sessionId: string, code: string): Observable<VerificationSessionResult> {
+    return this.http.put<VerificationSessionResult>(
+      `${this.apiBaseUrl}/nodes/tools/sessions/${sessionId}`,
+      { code },
+      { headers: this.authHeaders() }
+    );
+  }
+
+  closeVerificationSession(sessionId: string): Observable<unknown> {
+    return this.http.delete(`${this.apiBaseUrl}/nodes/tools/sessions/${sessionId}`, {
+      headers: this.authHeaders()
+    });
+  }
+
+  getJobLog(logRef: string): Observable<string> {
+    return this.http.get(`${this.apiBaseUrl}/nodes/tools/logs/${logRef}`, { responseType: 'text' });
+  }
+
   getLeanSnippetResult(taskId: string): Observable<VerifyCompilerResult | { status: 'pending' }> {
     return this.http.get<VerifyCompilerResult | { status: 'pending' }>(
       `${this.apiBaseUrl}/nodes/tools/verify-snippet/${taskId}/result`
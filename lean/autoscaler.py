@@ -0,0 +1,87 @@
+"""
+autoscaler.py
+~~~~~~~~~~~~~
+Celery autoscaler that sizes the lean worker pool by free memory.
+
+A static `--concurrency` has to assume the worst case of every check at
+once.  With `--autoscale=MAX,MIN` and this class as `worker_autoscaler`, a
+new pool process is only started while the container still has room for one
+more Lean job:
+
+    processes <= current + (available_mb - LEAN_MEMORY_RESERVE_MB) // LEAN_JOB_MEMORY_MB
+
+Available memory is the smaller of `/proc/meminfo` MemAvailable and the
+remaining cgroup v2 allowance (`memory.max - memory.current`), since inside a
+container /proc/meminfo describes the host.
+"""
+
+import logging
+import os
+
+from celery.worker.autoscale import Autoscaler
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+JOB_MEMORY_MB = int(os.environ.get('LEAN_JOB_MEMORY_MB', '3072'))
+MEMORY_RESERVE_MB = int(os.environ.get('LEAN_MEMORY_RESERVE_MB', '1024'))
+CGROUP_DIR = os.environ.get('LEAN_CGROUP_DIR', '/sys/fs/cgroup')
+
+
+def _read_int(path: str):
+    try:
+        with open(path, 'r', encoding='utf-8') as handle:
+            value = handle.read().strip()
+    except OSError:
+        return None
+    return int(value) if value.isdigit() else None
+
+
+def available_memory_mb():
+    available = None
+    try:
+        with open('/proc/meminfo', 'r', encoding='utf-8') as handle:
+            for line in handle:
+                if line.startswith('MemAvailable:'):
+                    available = int(line.split()[1]) / 1024
+                    break
+    except OSError:
+        pass
+
+    limit = _read_int(os.path.join(CGROUP_DIR, 'memory.max'))
+    current = _read_int(os.path.join(CGROUP_DIR, 'memory.current'))
+    if limit is not None and current is not None:
+        cgroup_available = (limit - current) / (1024 * 1024)
+        available = cgroup_available if available is None else min(available, cgroup_available)
+    return available
+
+
+class MemoryAwareAutoscaler(Autoscaler):
+    """Autoscaler whose upper bound follows the memory that is actually free."""
+
+    def memory_ceiling(self):
+        available = available_memory_mb()
+        if available is None or JOB_MEMORY_MB <= 0:
+            return self.max_concurrency
+        spare_jobs = int((available - MEMORY_RESERVE_MB) // JOB_MEMORY_MB)
+        return max(self.min_concurrency, self.processes + spare_jobs)
+
+    def _maybe_scale(self, req=None):
+        procs = self.processes
+        ceiling = self.memory_ceiling()
+
+        wanted = min(self.qty, self.max_concurrency, ceiling)
+        if wanted > procs:
+            self.scale_up(wanted - procs)
+            return True
+
+        wanted = max(min(self.qty, ceiling), self.min_concurrency)
+        if wanted < procs:
+            if ceiling < procs:
+                logger.info('Lean worker memory is low; shrinking pool to %s processes.', wanted)
+            self.scale_down(procs - wanted)
+            return True
+        return False
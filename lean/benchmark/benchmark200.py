@@ -1,12 +1,21 @@
+import argparse
+import csv
+import glob
 import json
+import math
+import os
+import resource
+import sys
+import threading
 import time
-import requests
-import csv
-import matplotlib.pyplot as plt
-import numpy as np
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 
+# requests, matplotlib and numpy are only needed by the online benchmark and
+# are imported where they are used, so the offline mode runs without them.
+
 API_URL = "http://localhost:5000/verify"
 BENCHMARK_SIZE = 100
 
@@ -42,6 +51,7 @@ def fetchTheoremSource(theorem: Dict[str, Any]) -> Optional[str]:
     
     rawUrl = f"{url}/raw/{commit}/{filePath}"
     
+    import requests
     try:
         response = requests.get(rawUrl, timeout=10)
         if response.status_code == 200:
@@ -65,6 +75,7 @@ def extractProofState(theorem: Dict[str, Any]) -> str:
     }
 
 def verifyTheorem(theoremData: Dict[str, Any]) -> Dict[str, Any]:
+    import requests
     fullName = theoremData['full_name']
     theorem = theoremData['theorem']
     
@@ -146,6 +157,8 @@ def verifyTheorem(theoremData: Dict[str, Any]) -> Dict[str, Any]:
         }
 
 def plotResponseTimes(results: List[Dict[str, Any]], timestamp: str):
+    import matplotlib.pyplot as plt
+    import numpy as np
     successfulResults = [r for r in results if r.get('success', False)]
     
     if not successfulResults:
@@ -368,7 +381,312 @@ def runBenchmark():
     
     print(f"{'='*80}")
 
+LEAN_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_CORPUS_GLOB = os.path.join(LEAN_DIR, 'examples', '*.lean')
+
+# Metrics compared against a stored baseline: (report key, higher is worse).
+BASELINE_METRICS = [
+    ('p50LatencySeconds', True),
+    ('p95LatencySeconds', True),
+    ('p99LatencySeconds', True),
+    ('throughputPerSecond', False),
+    ('peakRssMb', True),
+]
+
+def buildSyntheticTree(treeIndex: int, depth: int, branching: int) -> str:
+    """A core-Lean proof tree: leaves are commutativity lemmas, every inner node conjoins its children."""
+    lines = [f"-- synthetic proof tree {treeIndex} (depth {depth}, branching {branching})", ""]
+    statements = {}
+
+    def emit(path: str, level: int) -> str:
+        name = f"t{treeIndex}_{path}"
+        if level == depth:
+            constant = len(statements) + 1
+            statements[name] = f"n + {constant} = {constant} + n"
+            lines.append(f"theorem {name} (n : Nat) : {statements[name]} := Nat.add_comm n {constant}")
+            return name
+        children = [emit(f"{path}{child}", level + 1) for child in range(branching)]
+        statements[name] = " ∧ ".join(f"({statements[child]})" for child in children)
+        proof = ", ".join(f"{child} n" for child in children)
+        lines.append(f"theorem {name} (n : Nat) : {statements[name]} := ⟨{proof}⟩")
+        return name
+
+    emit("r", 0)
+    return "\n".join(lines) + "\n"
+
+def loadLocalCorpus(corpusGlobs: List[str], syntheticCount: int, syntheticDepth: int, syntheticBranching: int) -> List[Dict[str, Any]]:
+    corpus = []
+    for pattern in corpusGlobs:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, 'r', encoding='utf-8') as f:
+                corpus.append({'name': os.path.basename(path), 'code': f.read()})
+    for treeIndex in range(syntheticCount):
+        corpus.append({
+            'name': f'synthetic_tree_{treeIndex}.lean',
+            'code': buildSyntheticTree(treeIndex, syntheticDepth, syntheticBranching),
+        })
+    return corpus
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # Rounded first: 0.07 * 100 is 7.000000000000001, which must stay rank 7.
+    rank = max(1, math.ceil(round(fraction * len(ordered), 9)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def processTreeRssMb(rootPid: int) -> float:
+    """Summed resident memory of *rootPid* and all of its descendants (Linux /proc)."""
+    children = {}
+    rssPages = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open(f'/proc/{entry}/statm', 'r') as f:
+                rssPages[int(entry)] = int(f.read().split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+
+    total = 0
+    stack = [rootPid]
+    while stack:
+        pid = stack.pop()
+        total += rssPages.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+class RssSampler:
+    """Samples the memory of a process tree in the background and keeps the peak."""
+
+    def __init__(self, rootPid: int, interval: float = 0.2):
+        self.rootPid = rootPid
+        self.interval = interval
+        self.peakMb = 0.0
+        self.stopEvent = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopEvent.is_set():
+            try:
+                self.peakMb = max(self.peakMb, processTreeRssMb(self.rootPid))
+            except OSError:
+                return
+            self.stopEvent.wait(self.interval)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *excInfo):
+        self.stopEvent.set()
+        self.thread.join()
+
+def makeDirectVerifier():
+    sys.path.insert(0, LEAN_DIR)
+    from lean_service import to_compiler_snippet_response
+
+    def verify(item: Dict[str, Any]) -> Dict[str, Any]:
+        return to_compiler_snippet_response(item['code'], item['name'])
+    return verify
+
+def makeBrokerVerifier(brokerUrl: str, queueName: str, timeout: float):
+    from celery import Celery
+    sys.path.insert(0, LEAN_DIR)
+    from result_serialization import CELERY_RESULT_SETTINGS, register
+    register()
+    client = Celery('lean_benchmark', broker=brokerUrl, backend=brokerUrl)
+    client.conf.update(CELERY_RESULT_SETTINGS)
+
+    def verify(item: Dict[str, Any]) -> Dict[str, Any]:
+        task = client.send_task('tasks.verify_snippet', args=[item['code'], item['name']], queue=queueName)
+        return task.get(timeout=timeout)
+    return verify
+
+def runOfflineJob(verify, item: Dict[str, Any]) -> Dict[str, Any]:
+    startTime = time.perf_counter()
+    try:
+        response = verify(item)
+        latency = time.perf_counter() - startTime
+        return {
+            'name': item['name'],
+            'success': response.get('return_code', -1) != -1,
+            'verified': response.get('valid', False),
+            'latency': latency,
+            'processing_time': response.get('processing_time_seconds', 0.0),
+            'cache_hit': response.get('cache_hit', False),
+            'error': '' if response.get('return_code', -1) != -1 else 'worker error or timeout',
+        }
+    except Exception as e:
+        return {
+            'name': item['name'],
+            'success': False,
+            'verified': False,
+            'latency': time.perf_counter() - startTime,
+            'processing_time': 0.0,
+            'cache_hit': False,
+            'error': str(e),
+        }
+
+def summarizeOfflineRun(results: List[Dict[str, Any]], wallTime: float, peakRssMb: Optional[float], args) -> Dict[str, Any]:
+    latencies = [r['latency'] for r in results if r['success']]
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'mode': args.mode,
+        'concurrency': args.concurrency,
+        'jobs': len(results),
+        'successful': len(latencies),
+        'verified': sum(1 for r in results if r['verified']),
+        'verifiedByName': {r['name']: r['verified'] for r in results},
+        'errors': len(results) - len(latencies),
+        'wallTimeSeconds': round(wallTime, 3),
+        'throughputPerSecond': round(len(latencies) / wallTime, 4) if wallTime > 0 else 0.0,
+        'meanLatencySeconds': round(sum(latencies) / len(latencies), 4) if latencies else 0.0,
+        'p50LatencySeconds': round(percentile(latencies, 0.50), 4),
+        'p95LatencySeconds': round(percentile(latencies, 0.95), 4),
+        'p99LatencySeconds': round(percentile(latencies, 0.99), 4),
+        'peakRssMb': round(peakRssMb, 1) if peakRssMb is not None else None,
+        'results': results,
+    }
+
+def compareWithBaseline(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    for key, higherIsWorse in BASELINE_METRICS:
+        current = report.get(key)
+        reference = baseline.get(key)
+        if current is None or not reference:
+            continue
+        if higherIsWorse and current > reference * (1 + tolerance):
+            regressions.append(f"{key}: {current} > baseline {reference} (+{100 * tolerance:.0f}% allowed)")
+        if not higherIsWorse and current < reference * (1 - tolerance):
+            regressions.append(f"{key}: {current} < baseline {reference} (-{100 * tolerance:.0f}% allowed)")
+
+    expected = baseline.get('verifiedByName', {})
+    for name, verified in report.get('verifiedByName', {}).items():
+        if name in expected and expected[name] != verified:
+            regressions.append(f"verification outcome changed for {name}: {expected[name]} -> {verified}")
+    return regressions
+
+def runOfflineBenchmark(args) -> int:
+    corpus = loadLocalCorpus(args.corpus, args.synthetic, args.synthetic_depth, args.synthetic_branching)
+    if not corpus:
+        print("Offline corpus is empty")
+        return 1
+
+    jobs = []
+    for repetition in range(args.repeat):
+        for item in corpus:
+            code = item['code']
+            if args.cache_bust:
+                # A unique comment defeats the worker's content-addressed result cache.
+                code = f"-- benchmark run {uuid.uuid4().hex}\n{code}"
+            jobs.append({'name': item['name'], 'code': code})
+
+    if args.mode == 'direct':
+        verify = makeDirectVerifier()
+        rssRoot = os.getpid()
+    else:
+        verify = makeBrokerVerifier(args.broker_url, args.queue, args.timeout)
+        rssRoot = args.rss_pid
+
+    print(f"Offline benchmark: {len(jobs)} jobs ({len(corpus)} files x {args.repeat}), "
+          f"mode={args.mode}, concurrency={args.concurrency}")
+
+    sampler = RssSampler(rssRoot) if rssRoot else None
+    startTime = time.perf_counter()
+    if sampler:
+        sampler.__enter__()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(lambda item: runOfflineJob(verify, item), jobs))
+    finally:
+        if sampler:
+            sampler.__exit__(None, None, None)
+    wallTime = time.perf_counter() - startTime
+
+    peakRssMb = None
+    if sampler:
+        peakRssMb = sampler.peakMb
+        if args.mode == 'direct':
+            # Children that lived between two samples still count.
+            childPeakMb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+            peakRssMb = max(peakRssMb, childPeakMb)
+
+    report = summarizeOfflineRun(results, wallTime, peakRssMb, args)
+
+    print(f"\n{'='*80}")
+    print("OFFLINE BENCHMARK RESULTS")
+    print(f"{'='*80}")
+    print(f"Jobs: {report['jobs']}  successful: {report['successful']}  verified: {report['verified']}  errors: {report['errors']}")
+    print(f"Wall time: {report['wallTimeSeconds']:.2f}s  throughput: {report['throughputPerSecond']:.3f} checks/s")
+    print(f"Latency p50: {report['p50LatencySeconds']:.3f}s  p95: {report['p95LatencySeconds']:.3f}s  p99: {report['p99LatencySeconds']:.3f}s")
+    if peakRssMb is not None:
+        print(f"Peak RSS: {report['peakRssMb']:.1f} MB")
+
+    outputFile = args.output or f"benchmark_offline_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(outputFile, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to: {outputFile}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump({key: value for key, value in report.items() if key != 'results'}, f, indent=2)
+        print(f"Baseline saved to: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compareWithBaseline(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{'!'*80}")
+            print(f"PERFORMANCE REGRESSION against {args.baseline}:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            print(f"{'!'*80}")
+            return 1
+        print(f"\nNo regression against {args.baseline} (tolerance {100 * args.tolerance:.0f}%)")
+
+    return 0
+
+def parseArguments():
+    parser = argparse.ArgumentParser(description="Lean 4 verification benchmark")
+    parser.add_argument('--offline', action='store_true',
+                        help="run against a local corpus instead of the HTTP API and GitHub sources")
+    parser.add_argument('--mode', choices=['direct', 'broker'], default='direct',
+                        help="call lean_service in-process, or tasks.verify_snippet through a Celery broker")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=1, help="how many times every corpus file is checked")
+    parser.add_argument('--corpus', action='append', default=None,
+                        help=f"glob of .lean files (repeatable, default {DEFAULT_CORPUS_GLOB})")
+    parser.add_argument('--synthetic', type=int, default=4, help="number of synthetic proof trees to add")
+    parser.add_argument('--synthetic-depth', type=int, default=3)
+    parser.add_argument('--synthetic-branching', type=int, default=2)
+    parser.add_argument('--cache-bust', action='store_true', help="make every job unique to bypass the result cache")
+    parser.add_argument('--broker-url', default=os.environ.get('REDIS_URL', 'redis://localhost:6379/0'))
+    parser.add_argument('--queue', default=os.environ.get('CELERY_LEAN_QUEUE', 'lean_queue'))
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--rss-pid', type=int, default=None,
+                        help="broker mode: pid of the worker whose process tree memory is sampled")
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--baseline', default=None, help="baseline report to compare against; exits 1 on regression")
+    parser.add_argument('--save-baseline', default=None)
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+    if args.corpus is None:
+        args.corpus = [DEFAULT_CORPUS_GLOB]
+    return args
+
 if __name__ == '__main__':
+    arguments = parseArguments()
+    if arguments.offline:
+        sys.exit(runOfflineBenchmark(arguments))
+
+    import requests
     print("Lean 4 Verification API Benchmark")
     print(f"{'='*80}\n")
     
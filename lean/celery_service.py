@@ -1,5 +1,14 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown, worker_ready, worker_shutdown
+
+from lean_repl import close_repl_pool, get_repl_pool
+from lean_sessions import close_session_registry, get_session_registry
+from result_serialization import CELERY_RESULT_SETTINGS, register as register_result_serializer
+
+register_result_serializer()
+
+session_queue_name = os.environ.get("CELERY_LEAN_SESSION_QUEUE", "lean_session_queue")
 
 celery = Celery(
     "lean_worker",
@@ -12,6 +21,48 @@ celery.conf.update(
     task_routes={
         "tasks.*": {"queue": "lean_queue"},
     },
+    # Verifications are long and uneven: take one task at a time so a queued
+    # check is never stuck behind a busy child, and acknowledge only after it
+    # ran so a lost worker does not lose the request.
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+    # Used when the worker runs with --autoscale=MAX,MIN: the pool only grows
+    # while free memory allows another Lean job.
+    worker_autoscaler="autoscaler:MemoryAwareAutoscaler",
+    # Every worker also consumes its own direct queue, so calls for an edit
+    # session can be routed to the process that holds it.
+    worker_direct=True,
+    # Results are msgpack + zlib (see result_serialization.py); readers of
+    # lean results register the same serializer.
+    **CELERY_RESULT_SETTINGS,
 )
 
+
+@worker_process_init.connect
+def warm_repl_pool(**_kwargs):
+    pool = get_repl_pool()
+    if pool is not None:
+        pool.warm_up()
+
+
+@worker_process_shutdown.connect
+def shutdown_repl_pool(**_kwargs):
+    close_repl_pool()
+
+
+@worker_ready.connect
+def warm_session_registry(**_kwargs):
+    # Sessions are only served by the worker consuming the session queue
+    # (threads pool, so the registry lives in the main process).
+    if session_queue_name in (celery.amqp.queues.consume_from or {}):
+        registry = get_session_registry()
+        if registry is not None:
+            registry.warm_up()
+
+
+@worker_shutdown.connect
+def shutdown_session_registry(**_kwargs):
+    close_session_registry()
+
+
 import tasks  # noqa: E402,F401
@@ -0,0 +1,160 @@
+"""
+import_minimizer.py
+~~~~~~~~~~~~~~~~~~~
+Narrow `import Mathlib` to the modules a snippet actually uses.
+
+The index at `LEAN_MODULE_INDEX_PATH` is produced at image build time by
+`tools/ModuleIndex.lean` for the pinned Mathlib commit.  It maps every public
+declaration to its defining module and records the direct imports of every
+module, so the narrowed header can drop modules already implied by others.
+
+Identifier resolution here is deliberately approximate (no elaboration, no
+dot-notation resolution): callers must verify the narrowed source and fall
+back to the full import when the narrowed check fails.
+"""
+
+import os
+import re
+
+MODULE_INDEX_PATH = os.environ.get('LEAN_MODULE_INDEX_PATH', '/opt/coproof/mathlib_module_index.tsv')
+FULL_IMPORT = 'Mathlib'
+CORE_PACKAGES = {'Init', 'Lean', 'Std', 'Lake'}
+
+# Tactics and notations are syntax, not declarations, so they never show up
+# in the declaration index. Modules missing from the index are ignored.
+SYNTAX_MODULES = {
+    'norm_num': 'Mathlib.Tactic.NormNum',
+    'linarith': 'Mathlib.Tactic.Linarith',
+    'nlinarith': 'Mathlib.Tactic.Linarith',
+    'positivity': 'Mathlib.Tactic.Positivity',
+    'ring': 'Mathlib.Tactic.Ring',
+    'ring_nf': 'Mathlib.Tactic.Ring',
+    'field_simp': 'Mathlib.Tactic.FieldSimp',
+    'abel': 'Mathlib.Tactic.Abel',
+    'group': 'Mathlib.Tactic.Group',
+    'gcongr': 'Mathlib.Tactic.GCongr',
+    'interval_cases': 'Mathlib.Tactic.IntervalCases',
+    'fin_cases': 'Mathlib.Tactic.FinCases',
+    'push_neg': 'Mathlib.Tactic.PushNeg',
+    'contrapose': 'Mathlib.Tactic.Contrapose',
+    'by_contra!': 'Mathlib.Tactic.ByContra',
+    'tauto': 'Mathlib.Tactic.Tauto',
+    'use': 'Mathlib.Tactic.Use',
+    'choose': 'Mathlib.Tactic.Choose',
+    'lift': 'Mathlib.Tactic.Lift',
+    'zify': 'Mathlib.Tactic.Zify',
+    'qify': 'Mathlib.Tactic.Qify',
+    'set': 'Mathlib.Tactic.Set',
+    'bound': 'Mathlib.Tactic.Bound',
+    'aesop': 'Mathlib.Tactic.Common',
+    'ℕ': 'Mathlib.Data.Nat.Notation',
+    'ℤ': 'Mathlib.Data.Int.Notation',
+    'ℚ': 'Mathlib.Data.Rat.Init',
+    'ℝ': 'Mathlib.Data.Real.Basic',
+    'ℂ': 'Mathlib.Data.Complex.Basic',
+    '∑': 'Mathlib.Algebra.BigOperators.Group.Finset',
+    '∏': 'Mathlib.Algebra.BigOperators.Group.Finset',
+    '√': 'Mathlib.Analysis.SpecialFunctions.Pow.NNRpow',
+}
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_'!?₀-₉]*(?:\.[A-Za-z_][A-Za-z0-9_'!?₀-₉]*)*|[ℕℤℚℝℂ∑∏√]")
+COMMENT = re.compile(r'--[^\n]*|/-.*?-/', re.DOTALL)
+STRING = re.compile(r'"(?:\\.|[^"\\])*"')
+
+_index = None
+
+
+class ModuleIndex:
+    def __init__(self, declarations: dict, imports: dict):
+        self.declarations = declarations
+        self.imports = imports
+        self._closures = {}
+
+    @classmethod
+    def load(cls, path: str):
+        declarations = {}
+        imports = {}
+        module_names = {}
+        with open(path, 'r', encoding='utf-8') as handle:
+            for line in handle:
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) != 3:
+                    continue
+                kind, name, value = parts
+                if kind == 'C':
+                    declarations[name] = module_names.setdefault(value, value)
+                elif kind == 'I':
+                    imports[name] = value.split() if value else []
+        return cls(declarations, imports)
+
+    def closure(self, module: str):
+        if module not in self._closures:
+            seen = set()
+            stack = list(self.imports.get(module, []))
+            while stack:
+                current = stack.pop()
+                if current in seen:
+                    continue
+                seen.add(current)
+                stack.extend(self.imports.get(current, []))
+            self._closures[module] = seen
+        return self._closures[module]
+
+    def reduce(self, modules: set):
+        """Drop modules that are already imported transitively by another selected module."""
+        return sorted(
+            module for module in modules
+            if not any(module in self.closure(other) for other in modules if other != module)
+        )
+
+
+def get_module_index():
+    global _index
+    if _index is None and os.path.exists(MODULE_INDEX_PATH):
+        _index = ModuleIndex.load(MODULE_INDEX_PATH)
+    return _index
+
+
+def used_modules(body: str, index: ModuleIndex):
+    text = STRING.sub('""', COMMENT.sub(' ', body))
+    namespaces = ['']
+    for match in re.finditer(r'(?m)^\s*open\s+([^\n]+)$', text):
+        namespaces.extend(part for part in match.group(1).split() if part[0].isupper())
+    for match in re.finditer(r'(?m)^\s*namespace\s+(\S+)', text):
+        namespaces.append(match.group(1))
+
+    modules = set()
+    for token in set(IDENTIFIER.findall(text)):
+        if token in SYNTAX_MODULES and SYNTAX_MODULES[token] in index.imports:
+            modules.add(SYNTAX_MODULES[token])
+            continue
+        for namespace in namespaces:
+            module = index.declarations.get(f'{namespace}.{token}' if namespace else token)
+            if module is not None:
+                modules.add(module)
+                break
+
+    return {module for module in modules if module.split('.', 1)[0] not in CORE_PACKAGES}
+
+
+def narrow_imports(lean_code: str):
+    """
+    Replace `import Mathlib` with the reduced set of Mathlib modules used by
+    the snippet. Returns (narrowed_code, modules) or None when the snippet
+    does not import the whole library or no index is available.
+    """
+    import_line = re.compile(rf'(?m)^[ \t]*import[ \t]+{FULL_IMPORT}[ \t]*$')
+    if not import_line.search(lean_code):
+        return None
+
+    index = get_module_index()
+    if index is None:
+        return None
+
+    body = import_line.sub('', lean_code)
+    modules = index.reduce(used_modules(body, index))
+    # One line keeps the positions of every following line unchanged.
+    header = f"import {' '.join(modules)}" if modules else ''
+    narrowed_code = import_line.sub(lambda _match: header, lean_code, count=1)
+    narrowed_code = import_line.sub('', narrowed_code)
+    return narrowed_code, modules
@@ -0,0 +1,242 @@
+"""
+lean_messages.py
+~~~~~~~~~~~~~~~~
+Structured diagnostics for the lean worker.
+
+`lean --json` prints one JSON object per message on stdout, in the same
+shape the REPL uses:
+
+    {"severity": "error", "pos": {"line": 3, "column": 2},
+     "endPos": {...}, "fileName": "...", "data": "unsolved goals ..."}
+
+Output is consumed line by line while Lean is still running, so memory and
+CPU stay linear in the output size.  Message bodies are truncated to
+`LEAN_MAX_MESSAGE_CHARS`, at most `LEAN_MAX_MESSAGES_PER_DECLARATION` are kept
+per declaration (plus its first error) and `LEAN_MAX_MESSAGES` overall; the
+rest are only counted.  Messages are attached to declarations through an
+interval index over the declaration start lines.
+
+The complete output (every message in full, plus stderr) is kept in a
+`log_store.LogBuffer`; when the capped result lost anything it is stored on
+the side and referenced by `store_full_log()`.
+"""
+
+import bisect
+import json
+import os
+import subprocess
+import threading
+
+from log_store import LogBuffer, store_log
+from resource_limits import apply_limits, lean_memory_args, limit_violation, wait_with_usage
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+MAX_MESSAGE_CHARS = int(os.environ.get('LEAN_MAX_MESSAGE_CHARS', '4000'))
+MAX_MESSAGES = int(os.environ.get('LEAN_MAX_MESSAGES', '500'))
+MAX_MESSAGES_PER_DECLARATION = int(os.environ.get('LEAN_MAX_MESSAGES_PER_DECLARATION', '20'))
+MAX_FEEDBACK_CHARS = int(os.environ.get('LEAN_MAX_FEEDBACK_CHARS', '65536'))
+
+
+class DeclarationIndex:
+    """Maps a source line to the declaration whose line range contains it."""
+
+    def __init__(self, declarations: list):
+        self.declarations = sorted(declarations, key=lambda declaration: declaration['line'])
+        self.starts = [declaration['line'] for declaration in self.declarations]
+
+    def locate(self, line: int):
+        """Position of the declaration containing *line*, or None before the first one."""
+        position = bisect.bisect_right(self.starts, line) - 1
+        return position if position >= 0 else None
+
+
+class BoundedText:
+    """Keeps the first `limit` characters of a stream and counts the rest."""
+
+    def __init__(self, limit: int = MAX_FEEDBACK_CHARS):
+        self.limit = limit
+        self.parts = []
+        self.size = 0
+        self.dropped = 0
+
+    def append(self, text: str):
+        room = self.limit - self.size
+        if room <= 0:
+            self.dropped += len(text)
+            return
+        kept = text[:room]
+        self.parts.append(kept)
+        self.size += len(kept)
+        self.dropped += len(text) - len(kept)
+
+    def getvalue(self):
+        text = ''.join(self.parts)
+        if self.dropped:
+            text += f'\n... [{self.dropped} characters truncated]'
+        return text
+
+
+class MessageCollector:
+    """Bounded accumulator for the messages of one Lean file."""
+
+    def __init__(self, filename: str, index: DeclarationIndex = None):
+        self.filename = filename
+        self.index = index
+        self.messages = []
+        self.suppressed = 0
+        self.output = BoundedText()
+        self.log = LogBuffer()
+        self.stderr_chars = 0
+        self.truncated = 0
+        self._counts = {}
+        self._has_error = set()
+        # Set for suppressed errors too: the verdict must not depend on the caps.
+        self.error_seen = False
+
+    def add(self, severity: str, line: int, column: int, text: str):
+        text = text.strip()
+        self.log.write(f'{self.filename}:{line}:{column}: {severity}: {text}\n')
+
+        if severity == 'error':
+            self.error_seen = True
+        slot = self.index.locate(line) if self.index is not None else None
+        is_first_error = severity == 'error' and slot not in self._has_error
+        if len(self.messages) >= MAX_MESSAGES or (
+            self._counts.get(slot, 0) >= MAX_MESSAGES_PER_DECLARATION and not is_first_error
+        ):
+            self.suppressed += 1
+            return
+
+        message = {
+            'file': self.filename,
+            'line': line,
+            'column': column,
+            'severity': severity,
+            'message': text[:MAX_MESSAGE_CHARS],
+        }
+        if len(text) > MAX_MESSAGE_CHARS:
+            message['truncated'] = True
+            self.truncated += 1
+
+        self.messages.append(message)
+        self._counts[slot] = self._counts.get(slot, 0) + 1
+        if severity == 'error':
+            self._has_error.add(slot)
+        self.output.append(f"{self.filename}:{line}:{column}: {severity}: {message['message']}\n")
+
+    def add_lean_message(self, raw: dict):
+        position = raw.get('pos') or {}
+        self.add(
+            raw.get('severity', 'error'),
+            position.get('line', 0),
+            position.get('column', 0),
+            raw.get('data') or '',
+        )
+
+    def add_output_line(self, line: str):
+        """Feed one stdout line of `lean --json`; anything that is not a message is kept as text."""
+        stripped = line.strip()
+        if stripped.startswith('{'):
+            try:
+                raw = json.loads(stripped)
+            except json.JSONDecodeError:
+                raw = None
+            if isinstance(raw, dict) and 'severity' in raw:
+                self.add_lean_message(raw)
+                return
+        if stripped:
+            text = line if line.endswith('\n') else line + '\n'
+            self.output.append(text)
+            self.log.write(text)
+
+    def add_stderr_line(self, line: str):
+        self.stderr_chars += len(line)
+        self.log.write(f'[stderr] {line}')
+
+    @property
+    def has_errors(self):
+        return self.error_seen
+
+    def feedback_text(self):
+        text = self.output.getvalue()
+        if self.suppressed:
+            text += f'\n... [{self.suppressed} further messages suppressed]'
+        return text
+
+    @property
+    def lossy(self):
+        """True when the capped messages/feedback are missing part of the output."""
+        return bool(
+            self.suppressed or self.truncated or self.output.dropped or self.stderr_chars > MAX_FEEDBACK_CHARS
+        )
+
+    def store_full_log(self):
+        """Store the complete log when the capped result lost anything; returns its ref or None."""
+        return store_log(self.log.getvalue()) if self.lossy else None
+
+
+def run_lean_json(lean_executable: str, args: list, collector: MessageCollector,
+                  timeout: float, cwd: str = None, env: dict = None):
+    """
+    Run `lean --json <args>` under the configured resource limits and stream
+    its messages into *collector*. Returns (returncode, bounded stderr, usage)
+    where usage holds the child's peak memory and CPU time.
+    Raises subprocess.TimeoutExpired.
+    """
+    process = subprocess.Popen(
+        [lean_executable, '--json', *lean_memory_args(), *args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+        cwd=cwd,
+        env=env,
+    )
+    try:
+        apply_limits(process.pid)
+    except OSError:
+        # The child already exited (e.g. bad arguments); its status is read below.
+        pass
+
+    stderr = BoundedText()
+
+    def read_stderr():
+        for line in process.stderr:
+            stderr.append(line)
+            collector.add_stderr_line(line)
+
+    stderr_reader = threading.Thread(target=read_stderr, daemon=True)
+    stderr_reader.start()
+
+    timed_out = threading.Event()
+
+    def kill():
+        timed_out.set()
+        process.kill()
+
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+    try:
+        for line in process.stdout:
+            collector.add_output_line(line)
+        returncode, usage = wait_with_usage(process)
+    finally:
+        timer.cancel()
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        stderr_reader.join(timeout=5)
+        process.stdout.close()
+        process.stderr.close()
+
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(process.args, timeout)
+
+    violation = limit_violation(returncode)
+    if violation:
+        collector.add('error', 0, 0, violation)
+    return returncode, stderr.getvalue(), usage
@@ -0,0 +1,434 @@
+"""
+lean_repl.py
+~~~~~~~~~~~~
+Pool of long-lived Lean REPL processes (leanprover-community/repl) for the
+lean worker.
+
+Spawning `lean` per snippet re-loads the whole Mathlib environment on every
+request.  A REPL process instead loads an import header once, keeps the
+resulting environment id, and elaborates every following snippet on top of it
+as a plain command:
+
+    {"cmd": "import Mathlib"}                  -> {"env": 0}
+    {"cmd": "theorem t : 1 + 1 = 2 := rfl", "env": 0}
+
+Every command creates a new environment inside the REPL that is never freed,
+so processes are recycled after `LEAN_REPL_MAX_USES` commands, once their
+resident memory exceeds `LEAN_REPL_MAX_RSS_MB`, or once they have loaded
+more than `LEAN_REPL_MAX_HEADERS` distinct import headers.
+
+Loading a header takes minutes, so the pool only serves the headers its
+processes were warmed with; a snippet with other imports raises
+LeanReplUnavailable and is checked by a fresh `lean` instead.
+
+Most payloads also share a definitions prefix (the project's
+`Definitions.lean` inlined ahead of the theorems).  Each process keeps an
+environment snapshot per distinct prefix, so only the differing suffix is
+elaborated on repeated calls.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import selectors
+import shutil
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from resource_limits import apply_limits
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+REPL_POOL_SIZE = int(os.environ.get('LEAN_REPL_POOL_SIZE', '1'))
+REPL_MAX_USES = int(os.environ.get('LEAN_REPL_MAX_USES', '200'))
+REPL_MAX_RSS_MB = int(os.environ.get('LEAN_REPL_MAX_RSS_MB', '6144'))
+REPL_STARTUP_TIMEOUT = int(os.environ.get('LEAN_REPL_STARTUP_TIMEOUT', '300'))
+REPL_MAX_PREFIXES = int(os.environ.get('LEAN_REPL_MAX_PREFIXES', '16'))
+REPL_MAX_HEADERS = int(os.environ.get('LEAN_REPL_MAX_HEADERS', '4'))
+# How long a snippet waits for a free process before falling back to `lean`.
+REPL_ACQUIRE_TIMEOUT = float(os.environ.get('LEAN_REPL_ACQUIRE_TIMEOUT', '10'))
+REPL_PRELOAD_IMPORTS = tuple(
+    module for module in os.environ.get('LEAN_REPL_PRELOAD_IMPORTS', 'Mathlib').split() if module
+)
+
+
+class LeanReplError(Exception):
+    """Raised when a REPL process dies or answers with a protocol error."""
+
+
+class LeanReplTimeout(LeanReplError):
+    """Raised when a REPL command does not answer within its deadline."""
+
+
+class LeanReplUnavailable(LeanReplError):
+    """Raised when no warm pooled process can take the snippet; it was never run."""
+
+
+def find_repl_executable():
+    configured = os.environ.get('LEAN_REPL_PATH')
+    if configured and os.path.exists(configured):
+        return configured
+    return shutil.which('repl')
+
+
+def split_import_header(lean_code: str):
+    """
+    Split Lean source into its import modules and a body that can be sent to
+    a REPL environment which already has those imports loaded.
+
+    Import lines are blanked instead of removed so that line numbers reported
+    by the REPL still match the submitted source.
+    """
+    lines = lean_code.split('\n')
+    modules = []
+
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        if not stripped or stripped.startswith('--'):
+            continue
+        if not stripped.startswith('import '):
+            break
+        modules.extend(part for part in stripped[len('import '):].split() if part)
+        lines[index] = ''
+
+    return tuple(modules), '\n'.join(lines)
+
+
+DECLARATION_START = re.compile(r'^(?:theorem|lemma|example)\b')
+
+
+def split_definitions_prefix(body: str):
+    """
+    Split a REPL body into the shared definitions prefix (everything before
+    the first theorem/lemma/example at column 0, minus its doc comment and
+    attributes) and the remaining suffix.
+
+    The suffix is padded with blank lines so REPL positions still match the
+    submitted source.  Returns ('', body) when there is no usable prefix.
+    """
+    lines = body.split('\n')
+    split_at = next((index for index, line in enumerate(lines) if DECLARATION_START.match(line)), None)
+    if not split_at:
+        return '', body
+
+    while split_at > 0 and lines[split_at - 1].lstrip().startswith('@['):
+        split_at -= 1
+    if split_at > 0 and lines[split_at - 1].strip().endswith('-/'):
+        for index in range(split_at - 1, -1, -1):
+            if lines[index].lstrip().startswith('/-'):
+                split_at = index
+                break
+
+    prefix = '\n'.join(lines[:split_at])
+    if not prefix.strip():
+        return '', body
+    return prefix, '\n' * split_at + '\n'.join(lines[split_at:])
+
+
+def prefix_key(modules: tuple, prefix: str):
+    digest = hashlib.sha256(' '.join(modules).encode('utf-8') + b'\0' + prefix.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class LeanReplProcess:
+    """One `repl` child process plus the environments it has already loaded."""
+
+    def __init__(self, executable: str):
+        self.executable = executable
+        self.process = None
+        self.uses = 0
+        self.header_envs = {}
+        self.prefix_envs = OrderedDict()
+        self._buffer = b''
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [self.executable],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            # Memory limit only: CPU time accumulates over the process lifetime.
+            apply_limits(self.process.pid, cpu_seconds=0)
+        except OSError:
+            pass
+        return self
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def send(self, command: dict, timeout: float):
+        if not self.alive:
+            raise LeanReplError('Lean REPL process is not running')
+
+        try:
+            self.process.stdin.write(json.dumps(command).encode('utf-8') + b'\n\n')
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as error:
+            raise LeanReplError(f'Lean REPL input closed: {error}')
+
+        raw = self._read_response(timeout)
+        try:
+            response = json.loads(raw)
+        except json.JSONDecodeError as error:
+            raise LeanReplError(f'Malformed Lean REPL response: {error}')
+
+        if 'message' in response and 'env' not in response:
+            raise LeanReplError(f"Lean REPL error: {response['message']}")
+        return response
+
+    def _read_response(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        stdout = self.process.stdout
+        selector = selectors.DefaultSelector()
+        selector.register(stdout, selectors.EVENT_READ)
+
+        try:
+            while b'\n\n' not in self._buffer:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LeanReplTimeout(f'Lean REPL did not answer within {timeout} seconds')
+                if not selector.select(remaining):
+                    continue
+                chunk = os.read(stdout.fileno(), 65536)
+                if not chunk:
+                    raise LeanReplError('Lean REPL process exited unexpectedly')
+                self._buffer += chunk
+        finally:
+            selector.close()
+
+        raw, self._buffer = self._buffer.split(b'\n\n', 1)
+        return raw.decode('utf-8', errors='replace')
+
+    def env_for_header(self, modules: tuple, timeout: float = REPL_STARTUP_TIMEOUT):
+        if modules not in self.header_envs:
+            header = '\n'.join(f'import {module}' for module in modules)
+            response = self.send({'cmd': header}, timeout=timeout)
+            errors = [msg for msg in response.get('messages', []) if msg.get('severity') == 'error']
+            if errors:
+                raise LeanReplError(f"Could not load imports {' '.join(modules)}: {errors[0].get('data', '')}")
+            self.header_envs[modules] = response['env']
+        return self.header_envs[modules]
+
+    def env_for_prefix(self, modules: tuple, prefix: str, timeout: float):
+        """
+        Return (env_id, messages) of the snapshot after elaborating *prefix*
+        on top of *modules*, or None when the prefix itself has errors.
+        """
+        key = prefix_key(modules, prefix)
+        if key in self.prefix_envs:
+            self.prefix_envs.move_to_end(key)
+            return self.prefix_envs[key]
+
+        deadline = time.monotonic() + timeout
+        header_env = self.env_for_header(modules, timeout=timeout)
+        response = self.send({'cmd': prefix, 'env': header_env}, timeout=max(1.0, deadline - time.monotonic()))
+        messages = response.get('messages', [])
+        has_errors = any(message.get('severity') == 'error' for message in messages)
+
+        self.prefix_envs[key] = None if has_errors else (response['env'], messages)
+        while len(self.prefix_envs) > REPL_MAX_PREFIXES:
+            self.prefix_envs.popitem(last=False)
+        return self.prefix_envs[key]
+
+    def run(self, modules: tuple, body: str, timeout: float):
+        deadline = time.monotonic() + timeout
+        cpu_before = self.cpu_seconds()
+        prefix, suffix = split_definitions_prefix(body)
+        snapshot = self.env_for_prefix(modules, prefix, timeout) if prefix else None
+        self.uses += 1
+
+        if snapshot is None:
+            header_env = self.env_for_header(modules, timeout=max(1.0, deadline - time.monotonic()))
+            response = self.send({'cmd': body, 'env': header_env}, timeout=max(1.0, deadline - time.monotonic()))
+        else:
+            env_id, prefix_messages = snapshot
+            response = self.send({'cmd': suffix, 'env': env_id}, timeout=max(1.0, deadline - time.monotonic()))
+            response['messages'] = list(prefix_messages) + response.get('messages', [])
+
+        # The process is shared, so the resident size after the command stands
+        # in for the peak of this job.
+        response['usage'] = {
+            'peak_memory_mb': round(self.rss_mb(), 1),
+            'cpu_time_seconds': round(self.cpu_seconds() - cpu_before, 3),
+        }
+        return response
+
+    def cpu_seconds(self):
+        try:
+            with open(f'/proc/{self.process.pid}/stat', 'r', encoding='utf-8') as handle:
+                fields = handle.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        except (OSError, ValueError, IndexError, AttributeError):
+            return 0.0
+
+    def rss_mb(self):
+        try:
+            with open(f'/proc/{self.process.pid}/status', 'r', encoding='utf-8') as handle:
+                for line in handle:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) / 1024
+        except (OSError, ValueError, AttributeError):
+            pass
+        return 0.0
+
+    def should_recycle(self):
+        if not self.alive:
+            return True
+        if REPL_MAX_USES and self.uses >= REPL_MAX_USES:
+            return True
+        if REPL_MAX_HEADERS and len(self.header_envs) > REPL_MAX_HEADERS:
+            return True
+        return bool(REPL_MAX_RSS_MB) and self.rss_mb() > REPL_MAX_RSS_MB
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.kill()
+            self.process.wait(timeout=5)
+        except Exception:
+            pass
+        self.process = None
+
+
+class LeanReplPool:
+    """Thread-safe pool of warm REPL processes shared by one worker process."""
+
+    def __init__(self, executable: str, size: int):
+        self.executable = executable
+        self.size = size
+        self._idle = []
+        self._total = 0
+        self._headers = set()
+        self._condition = threading.Condition()
+
+    def serves(self, modules: tuple):
+        """True when the pool's processes are warmed with the header *modules*."""
+        with self._condition:
+            return modules in self._headers
+
+    def warm_up(self, modules: tuple = REPL_PRELOAD_IMPORTS):
+        with self._condition:
+            self._headers.add(modules)
+            missing = self.size - self._total
+            self._total += missing
+        for _ in range(missing):
+            threading.Thread(target=self._spawn_idle, args=(modules,), daemon=True).start()
+
+    def _spawn_idle(self, modules: tuple):
+        repl = LeanReplProcess(self.executable)
+        try:
+            repl.start()
+            repl.env_for_header(modules)
+        except LeanReplError as error:
+            logger.warning('Lean REPL warm-up failed: %s', error)
+            repl.close()
+            with self._condition:
+                self._total -= 1
+                self._condition.notify()
+            return
+
+        with self._condition:
+            self._idle.append(repl)
+            self._condition.notify()
+
+    def _acquire(self, modules: tuple, affinity: str, timeout: float):
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            if modules not in self._headers:
+                raise LeanReplUnavailable(f"No warm Lean REPL process has imports {' '.join(modules)}")
+            if self._total < self.size:
+                # Replace processes whose warm-up failed, off the request path.
+                self.warm_up(modules)
+            while True:
+                preferred = [repl for repl in self._idle if affinity in repl.prefix_envs]
+                preferred += [repl for repl in self._idle if modules in repl.header_envs]
+                if preferred:
+                    self._idle.remove(preferred[0])
+                    return preferred[0]
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LeanReplUnavailable('No warm Lean REPL process became available')
+                self._condition.wait(remaining)
+
+    def _release(self, repl: LeanReplProcess, broken: bool):
+        if broken or repl.should_recycle():
+            repl.close()
+            with self._condition:
+                self._total -= 1
+                self._condition.notify()
+            self.warm_up()
+            return
+
+        with self._condition:
+            self._idle.append(repl)
+            self._condition.notify()
+
+    @contextmanager
+    def lease(self, modules: tuple, timeout: float, affinity: str = ''):
+        repl = self._acquire(modules, affinity, timeout)
+        broken = False
+        try:
+            yield repl
+        except BaseException:
+            # Includes a revoked task interrupting a command mid-response.
+            broken = True
+            raise
+        finally:
+            self._release(repl, broken or not repl.alive)
+
+    def run(self, modules: tuple, body: str, timeout: float):
+        prefix, _suffix = split_definitions_prefix(body)
+        affinity = prefix_key(modules, prefix) if prefix else ''
+        with self.lease(modules, min(timeout, REPL_ACQUIRE_TIMEOUT), affinity) as repl:
+            return repl.run(modules, body, timeout)
+
+    def close(self):
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+        for repl in idle:
+            repl.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_repl_missing = False
+
+
+def get_repl_pool():
+    """Return the process-wide REPL pool, or None when pooling is unavailable."""
+    global _pool, _repl_missing
+    if REPL_POOL_SIZE <= 0 or _repl_missing:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            executable = find_repl_executable()
+            if not executable:
+                _repl_missing = True
+                logger.info('Lean REPL executable not found; using one lean process per snippet.')
+                return None
+            _pool = LeanReplPool(executable, REPL_POOL_SIZE)
+        return _pool
+
+
+def close_repl_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
@@ -1,9 +1,33 @@
 import hashlib
+import logging
 import re
 import subprocess
 import tempfile
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+from lean_messages import DeclarationIndex, MessageCollector, run_lean_json
+from lean_units import plan_chunks
+from lean_repl import LeanReplError, LeanReplTimeout, get_repl_pool, split_import_header
+from import_minimizer import narrow_imports
+from olean_cache import build_imported_modules, parse_imports
+from resource_limits import merge_usage
+from workspace_pool import get_workspace_pool
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+PARALLEL_WORKERS = int(os.environ.get("LEAN_PARALLEL_WORKERS", str(os.cpu_count() or 1)))
+PARALLEL_MIN_DECLARATIONS = int(os.environ.get("LEAN_PARALLEL_MIN_DECLARATIONS", "8"))
+# Every cold `lean` process re-imports its header; for these (and their
+# submodules) that costs more than the parallel check saves.
+PARALLEL_EXPENSIVE_IMPORTS = tuple(
+    module for module in os.environ.get("LEAN_PARALLEL_EXPENSIVE_IMPORTS", "Mathlib").split() if module
+)
 
 
 def find_lean_executable():
@@ -58,33 +82,215 @@ def parse_theorem_info(lean_code: str):
     return theorems
 
 
-def parse_lean_messages(stdout: str, stderr: str, filename: str = "proof.lean"):
-    messages = []
+def build_proof_result(index, hashed_filename, return_code, collector, stderr, start_time, usage=None):
+    theorems_with_details = [
+        {
+            "name": theorem["name"],
+            "type": theorem["type"],
+            "location": f"{hashed_filename}:{theorem['line']}:{theorem['column']}",
+            "line": theorem["line"],
+            "column": theorem["column"],
+            "messages": [],
+        }
+        for theorem in index.declarations
+    ]
+
+    for message in collector.messages:
+        position = index.locate(message["line"])
+        if position is not None:
+            theorems_with_details[position]["messages"].append(message)
+
+    end_time = time.time()
+    return {
+        "verified": return_code == 0,
+        "returnCode": return_code,
+        "theorems": theorems_with_details,
+        "messages": collector.messages,
+        "suppressedMessages": collector.suppressed,
+        "feedback": {
+            "stdout": collector.feedback_text().strip(),
+            "stderr": stderr.strip(),
+        },
+        "logRef": collector.store_full_log(),
+        "peakMemoryMb": (usage or {}).get("peak_memory_mb", 0.0),
+        "cpuTimeSeconds": (usage or {}).get("cpu_time_seconds", 0.0),
+        "processingTimeSeconds": round(end_time - start_time, 3),
+    }
+
 
-    error_pattern = re.compile(
-        r"([^:]+):(\d+):(\d+):\s*(error|warning|info):\s*(.*?)(?=\n[^\s]|\Z)",
-        re.DOTALL,
+def imports_are_cheap(modules):
+    """True when no module is (a submodule of) one of `LEAN_PARALLEL_EXPENSIVE_IMPORTS`."""
+    return not any(
+        module == expensive or module.startswith(expensive + ".")
+        for module in modules
+        for expensive in PARALLEL_EXPENSIVE_IMPORTS
     )
 
-    combined_output = stderr + "\n" + stdout
-
-    for match in error_pattern.finditer(combined_output):
-        line = int(match.group(2))
-        column = int(match.group(3))
-        severity = match.group(4)
-        message = match.group(5).strip()
-
-        messages.append(
-            {
-                "file": filename,
-                "line": line,
-                "column": column,
-                "severity": severity,
-                "message": message,
-            }
-        )
 
-    return messages
+def _chunk_owners(chunks):
+    """Map every line of an owned unit to the index of the chunk that owns it."""
+    owner = {}
+    for chunk_index, (_source, owned) in enumerate(chunks):
+        for first_line, last_line in owned:
+            for line in range(first_line, last_line + 1):
+                owner[line] = chunk_index
+    return owner
+
+
+def _merge_chunk_collectors(label, index, chunks, collectors):
+    """One collector with the messages of every unit, taken from the chunk that owns it."""
+    owner = _chunk_owners(chunks)
+    merged = MessageCollector(label, index)
+    seen = set()
+    candidates = []
+    for chunk_index, collector in enumerate(collectors):
+        for message in collector.messages:
+            if owner.get(message["line"], chunk_index) != chunk_index:
+                continue
+            key = (message["line"], message["column"], message["severity"], message["message"])
+            if key not in seen:
+                seen.add(key)
+                candidates.append(message)
+        merged.suppressed += collector.suppressed
+        # A chunk past its message cap may have dropped an error it saw.
+        merged.error_seen |= collector.error_seen
+
+    for message in sorted(candidates, key=lambda item: (item["line"], item["column"])):
+        merged.add(message["severity"], message["line"], message["column"], message["message"])
+    return merged
+
+
+def check_declarations_parallel(lean_executable, lean_code, label, work_dir, index, timeout, modules, env=None):
+    """
+    Check the declarations of *lean_code* on up to `LEAN_PARALLEL_WORKERS`
+    concurrent `lean` processes. Returns (return_code, collector, stderr,
+    usage, chunk_count), or None when the file is too small, cannot be split,
+    or imports *modules* too expensive to load once per process.
+    Raises subprocess.TimeoutExpired when any chunk times out.
+    """
+    if PARALLEL_WORKERS < 2 or len(index.declarations) < PARALLEL_MIN_DECLARATIONS:
+        return None
+    if not imports_are_cheap(modules):
+        return None
+    chunks = plan_chunks(lean_code, PARALLEL_WORKERS)
+    if chunks is None:
+        return None
+
+    chunk_dir = tempfile.mkdtemp(prefix=".parallel_", dir=work_dir)
+
+    def check_chunk(chunk_index):
+        chunk_path = os.path.join(chunk_dir, f"chunk_{chunk_index}.lean")
+        with open(chunk_path, "w", encoding="utf-8") as file_handle:
+            file_handle.write(chunks[chunk_index][0])
+        collector = MessageCollector(label)
+        return run_lean_json(
+            lean_executable, [chunk_path], collector, timeout=timeout, cwd=work_dir, env=env,
+        ) + (collector,)
+
+    with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+        outcomes = list(executor.map(check_chunk, range(len(chunks))))
+
+    merged = _merge_chunk_collectors(label, index, chunks, [collector for *_rest, collector in outcomes])
+    codes = [code for code, _stderr, _usage, _collector in outcomes]
+    # A chunk stopped by a signal outranks an ordinary elaboration failure.
+    return_code = next((code for code in codes if code < 0), max(codes))
+    stderr = "\n".join(chunk_stderr for _code, chunk_stderr, _usage, _collector in outcomes if chunk_stderr.strip())
+    usage = merge_usage([chunk_usage for _code, _stderr, chunk_usage, _collector in outcomes], concurrent=True)
+    return return_code, merged, stderr, usage, len(chunks)
+
+
+def check_declarations_on_pool(pool, lean_code, label, index, timeout):
+    """
+    Check the declarations of *lean_code* as chunks on the processes of the
+    REPL *pool*, which already hold the import header. Returns (collector,
+    usage, chunk_count), or None when the pool has a single process or the
+    file is too small or cannot be split. Raises LeanReplError.
+    """
+    if pool.size < 2 or len(index.declarations) < PARALLEL_MIN_DECLARATIONS:
+        return None
+    chunks = plan_chunks(lean_code, pool.size)
+    if chunks is None:
+        return None
+
+    def check_chunk(chunk_index):
+        modules, body = split_import_header(chunks[chunk_index][0])
+        return pool.run(modules, body, timeout=timeout)
+
+    with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+        responses = list(executor.map(check_chunk, range(len(chunks))))
+
+    collectors = []
+    for response in responses:
+        collector = MessageCollector(label)
+        for repl_message in response.get("messages", []):
+            collector.add_lean_message(repl_message)
+        collectors.append(collector)
+    merged = _merge_chunk_collectors(label, index, chunks, collectors)
+    usage = merge_usage([response.get("usage") or {} for response in responses], concurrent=True)
+    return merged, usage, len(chunks)
+
+
+def verify_with_repl_pool(lean_code: str, hashed_filename: str, start_time: float, timeout: int = 60):
+    """
+    Check a snippet on a warm REPL process (large files are split over the
+    pool's processes). Returns None when no pool is available or the pool
+    failed, so the caller falls back to a fresh `lean`.
+    """
+    pool = get_repl_pool()
+    if pool is None:
+        return None
+
+    index = DeclarationIndex(parse_theorem_info(lean_code))
+    modules, body = split_import_header(lean_code)
+    try:
+        pooled = check_declarations_on_pool(pool, lean_code, hashed_filename, index, timeout)
+        if pooled is not None:
+            collector, usage, chunk_count = pooled
+            result = build_proof_result(
+                index, hashed_filename, 1 if collector.has_errors else 0, collector, "", start_time, usage,
+            )
+            result["parallelChunks"] = chunk_count
+            return result
+        response = pool.run(modules, body, timeout=timeout)
+    except LeanReplTimeout:
+        end_time = time.time()
+        return {
+            "verified": False,
+            "returnCode": -1,
+            "theorems": [],
+            "messages": [
+                {
+                    "file": hashed_filename,
+                    "line": 0,
+                    "column": 0,
+                    "severity": "error",
+                    "message": f"Verification timeout after {timeout} seconds",
+                }
+            ],
+            "feedback": {
+                "stdout": "",
+                "stderr": f"Verification timeout after {timeout} seconds",
+            },
+            "processingTimeSeconds": round(end_time - start_time, 3),
+        }
+    except LeanReplError as error:
+        # Includes LeanReplUnavailable: every process busy or still warming up,
+        # or the snippet imports a header no warm process has loaded.
+        logger.warning("Lean REPL pool failed, falling back to lean subprocess: %s", error)
+        return None
+
+    collector = MessageCollector(hashed_filename, index)
+    for repl_message in response.get("messages", []):
+        collector.add_lean_message(repl_message)
+    return build_proof_result(
+        index,
+        hashed_filename,
+        1 if collector.has_errors else 0,
+        collector,
+        "",
+        start_time,
+        response.get("usage"),
+    )
 
 
 def verify_lean_proof(lean_code: str, filename: str = "proof.lean"):
@@ -113,60 +319,50 @@ def verify_lean_proof(lean_code: str, filename: str = "proof.lean"):
             "processingTimeSeconds": round(end_time - start_time, 3),
         }
 
-    timestamp = str(time.time()).encode("utf-8")
-    code_hash = hashlib.sha256(lean_code.encode("utf-8") + timestamp).hexdigest()[:16]
+    code_hash = hashlib.sha256(lean_code.encode("utf-8")).hexdigest()[:16]
     base_filename = filename.rsplit(".", 1)[0] if "." in filename else filename
     hashed_filename = f"{base_filename}_{code_hash}.lean"
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        lean_file_path = os.path.join(temp_dir, hashed_filename)
+    # The warm pool beats cold parallel processes, which re-import the header each.
+    pooled_result = verify_with_repl_pool(lean_code, hashed_filename, start_time)
+    if pooled_result is not None:
+        return pooled_result
+
+    index = DeclarationIndex(parse_theorem_info(lean_code))
+    modules, _body = split_import_header(lean_code)
 
-        with open(lean_file_path, "w", encoding="utf-8") as file_handle:
-            file_handle.write(lean_code)
+    with get_workspace_pool().lease() as workspace:
+        temp_dir = workspace.path
+        lean_file_path = os.path.join(temp_dir, hashed_filename)
+        workspace.sync({hashed_filename: lean_code})
 
         try:
-            result = subprocess.run(
-                [lean_executable, lean_file_path],
-                capture_output=True,
-                text=True,
+            parallel = check_declarations_parallel(
+                lean_executable, lean_code, hashed_filename, temp_dir, index, 60, modules,
+            )
+            if parallel is not None:
+                return_code, collector, stderr, usage, chunk_count = parallel
+                result = build_proof_result(index, hashed_filename, return_code, collector, stderr, start_time, usage)
+                result["parallelChunks"] = chunk_count
+                return result
+
+            collector = MessageCollector(hashed_filename, index)
+            return_code, stderr, usage = run_lean_json(
+                lean_executable,
+                [lean_file_path],
+                collector,
                 timeout=60,
                 cwd=temp_dir,
             )
-
-            verified = result.returncode == 0
-            end_time = time.time()
-
-            all_messages = parse_lean_messages(result.stdout, result.stderr, hashed_filename)
-            theorems = parse_theorem_info(lean_code)
-            theorems_with_details = []
-
-            for theorem in theorems:
-                theorem_messages = [
-                    msg for msg in all_messages if msg["line"] == theorem["line"]
-                ]
-                location = f"{hashed_filename}:{theorem['line']}:{theorem['column']}"
-                theorems_with_details.append(
-                    {
-                        "name": theorem["name"],
-                        "type": theorem["type"],
-                        "location": location,
-                        "line": theorem["line"],
-                        "column": theorem["column"],
-                        "messages": theorem_messages,
-                    }
-                )
-
-            return {
-                "verified": verified,
-                "returnCode": result.returncode,
-                "theorems": theorems_with_details,
-                "messages": all_messages,
-                "feedback": {
-                    "stdout": result.stdout.strip(),
-                    "stderr": result.stderr.strip(),
-                },
-                "processingTimeSeconds": round(end_time - start_time, 3),
-            }
+            return build_proof_result(
+                index,
+                hashed_filename,
+                return_code,
+                collector,
+                stderr,
+                start_time,
+                usage,
+            )
 
         except subprocess.TimeoutExpired:
             end_time = time.time()
@@ -176,7 +372,7 @@ def verify_lean_proof(lean_code: str, filename: str = "proof.lean"):
                 "theorems": [],
                 "messages": [
                     {
-                        "file": filename,
+                        "file": hashed_filename,
                         "line": 0,
                         "column": 0,
                         "severity": "error",
@@ -197,7 +393,7 @@ def verify_lean_proof(lean_code: str, filename: str = "proof.lean"):
                 "theorems": [],
                 "messages": [
                     {
-                        "file": filename,
+                        "file": hashed_filename,
                         "line": 0,
                         "column": 0,
                         "severity": "error",
@@ -218,7 +414,7 @@ def verify_lean_proof(lean_code: str, filename: str = "proof.lean"):
                 "theorems": [],
                 "messages": [
                     {
-                        "file": filename,
+                        "file": hashed_filename,
                         "line": 0,
                         "column": 0,
                         "severity": "error",
@@ -233,8 +429,40 @@ def verify_lean_proof(lean_code: str, filename: str = "proof.lean"):
             }
 
 
-def to_compiler_snippet_response(lean_code: str, filename: str = "snippet.lean"):
-    result = verify_lean_proof(lean_code, filename)
+def verify_with_minimized_imports(lean_code: str, filename: str):
+    """
+    Check the snippet with `import Mathlib` narrowed to the modules it uses,
+    falling back to the full import when the narrowed check fails.
+    When a warm REPL process already holds the full header, the snippet is
+    checked there as submitted and the narrowed set is only reported.
+    Returns (result, minimization_report).
+    """
+    narrowed = narrow_imports(lean_code)
+    if narrowed is None:
+        return verify_lean_proof(lean_code, filename), {"status": "not_applicable", "imports": None}
+
+    narrowed_code, modules = narrowed
+    pool = get_repl_pool()
+    if pool is not None and pool.serves(split_import_header(lean_code)[0]):
+        return verify_lean_proof(lean_code, filename), {"status": "suggested", "imports": modules}
+
+    result = verify_lean_proof(narrowed_code, filename)
+    if result.get("verified"):
+        return result, {"status": "narrowed", "imports": modules}
+
+    fallback = verify_lean_proof(lean_code, filename)
+    fallback["processingTimeSeconds"] = round(
+        fallback.get("processingTimeSeconds", 0.0) + result.get("processingTimeSeconds", 0.0), 3
+    )
+    return fallback, {"status": "fallback", "imports": None}
+
+
+def to_compiler_snippet_response(lean_code: str, filename: str = "snippet.lean", minimize_imports: bool = False):
+    minimization = None
+    if minimize_imports:
+        result, minimization = verify_with_minimized_imports(lean_code, filename)
+    else:
+        result = verify_lean_proof(lean_code, filename)
     errors = [
         {
             "line": message.get("line", 0),
@@ -245,14 +473,23 @@ def to_compiler_snippet_response(lean_code: str, filename: str = "snippet.lean")
         if message.get("severity") == "error"
     ]
 
-    return {
+    response = {
         "valid": result.get("verified", False),
         "errors": errors,
         "processing_time_seconds": result.get("processingTimeSeconds", 0.0),
         "return_code": result.get("returnCode", -1),
         "message_count": len(result.get("messages", [])),
         "theorem_count": len(result.get("theorems", [])),
+        "suppressed_message_count": result.get("suppressedMessages", 0),
+        "peak_memory_mb": result.get("peakMemoryMb", 0.0),
+        "cpu_time_seconds": result.get("cpuTimeSeconds", 0.0),
     }
+    if result.get("logRef"):
+        response["log_ref"] = result["logRef"]
+    if minimization is not None:
+        response["import_minimization"] = minimization["status"]
+        response["narrowed_imports"] = minimization["imports"]
+    return response
 
 
 def verify_lean_project(file_map: dict, entry_file: str):
@@ -280,68 +517,122 @@ def verify_lean_project(file_map: dict, entry_file: str):
             "processingTimeSeconds": round(end_time - start_time, 3),
         }
 
-    with tempfile.TemporaryDirectory() as temp_dir:
+    with get_workspace_pool().lease() as workspace:
+        temp_dir = workspace.path
+        safe_file_map = {}
         for rel_path, content in file_map.items():
             safe_rel_path = rel_path.strip().lstrip("/")
-            full_path = os.path.join(temp_dir, safe_rel_path)
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
-            with open(full_path, "w", encoding="utf-8") as file_handle:
-                file_handle.write(content)
-
+            safe_file_map[safe_rel_path] = content
         safe_entry_file = entry_file.strip().lstrip('/').replace('\\', '/')
-        entry_path = os.path.join(temp_dir, safe_entry_file)
-        if not os.path.exists(entry_path):
-            end_time = time.time()
-            return {
-                "verified": False,
-                "returnCode": -1,
-                "theorems": [],
-                "messages": [
-                    {
-                        "file": safe_entry_file,
-                        "line": 0,
-                        "column": 0,
-                        "severity": "error",
-                        "message": f"Entry file not found in payload: {safe_entry_file}",
-                    }
-                ],
-                "feedback": {
-                    "stdout": "",
-                    "stderr": f"Entry file not found in payload: {safe_entry_file}",
-                },
-                "processingTimeSeconds": round(end_time - start_time, 3),
-            }
 
         try:
+            # Rejects paths that escape the workspace (ValueError, reported below).
+            workspace.sync(safe_file_map)
+            entry_path = os.path.join(temp_dir, safe_entry_file)
+            if not os.path.exists(entry_path):
+                end_time = time.time()
+                return {
+                    "verified": False,
+                    "returnCode": -1,
+                    "theorems": [],
+                    "messages": [
+                        {
+                            "file": safe_entry_file,
+                            "line": 0,
+                            "column": 0,
+                            "severity": "error",
+                            "message": f"Entry file not found in payload: {safe_entry_file}",
+                        }
+                    ],
+                    "feedback": {
+                        "stdout": "",
+                        "stderr": f"Entry file not found in payload: {safe_entry_file}",
+                    },
+                    "processingTimeSeconds": round(end_time - start_time, 3),
+                }
+
+            build_dir = os.path.join(temp_dir, ".olean")
             env = os.environ.copy()
             existing_lean_path = env.get("LEAN_PATH", "")
-            env["LEAN_PATH"] = f"{temp_dir}:{existing_lean_path}" if existing_lean_path else temp_dir
-
-            result = subprocess.run(
-                [lean_executable, safe_entry_file],
-                capture_output=True,
-                text=True,
+            env["LEAN_PATH"] = f"{build_dir}:{existing_lean_path}" if existing_lean_path else build_dir
+
+            build = build_imported_modules(
+                lean_executable,
+                temp_dir,
+                build_dir,
+                safe_file_map,
+                safe_entry_file,
+                env,
                 timeout=90,
-                cwd=temp_dir,
-                env=env,
             )
+            modules_report = {
+                "built": build["built"],
+                "reused": build["reused"],
+            }
 
-            verified = result.returncode == 0
-            end_time = time.time()
+            failed = build["failed"]
+            if failed is not None:
+                end_time = time.time()
+                return {
+                    "verified": False,
+                    "returnCode": failed["returncode"],
+                    "theorems": [],
+                    "messages": failed["messages"],
+                    "suppressedMessages": failed["suppressed"],
+                    "feedback": {
+                        "stdout": failed["stdout"].strip(),
+                        "stderr": failed["stderr"].strip(),
+                    },
+                    "modules": dict(modules_report, failed=failed["file"]),
+                    "logRef": failed["log_ref"],
+                    "peakMemoryMb": build["usage"]["peak_memory_mb"],
+                    "cpuTimeSeconds": build["usage"]["cpu_time_seconds"],
+                    "processingTimeSeconds": round(end_time - start_time, 3),
+                }
 
-            messages = parse_lean_messages(result.stdout, result.stderr, safe_entry_file)
-            theorem_scan_code = file_map.get(safe_entry_file, "")
+            theorem_scan_code = safe_file_map.get(safe_entry_file, "")
             theorems = parse_theorem_info(theorem_scan_code)
+            index = DeclarationIndex(theorems)
+            remaining = max(1.0, 90 - (time.time() - start_time))
+            # Payload modules come prebuilt, but their own imports are loaded by every process.
+            payload_imports = [module for content in safe_file_map.values() for module in parse_imports(content)]
+            parallel = check_declarations_parallel(
+                lean_executable, theorem_scan_code, safe_entry_file, temp_dir, index, remaining,
+                payload_imports, env=env,
+            )
+            chunk_count = 0
+            if parallel is not None:
+                return_code, collector, stderr, usage, chunk_count = parallel
+            else:
+                collector = MessageCollector(safe_entry_file, index)
+                return_code, stderr, usage = run_lean_json(
+                    lean_executable,
+                    [safe_entry_file],
+                    collector,
+                    timeout=remaining,
+                    cwd=temp_dir,
+                    env=env,
+                )
+
+            verified = return_code == 0
+            end_time = time.time()
+            usage = merge_usage([build["usage"], usage])
 
             return {
                 "verified": verified,
-                "returnCode": result.returncode,
+                "returnCode": return_code,
                 "theorems": theorems,
-                "messages": messages,
+                "messages": collector.messages,
+                "suppressedMessages": collector.suppressed,
                 "feedback": {
-                    "stdout": result.stdout.strip(),
-                    "stderr": result.stderr.strip(),
+                    "stdout": collector.feedback_text().strip(),
+                    "stderr": stderr.strip(),
                 },
+                "modules": modules_report,
+                "logRef": collector.store_full_log(),
+                "parallelChunks": chunk_count,
+                "peakMemoryMb": usage["peak_memory_mb"],
+                "cpuTimeSeconds": usage["cpu_time_seconds"],
                 "processingTimeSeconds": round(end_time - start_time, 3),
             }
         except subprocess.TimeoutExpired:
@@ -400,13 +691,23 @@ def to_compiler_project_response(file_map: dict, entry_file: str):
         if message.get("severity") == "error"
     ]
 
-    return {
+    modules = result.get("modules") or {}
+    response = {
         "valid": result.get("verified", False),
         "errors": errors,
         "processing_time_seconds": result.get("processingTimeSeconds", 0.0),
         "return_code": result.get("returnCode", -1),
         "message_count": len(result.get("messages", [])),
         "theorem_count": len(result.get("theorems", [])),
+        "suppressed_message_count": result.get("suppressedMessages", 0),
+        "peak_memory_mb": result.get("peakMemoryMb", 0.0),
+        "cpu_time_seconds": result.get("cpuTimeSeconds", 0.0),
+        "modules_built": len(modules.get("built", [])),
+        "modules_reused": len(modules.get("reused", [])),
+        "failed_module": modules.get("failed"),
     }
+    if result.get("logRef"):
+        response["log_ref"] = result["logRef"]
+    return response
 
 
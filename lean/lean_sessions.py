@@ -0,0 +1,361 @@
+"""
+lean_sessions.py
+~~~~~~~~~~~~~~~~
+Incremental verification sessions for edit-as-you-type checking.
+
+A session owns one REPL process and the chain of environments obtained by
+elaborating its source one block at a time (blocks as in
+`lean_units.split_blocks`, one per top-level command):
+
+    imports -> env after block 1 -> env after block 2 -> ...
+
+On every update the new source is split the same way, the leading blocks
+whose text did not change keep their environments and messages, and only
+the blocks from the first changed one onward are sent to the REPL again.
+A small edit in the last theorem therefore re-elaborates that theorem only.
+
+Sessions live in the memory of one worker process.  The session worker runs
+with the threads pool and `worker_direct`, and every response carries the
+`worker` holding the session so follow-up calls can be routed to it.  At most
+`LEAN_MAX_SESSIONS` are kept per worker; sessions idle for longer than
+`LEAN_SESSION_IDLE_SECONDS` are closed, and opening a session beyond the cap
+closes the least recently used idle one.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from lean_messages import DeclarationIndex, MessageCollector
+from lean_repl import (
+    REPL_PRELOAD_IMPORTS,
+    LeanReplError,
+    LeanReplProcess,
+    LeanReplTimeout,
+    find_repl_executable,
+    split_import_header,
+)
+from lean_units import split_blocks
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+MAX_SESSIONS = int(os.environ.get('LEAN_MAX_SESSIONS', '8'))
+SESSION_IDLE_SECONDS = int(os.environ.get('LEAN_SESSION_IDLE_SECONDS', '600'))
+SESSION_SPARES = int(os.environ.get('LEAN_SESSION_SPARES', '1'))
+SESSION_TIMEOUT = int(os.environ.get('LEAN_SESSION_TIMEOUT', '60'))
+
+
+class SessionNotFound(Exception):
+    """Raised for unknown, closed or evicted session ids."""
+
+
+class SessionLimitReached(Exception):
+    """Raised when every session slot of this worker is busy."""
+
+
+def source_blocks(body: str):
+    """[(first line index, text)] of the top-level commands of *body*."""
+    split = split_blocks(body)
+    if split is None:
+        return [(0, body)]
+    lines, blocks = split
+    return [(block['start'], '\n'.join(lines[block['start']:block['end']])) for block in blocks]
+
+
+class LeanSession:
+    """One edit session: a REPL process plus the per-block environment chain."""
+
+    def __init__(self, session_id: str, repl: LeanReplProcess):
+        self.session_id = session_id
+        self.repl = repl
+        self.modules = None
+        self.snapshots = []
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.closed = False
+
+    def _restart(self):
+        self.repl.close()
+        self.repl = LeanReplProcess(self.repl.executable).start()
+        self.snapshots = []
+
+    def update(self, lean_code: str, timeout: float = SESSION_TIMEOUT):
+        """
+        Re-check *lean_code*, reusing the environments of its unchanged
+        leading blocks. Returns (messages, stats) where messages are REPL
+        messages with absolute positions.
+        Raises LeanReplTimeout / LeanReplError; the process is restarted then.
+        """
+        deadline = time.monotonic() + timeout
+        cpu_before = self.repl.cpu_seconds()
+        modules, body = split_import_header(lean_code)
+        blocks = source_blocks(body)
+
+        if not self.repl.alive or self.repl.should_recycle():
+            self._restart()
+        if modules != self.modules:
+            self.snapshots = []
+            self.modules = modules
+
+        reused = 0
+        while (reused < min(len(self.snapshots), len(blocks))
+               and self.snapshots[reused]['text'] == blocks[reused][1]):
+            reused += 1
+        del self.snapshots[reused:]
+        self.repl.uses += 1
+
+        try:
+            if self.snapshots:
+                env = self.snapshots[-1]['env']
+            else:
+                env = self.repl.env_for_header(modules, timeout=max(1.0, deadline - time.monotonic()))
+            for _start, text in blocks[reused:]:
+                messages = []
+                if text.strip():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise LeanReplTimeout(f'Session check did not finish within {timeout} seconds')
+                    response = self.repl.send({'cmd': text, 'env': env}, timeout=remaining)
+                    env = response['env']
+                    messages = response.get('messages', [])
+                self.snapshots.append({'text': text, 'env': env, 'messages': messages})
+        except LeanReplError:
+            self._restart()
+            raise
+
+        messages = []
+        for (start, _text), snapshot in zip(blocks, self.snapshots):
+            for message in snapshot['messages']:
+                position = message.get('pos') or {}
+                messages.append({**message, 'pos': {**position, 'line': position.get('line', 1) + start}})
+
+        stats = {
+            'reused_blocks': reused,
+            'rechecked_blocks': len(blocks) - reused,
+            'rechecked_from_line': blocks[reused][0] + 1 if reused < len(blocks) else None,
+            'peak_memory_mb': round(self.repl.rss_mb(), 1),
+            'cpu_time_seconds': round(self.repl.cpu_seconds() - cpu_before, 3),
+        }
+        return messages, stats
+
+    def close(self):
+        self.closed = True
+        self.repl.close()
+
+
+class SessionRegistry:
+    """Sessions of one worker process, with idle eviction and a size cap."""
+
+    def __init__(self, executable: str, max_sessions: int, idle_seconds: int, spares: int):
+        self.executable = executable
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.spares = spares
+        self._sessions = OrderedDict()
+        self._spare_processes = []
+        self._spawning = 0
+        self._lock = threading.Lock()
+        threading.Thread(target=self._reap_forever, daemon=True).start()
+
+    def warm_up(self):
+        """Keep `LEAN_SESSION_SPARES` REPL processes with the preloaded imports ready."""
+        with self._lock:
+            missing = self.spares - len(self._spare_processes) - self._spawning
+            self._spawning += max(0, missing)
+        for _ in range(missing):
+            threading.Thread(target=self._spawn_spare, daemon=True).start()
+
+    def _spawn_spare(self):
+        repl = LeanReplProcess(self.executable)
+        try:
+            repl.start()
+            repl.env_for_header(REPL_PRELOAD_IMPORTS)
+        except LeanReplError as error:
+            logger.warning('Lean session warm-up failed: %s', error)
+            repl.close()
+            repl = None
+        with self._lock:
+            self._spawning -= 1
+            if repl is not None:
+                self._spare_processes.append(repl)
+
+    def _take_process(self):
+        with self._lock:
+            repl = self._spare_processes.pop() if self._spare_processes else None
+        self.warm_up()
+        return repl if repl is not None and repl.alive else LeanReplProcess(self.executable).start()
+
+    def _evict(self, idle_only: bool):
+        """
+        Close the sessions idle for longer than the limit, or with
+        idle_only=False the least recently used one that is not busy.
+        Returns how many were closed.
+        """
+        now = time.monotonic()
+        victims = []
+        with self._lock:
+            for session_id, session in list(self._sessions.items()):
+                if idle_only and now - session.last_used < self.idle_seconds:
+                    continue
+                if not session.lock.acquire(blocking=False):
+                    continue
+                del self._sessions[session_id]
+                victims.append(session)
+                if not idle_only:
+                    break
+        for session in victims:
+            logger.info('Closing Lean session %s', session.session_id)
+            session.close()
+            session.lock.release()
+        return len(victims)
+
+    def _reap_forever(self):
+        while True:
+            time.sleep(max(5, self.idle_seconds // 4))
+            try:
+                self._evict(idle_only=True)
+            except Exception:
+                logger.exception('Lean session eviction failed')
+
+    def open(self):
+        self._evict(idle_only=True)
+        with self._lock:
+            full = len(self._sessions) >= self.max_sessions
+        if full and not self._evict(idle_only=False):
+            raise SessionLimitReached(f'All {self.max_sessions} Lean sessions of this worker are busy')
+
+        session = LeanSession(uuid.uuid4().hex, self._take_process())
+        with self._lock:
+            self._sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id: str):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                raise SessionNotFound(f'Lean session {session_id} does not exist or has expired')
+            self._sessions.move_to_end(session_id)
+            session.last_used = time.monotonic()
+            return session
+
+    def close(self, session_id: str):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        with session.lock:
+            session.close()
+        return True
+
+    def close_all(self):
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), OrderedDict()
+            spares, self._spare_processes = self._spare_processes, []
+        for session in sessions:
+            session.close()
+        for repl in spares:
+            repl.close()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_session_registry():
+    """Return this worker's session registry, or None when the REPL is not installed."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            executable = find_repl_executable()
+            if not executable:
+                return None
+            _registry = SessionRegistry(executable, MAX_SESSIONS, SESSION_IDLE_SECONDS, SESSION_SPARES)
+        return _registry
+
+
+def close_session_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is not None:
+            _registry.close_all()
+            _registry = None
+
+
+def _session_response(session_id: str, worker: str, lean_code: str, messages: list, stats: dict, start_time: float):
+    # Imported here: lean_service imports this worker's heavier modules.
+    from lean_service import parse_theorem_info
+
+    index = DeclarationIndex(parse_theorem_info(lean_code))
+    collector = MessageCollector('session.lean', index)
+    for message in messages:
+        collector.add_lean_message(message)
+    errors = [
+        {'line': message['line'], 'column': message['column'], 'message': message['message']}
+        for message in collector.messages
+        if message['severity'] == 'error'
+    ]
+    return {
+        'session_id': session_id,
+        'worker': worker,
+        'valid': not errors,
+        'errors': errors,
+        'processing_time_seconds': round(time.perf_counter() - start_time, 6),
+        'return_code': 1 if errors else 0,
+        'message_count': len(collector.messages),
+        'theorem_count': len(index.declarations),
+        'suppressed_message_count': collector.suppressed,
+        **stats,
+    }
+
+
+def _error_response(session_id, worker: str, message: str, expired: bool = False):
+    return {'session_id': session_id, 'worker': worker, 'error': message, 'expired': expired}
+
+
+def open_session(worker: str, lean_code: str = None):
+    registry = get_session_registry()
+    if registry is None:
+        return _error_response(None, worker, 'Lean REPL is not available on this worker')
+    try:
+        session = registry.open()
+    except SessionLimitReached as error:
+        return _error_response(None, worker, str(error))
+    if not lean_code:
+        return {'session_id': session.session_id, 'worker': worker}
+    return update_session(worker, session.session_id, lean_code)
+
+
+def update_session(worker: str, session_id: str, lean_code: str):
+    start_time = time.perf_counter()
+    registry = get_session_registry()
+    try:
+        if registry is None:
+            raise SessionNotFound(f'Lean session {session_id} does not exist or has expired')
+        session = registry.get(session_id)
+    except SessionNotFound as error:
+        return _error_response(session_id, worker, str(error), expired=True)
+
+    with session.lock:
+        if session.closed:
+            return _error_response(session_id, worker, f'Lean session {session_id} has expired', expired=True)
+        try:
+            messages, stats = session.update(lean_code)
+        except LeanReplTimeout as error:
+            return _error_response(session_id, worker, f'Verification timeout: {error}')
+        except LeanReplError as error:
+            return _error_response(session_id, worker, f'Lean REPL failed: {error}')
+        session.last_used = time.monotonic()
+    return _session_response(session_id, worker, lean_code, messages, stats, start_time)
+
+
+def close_session(worker: str, session_id: str):
+    registry = get_session_registry()
+    closed = registry.close(session_id) if registry is not None else False
+    return {'session_id': session_id, 'worker': worker, 'closed': closed}
@@ -0,0 +1,148 @@
+"""
+lean_units.py
+~~~~~~~~~~~~~
+Split a Lean file into independently checkable declaration units.
+
+A file is cut at every column-0 command into blocks.  Declarations
+(`theorem`, `def`, `instance`, ...) become units; everything else (imports,
+`open`, `namespace`/`section`/`end`, `variable`, `set_option`, notation, ...)
+is context that every unit needs.  A unit depends on the earlier units whose
+names it mentions; instances and attributed declarations are treated as
+dependencies of every later unit because they are used implicitly.
+
+`plan_chunks` spreads the units over `k` files.  Each file has exactly the
+line count of the original source: lines of units it neither checks nor
+depends on are blanked, so Lean reports positions of the original file.
+"""
+
+import re
+
+DECLARATION = re.compile(
+    r"^(?:(?:private|protected|noncomputable|partial|unsafe|nonrec)\s+)*"
+    r"(theorem|lemma|example|def|abbrev|instance|structure|class|inductive|opaque|axiom)\b\s*"
+    r"([^\s:({\[]*)"
+)
+CONTINUATION = re.compile(r"^(?:\||where\b|deriving\b|termination_by\b|decreasing_by\b)")
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_'!?]*(?:\.[A-Za-z_][A-Za-z0-9_'!?]*)*")
+IMPLICIT_KINDS = {'instance', 'class'}
+
+
+def split_blocks(lean_code: str):
+    """
+    Return (lines, blocks) where every block is a dict with `kind`
+    ('context' or 'unit'), `start`/`end` line indexes (end exclusive) and, for
+    units, the declaration `keyword` and `name`.  Returns None for sources
+    this splitter does not handle (`mutual` blocks).
+    """
+    lines = lean_code.split('\n')
+    starts = []
+    comment_depth = 0
+    pending_start = None
+
+    for index, line in enumerate(lines):
+        at_top = comment_depth == 0 and line[:1] not in ('', ' ', '\t')
+        if at_top and not line.startswith('--') and not CONTINUATION.match(line):
+            if line.startswith('/-') or line.startswith('@['):
+                if pending_start is None:
+                    pending_start = index
+                if line.startswith('@['):
+                    match = DECLARATION.match(line.split(']', 1)[-1].lstrip())
+                    if match:
+                        starts.append((pending_start, 'unit', match.group(1), match.group(2), True))
+                        pending_start = None
+            else:
+                if line.startswith('mutual'):
+                    return None
+                start = pending_start if pending_start is not None else index
+                attributed = any(lines[i].startswith('@[') for i in range(start, index))
+                match = DECLARATION.match(line)
+                if match:
+                    starts.append((start, 'unit', match.group(1), match.group(2), attributed))
+                else:
+                    starts.append((start, 'context', '', '', False))
+                pending_start = None
+        comment_depth = max(0, comment_depth + line.count('/-') - line.count('-/'))
+
+    if not starts or starts[0][0] != 0:
+        starts.insert(0, (0, 'context', '', '', False))
+
+    blocks = []
+    for position, (start, kind, keyword, name, attributed) in enumerate(starts):
+        end = starts[position + 1][0] if position + 1 < len(starts) else len(lines)
+        block = {'kind': kind, 'start': start, 'end': end}
+        if kind == 'unit':
+            block.update(keyword=keyword, name=name, implicit=attributed or keyword in IMPLICIT_KINDS)
+        blocks.append(block)
+    return lines, blocks
+
+
+def _mentioned_names(text: str):
+    names = set()
+    for token in IDENTIFIER.findall(text):
+        parts = token.split('.')
+        for first in range(len(parts)):
+            for last in range(first + 1, len(parts) + 1):
+                names.add('.'.join(parts[first:last]))
+    return names
+
+
+def unit_dependencies(lines: list, units: list):
+    """Map each unit position to the positions of the earlier units it needs (transitively)."""
+    closures = []
+    for position, unit in enumerate(units):
+        mentioned = _mentioned_names('\n'.join(lines[unit['start']:unit['end']]))
+        direct = set()
+        for earlier in range(position):
+            candidate = units[earlier]
+            name = candidate['name']
+            if candidate['implicit'] or (name and (name in mentioned or name.split('.')[-1] in mentioned)):
+                direct.add(earlier)
+        closure = set(direct)
+        for earlier in direct:
+            closure |= closures[earlier]
+        closures.append(closure)
+    return closures
+
+
+def plan_chunks(lean_code: str, k: int):
+    """
+    Split *lean_code* into at most *k* checkable files.  Returns a list of
+    (source, owned_line_ranges) or None when the file cannot be split.  Every
+    unit is owned by exactly one chunk; messages inside a unit should be taken
+    from its owning chunk only.
+    """
+    split = split_blocks(lean_code)
+    if split is None:
+        return None
+    lines, blocks = split
+    units = [block for block in blocks if block['kind'] == 'unit']
+    if len(units) < 2 or k < 2:
+        return None
+
+    closures = unit_dependencies(lines, units)
+    bins = [{'units': set(), 'weight': 0} for _ in range(min(k, len(units)))]
+    for position in sorted(range(len(units)), key=lambda p: units[p]['start'] - units[p]['end']):
+        target = min(bins, key=lambda chunk: chunk['weight'])
+        target['units'].add(position)
+        target['weight'] += units[position]['end'] - units[position]['start']
+
+    chunks = []
+    for chunk in bins:
+        included = set(chunk['units'])
+        for position in chunk['units']:
+            included |= closures[position]
+        kept = [False] * len(lines)
+        for block in blocks:
+            if block['kind'] == 'context':
+                for index in range(block['start'], block['end']):
+                    kept[index] = True
+        for position in included:
+            for index in range(units[position]['start'], units[position]['end']):
+                kept[index] = True
+
+        source = '\n'.join(line if kept[index] else '' for index, line in enumerate(lines))
+        owned = sorted(
+            (units[position]['start'] + 1, units[position]['end']) for position in chunk['units']
+        )
+        chunks.append((source, owned))
+    return chunks
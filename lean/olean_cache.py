@@ -0,0 +1,225 @@
+"""
+olean_cache.py
+~~~~~~~~~~~~~~
+Incremental per-module build cache for project verification.
+
+Every module imported (transitively) by the entry file of a project payload
+is compiled to `.olean` once and stored under a key derived from
+
+    sha256(toolchain | module path | module source | keys of imported modules)
+
+so a module is only re-elaborated when its own source or something it
+imports changed.  The path is part of the key because each `.olean`
+records its module name (compiled with `-R <payload root>`, so the name
+matches the `import` lines).  Keys do not depend on the project, so
+identical node modules are shared across requests and projects.  The cache directory is
+bounded by `LEAN_OLEAN_CACHE_MAX_MB`, evicting the least recently used
+artifacts first.
+"""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from lean_messages import MessageCollector, run_lean_json
+from resource_limits import merge_usage
+from verification_cache import normalize_lean_code, toolchain_fingerprint
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+OLEAN_CACHE_DIR = os.environ.get('LEAN_OLEAN_CACHE_DIR', '/var/cache/coproof/olean')
+OLEAN_CACHE_MAX_MB = int(os.environ.get('LEAN_OLEAN_CACHE_MAX_MB', '4096'))
+
+
+def module_to_relpath(module_name: str):
+    parts = [part.strip() for part in module_name.split('.') if part.strip()]
+    cleaned = [part[1:-1] if part.startswith('«') and part.endswith('»') else part for part in parts]
+    return '/'.join(cleaned) + '.lean' if cleaned else None
+
+
+def parse_imports(lean_code: str):
+    modules = []
+    for raw_line in lean_code.splitlines():
+        line = raw_line.strip()
+        if not line or line.startswith('--'):
+            continue
+        if not line.startswith('import '):
+            break
+        modules.extend(part for part in line[len('import '):].split() if part)
+    return modules
+
+
+def local_dependencies(file_map: dict):
+    """Map every file to the payload files it imports (external imports are ignored)."""
+    dependencies = {}
+    for rel_path, content in file_map.items():
+        local = []
+        for module in parse_imports(content):
+            dep_path = module_to_relpath(module)
+            if dep_path and dep_path in file_map and dep_path != rel_path and dep_path not in local:
+                local.append(dep_path)
+        dependencies[rel_path] = local
+    return dependencies
+
+
+def build_order(entry_file: str, dependencies: dict):
+    """Post-order of the modules reachable from *entry_file*, excluding the entry itself."""
+    order = []
+    state = {}
+    stack = [(entry_file, iter(dependencies.get(entry_file, [])))]
+    state[entry_file] = 'visiting'
+
+    while stack:
+        current, children = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            state[current] = 'done'
+            order.append(current)
+            continue
+        if child in state:
+            continue
+        state[child] = 'visiting'
+        stack.append((child, iter(dependencies.get(child, []))))
+
+    return [path for path in order if path != entry_file]
+
+
+def module_keys(order: list, file_map: dict, dependencies: dict):
+    keys = {}
+    fingerprint = toolchain_fingerprint()
+    for rel_path in order:
+        digest = hashlib.sha256()
+        digest.update(fingerprint.encode('utf-8') + b'\0')
+        digest.update(rel_path.encode('utf-8') + b'\0')
+        digest.update(normalize_lean_code(file_map[rel_path]).encode('utf-8') + b'\0')
+        for dep_path in sorted(dependencies.get(rel_path, [])):
+            digest.update(keys.get(dep_path, '').encode('utf-8') + b'\0')
+        keys[rel_path] = digest.hexdigest()
+    return keys
+
+
+def _artifact_paths(build_dir: str, rel_path: str):
+    stem = os.path.join(build_dir, rel_path[:-len('.lean')])
+    return stem + '.olean', stem + '.ilean'
+
+
+def _cache_paths(cache_key: str):
+    shard = os.path.join(OLEAN_CACHE_DIR, cache_key[:2])
+    return os.path.join(shard, cache_key + '.olean'), os.path.join(shard, cache_key + '.ilean')
+
+
+def _restore(cache_key: str, olean_path: str, ilean_path: str):
+    cached_olean, cached_ilean = _cache_paths(cache_key)
+    if not os.path.exists(cached_olean):
+        return False
+
+    os.makedirs(os.path.dirname(olean_path), exist_ok=True)
+    for source, target in ((cached_olean, olean_path), (cached_ilean, ilean_path)):
+        if not os.path.exists(source):
+            continue
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+    os.utime(cached_olean)
+    return True
+
+
+def _store(cache_key: str, olean_path: str, ilean_path: str):
+    cached_olean, cached_ilean = _cache_paths(cache_key)
+    os.makedirs(os.path.dirname(cached_olean), exist_ok=True)
+    for source, target in ((olean_path, cached_olean), (ilean_path, cached_ilean)):
+        if not os.path.exists(source):
+            continue
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(target))
+        os.close(handle)
+        shutil.copyfile(source, temp_path)
+        os.replace(temp_path, target)
+
+
+def prune_cache():
+    limit = OLEAN_CACHE_MAX_MB * 1024 * 1024
+    entries = []
+    total = 0
+    for root, _, files in os.walk(OLEAN_CACHE_DIR):
+        for file_name in files:
+            path = os.path.join(root, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    for _mtime, size, path in sorted(entries):
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def build_imported_modules(lean_executable: str, source_root: str, build_dir: str,
+                           file_map: dict, entry_file: str, env: dict, timeout: float):
+    """
+    Compile the payload modules imported by *entry_file* into *build_dir*,
+    reusing cached `.olean` files. Stops at the first module that fails.
+    The report's `usage` is the peak memory / total CPU time of the builds.
+
+    Raises subprocess.TimeoutExpired when the whole build exceeds *timeout*.
+    """
+    deadline = time.monotonic() + timeout
+    dependencies = local_dependencies(file_map)
+    order = build_order(entry_file, dependencies)
+    keys = module_keys(order, file_map, dependencies)
+    report = {'built': [], 'reused': [], 'failed': None}
+    usages = []
+
+    for rel_path in order:
+        olean_path, ilean_path = _artifact_paths(build_dir, rel_path)
+        if _restore(keys[rel_path], olean_path, ilean_path):
+            report['reused'].append(rel_path)
+            continue
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise subprocess.TimeoutExpired(lean_executable, timeout)
+
+        os.makedirs(os.path.dirname(olean_path), exist_ok=True)
+        collector = MessageCollector(rel_path)
+        returncode, stderr, usage = run_lean_json(
+            lean_executable,
+            ['-R', source_root, '-o', olean_path, '-i', ilean_path, rel_path],
+            collector,
+            timeout=remaining,
+            cwd=source_root,
+            env=env,
+        )
+        usages.append(usage)
+        if returncode != 0:
+            report['failed'] = {
+                'file': rel_path,
+                'returncode': returncode,
+                'messages': collector.messages,
+                'suppressed': collector.suppressed,
+                'stdout': collector.feedback_text(),
+                'log_ref': collector.store_full_log(),
+                'stderr': stderr,
+            }
+            break
+
+        _store(keys[rel_path], olean_path, ilean_path)
+        report['built'].append(rel_path)
+
+    if report['built']:
+        prune_cache()
+    report['usage'] = merge_usage(usages)
+    return report
@@ -0,0 +1,90 @@
+"""
+resource_limits.py
+~~~~~~~~~~~~~~~~~~
+Per-process resource governance for Lean children of the lean worker.
+
+Every `lean` child runs with
+
+* `RLIMIT_DATA` = `LEAN_MAX_MEMORY_MB`: private writable memory (heap,
+  anonymous mappings, thread stacks).  The address-space limit is not used by
+  default because the mmapped Mathlib `.olean` files alone take several GB of
+  address space; set `LEAN_MAX_ADDRESS_SPACE_MB` to enforce one anyway.
+* `RLIMIT_CPU` = `LEAN_MAX_CPU_SECONDS` of CPU time (SIGXCPU when exceeded).
+* `lean -M LEAN_MAX_MEMORY_MB` so Lean itself reports a memory error before
+  the hard limit is hit.
+
+Children are reaped with `wait4` so their peak RSS and CPU time are measured
+exactly.
+"""
+
+import os
+import resource
+import signal
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+MAX_MEMORY_MB = int(os.environ.get('LEAN_MAX_MEMORY_MB', '8192'))
+MAX_ADDRESS_SPACE_MB = int(os.environ.get('LEAN_MAX_ADDRESS_SPACE_MB', '0'))
+MAX_CPU_SECONDS = int(os.environ.get('LEAN_MAX_CPU_SECONDS', '300'))
+
+_MB = 1024 * 1024
+
+
+def lean_memory_args():
+    return [f'-M{MAX_MEMORY_MB}'] if MAX_MEMORY_MB else []
+
+
+def apply_limits(pid: int, cpu_seconds: int = MAX_CPU_SECONDS):
+    """
+    Apply the configured limits to the freshly spawned child *pid*.
+    prlimit is used instead of a preexec_fn, which is unsafe in the threaded
+    callers (parallel declaration checks, REPL warm-up).
+    """
+    if MAX_MEMORY_MB:
+        limit = MAX_MEMORY_MB * _MB
+        resource.prlimit(pid, resource.RLIMIT_DATA, (limit, limit))
+    if MAX_ADDRESS_SPACE_MB:
+        limit = MAX_ADDRESS_SPACE_MB * _MB
+        resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+    if cpu_seconds:
+        # The soft limit sends SIGXCPU, the hard limit one second later SIGKILL.
+        resource.prlimit(pid, resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+
+
+def wait_with_usage(process):
+    """
+    Reap *process* with wait4 and return (returncode, usage) where usage has
+    `peak_memory_mb` and `cpu_time_seconds` of that child alone.
+    """
+    _pid, status, rusage = os.wait4(process.pid, 0)
+    returncode = os.waitstatus_to_exitcode(status)
+    process.returncode = returncode
+    return returncode, {
+        'peak_memory_mb': round(rusage.ru_maxrss / 1024, 1),
+        'cpu_time_seconds': round(rusage.ru_utime + rusage.ru_stime, 3),
+    }
+
+
+def limit_violation(returncode: int):
+    """Human readable reason when *returncode* means a resource limit stopped the child."""
+    if returncode == -signal.SIGXCPU:
+        return f'Lean exceeded its CPU time limit of {MAX_CPU_SECONDS} seconds'
+    if returncode == -signal.SIGKILL:
+        return 'Lean was killed (CPU time hard limit or out of memory)'
+    if returncode in (-signal.SIGSEGV, -signal.SIGABRT):
+        return f'Lean aborted, most likely after exceeding its memory limit of {MAX_MEMORY_MB} MB'
+    return None
+
+
+def merge_usage(usages, concurrent: bool = False):
+    """Combine child usages: sequential children peak at the max, concurrent ones add up."""
+    usages = [usage for usage in usages if usage]
+    if not usages:
+        return {'peak_memory_mb': 0.0, 'cpu_time_seconds': 0.0}
+    memory = [usage['peak_memory_mb'] for usage in usages]
+    return {
+        'peak_memory_mb': round(sum(memory) if concurrent else max(memory), 1),
+        'cpu_time_seconds': round(sum(usage['cpu_time_seconds'] for usage in usages), 3),
+    }
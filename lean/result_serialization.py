@@ -0,0 +1,76 @@
+"""
+result_serialization.py
+~~~~~~~~~~~~~~~~~~~~~~~
+Compact Celery result encoding for lean and computation task results.
+
+Results are stored in Redis as msgpack, zlib-compressed once they exceed
+`COPROOF_RESULT_COMPRESS_MIN_BYTES`.  The first byte tells the format:
+
+    0x00 + msgpack          small results
+    0x01 + zlib(msgpack)    everything else
+
+Celery backends decode every result with the serializer configured on the
+reading side, so each Celery app that stores or reads these results calls
+`register()` and applies `CELERY_RESULT_SETTINGS`.  JSON payloads (results
+stored before the switch) are still decoded.
+
+The same module is shipped with the lean and computation workers and with
+every client that reads their results.  The copies must stay identical:
+
+    lean/result_serialization.py
+    computation/result_serialization.py
+    nl2fl/result_serialization.py
+    server/app/services/integrations/result_serialization.py
+"""
+
+import json
+import os
+import zlib
+
+import msgpack
+from kombu.serialization import register as register_serializer
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+RESULT_SERIALIZER = 'msgpack-zlib'
+RESULT_CONTENT_TYPE = 'application/x-msgpack-zlib'
+COMPRESS_MIN_BYTES = int(os.environ.get('COPROOF_RESULT_COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_LEVEL = int(os.environ.get('COPROOF_RESULT_COMPRESS_LEVEL', '6'))
+
+CELERY_RESULT_SETTINGS = {
+    'result_serializer': RESULT_SERIALIZER,
+    'result_accept_content': [RESULT_SERIALIZER, 'json'],
+}
+
+_RAW = b'\x00'
+_ZLIB = b'\x01'
+
+
+def encode(value):
+    packed = msgpack.packb(value, use_bin_type=True)
+    if len(packed) < COMPRESS_MIN_BYTES:
+        return _RAW + packed
+    return _ZLIB + zlib.compress(packed, COMPRESS_LEVEL)
+
+
+def decode(data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    marker, body = data[:1], data[1:]
+    if marker == _RAW:
+        return msgpack.unpackb(body, raw=False)
+    if marker == _ZLIB:
+        return msgpack.unpackb(zlib.decompress(body), raw=False)
+    return json.loads(data)
+
+
+def register():
+    register_serializer(
+        RESULT_SERIALIZER,
+        encode,
+        decode,
+        content_type=RESULT_CONTENT_TYPE,
+        content_encoding='binary',
+    )
@@ -0,0 +1,208 @@
+"""
+syntax_check.py
+~~~~~~~~~~~~~~~
+Parse-only pre-check for Lean snippets.
+
+Lean cannot parse a file without elaborating its imports first (Mathlib
+defines most of the notation), so this check does not run Lean at all.  It
+looks for the errors that are certain regardless of the imported
+environment and that account for most rejected NL2FL attempts:
+
+* Markdown code fences left in the source,
+* unterminated block comments and string literals,
+* unbalanced or mismatched brackets,
+* `import` commands after the file header,
+* `theorem`/`def`/... declarations without a body,
+* Lean 3 `begin ... end` proofs.
+
+Errors use the positions Lean would report (1-based line, 0-based column)
+and the `errors` shape of the compiler responses.  A source that passes may
+still fail the full check.
+"""
+
+import re
+import time
+
+from lean_units import split_blocks
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+MAX_SYNTAX_ERRORS = 50
+
+BRACKETS = {')': '(', ']': '[', '}': '{', '⟩': '⟨', '⦄': '⦃', '⟧': '⟦', '⌋': '⌊', '⌉': '⌈', '⁆': '⁅'}
+OPENERS = set(BRACKETS.values())
+BODY_KEYWORDS = {'theorem', 'lemma', 'example', 'def', 'abbrev', 'instance'}
+BODY = re.compile(r":=|^\s*\||\bwhere\b", re.MULTILINE)
+IDENTIFIER_CHAR = re.compile(r"[A-Za-z0-9_'!?.Ͱ-Ͽ⁰-₟]")
+CHAR_LITERAL = re.compile(r"'(?:\\.[^']*|[^\\'\n])'")
+
+
+class _Errors(list):
+    def add(self, line: int, column: int, message: str):
+        if len(self) < MAX_SYNTAX_ERRORS:
+            self.append({'line': line, 'column': column, 'message': message})
+
+
+def _position(lean_code: str, offset: int):
+    line = lean_code.count('\n', 0, offset) + 1
+    return line, offset - (lean_code.rfind('\n', 0, offset) + 1)
+
+
+def strip_comments_and_strings(lean_code: str, errors: _Errors):
+    """
+    Return *lean_code* with comments and string/char literals blanked out
+    (newlines kept, so positions are unchanged), checking bracket balance on
+    the way.
+    """
+    cleaned = list(lean_code)
+    stack = []
+    brackets_ok = True
+    length = len(lean_code)
+    offset = 0
+
+    def blank(start, end):
+        for position in range(start, end):
+            if cleaned[position] != '\n':
+                cleaned[position] = ' '
+
+    while offset < length:
+        char = lean_code[offset]
+        pair = lean_code[offset:offset + 2]
+
+        if pair == '--':
+            end = lean_code.find('\n', offset)
+            end = length if end == -1 else end
+            blank(offset, end)
+            offset = end
+            continue
+
+        if pair == '/-':
+            depth = 0
+            position = offset
+            while position < length:
+                token = lean_code[position:position + 2]
+                if token == '/-':
+                    depth += 1
+                    position += 2
+                elif token == '-/':
+                    depth -= 1
+                    position += 2
+                    if depth == 0:
+                        break
+                else:
+                    position += 1
+            if depth:
+                errors.add(*_position(lean_code, offset), 'unterminated comment')
+            blank(offset, position)
+            offset = position
+            continue
+
+        if char == '"':
+            position = offset + 1
+            while position < length and lean_code[position] != '"':
+                position += 2 if lean_code[position] == '\\' else 1
+            if position >= length:
+                errors.add(*_position(lean_code, offset), 'unterminated string literal')
+            blank(offset, min(position + 1, length))
+            offset = position + 1
+            continue
+
+        if char == "'" and (offset == 0 or not IDENTIFIER_CHAR.match(lean_code[offset - 1])):
+            match = CHAR_LITERAL.match(lean_code, offset)
+            if match:
+                blank(offset, match.end())
+                offset = match.end()
+                continue
+
+        if brackets_ok:
+            if char in OPENERS:
+                stack.append((char, offset))
+            elif char in BRACKETS:
+                if not stack:
+                    errors.add(*_position(lean_code, offset), f"unexpected token '{char}'; no matching opening bracket")
+                    brackets_ok = False
+                elif stack[-1][0] != BRACKETS[char]:
+                    opener, opener_offset = stack[-1]
+                    line, column = _position(lean_code, opener_offset)
+                    errors.add(
+                        *_position(lean_code, offset),
+                        f"unexpected token '{char}'; expected the bracket opened with '{opener}' at {line}:{column} to be closed first",
+                    )
+                    brackets_ok = False
+                else:
+                    stack.pop()
+        offset += 1
+
+    if brackets_ok and stack:
+        opener, opener_offset = stack[-1]
+        errors.add(*_position(lean_code, opener_offset), f"unclosed bracket '{opener}'")
+    return ''.join(cleaned)
+
+
+def find_syntax_errors(lean_code: str):
+    """Return the list of certain syntax errors in *lean_code* ({line, column, message})."""
+    errors = _Errors()
+    if not lean_code.strip():
+        errors.add(1, 0, 'empty source')
+        return errors
+
+    cleaned = strip_comments_and_strings(lean_code, errors)
+    lines = cleaned.split('\n')
+    for number, line in enumerate(lines, start=1):
+        if line.lstrip().startswith('```'):
+            errors.add(number, line.find('`'), 'Markdown code fence; submit the Lean source without ``` fences')
+
+    in_header = True
+    for number, line in enumerate(lines, start=1):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if line.startswith('import ') or stripped == 'import':
+            if not in_header:
+                errors.add(number, 0, "invalid 'import' command, it must be used in the beginning of the file")
+        elif not stripped.startswith('```'):
+            in_header = False
+        if stripped == 'begin' or stripped.endswith(':= begin'):
+            errors.add(
+                number, line.find('begin'),
+                "Lean 3 syntax: 'begin ... end' proofs do not exist in Lean 4, use ':= by' followed by tactics",
+            )
+
+    split = split_blocks(cleaned)
+    if split is not None:
+        _lines, blocks = split
+        for block in blocks:
+            if block['kind'] != 'unit' or block['keyword'] not in BODY_KEYWORDS:
+                continue
+            text = '\n'.join(lines[block['start']:block['end']])
+            if not BODY.search(text):
+                header_line = next(
+                    (index for index in range(block['start'], block['end']) if not lines[index].startswith('@[')),
+                    block['start'],
+                )
+                errors.add(header_line + 1, 0, "declaration has no body, expected ':=', 'where' or '|'")
+
+    return sorted(errors, key=lambda error: (error['line'], error['column']))
+
+
+def to_syntax_check_response(lean_code: str):
+    """Compiler-response shaped result of the parse-only check."""
+    start_time = time.perf_counter()
+    errors = find_syntax_errors(lean_code)
+    split = split_blocks(lean_code)
+    theorem_count = 0
+    if split is not None:
+        theorem_count = sum(
+            1 for block in split[1] if block['kind'] == 'unit' and block['keyword'] in ('theorem', 'lemma')
+        )
+    return {
+        'valid': not errors,
+        'errors': errors,
+        'processing_time_seconds': round(time.perf_counter() - start_time, 6),
+        'return_code': 1 if errors else 0,
+        'message_count': len(errors),
+        'theorem_count': theorem_count,
+        'syntax_only': True,
+    }
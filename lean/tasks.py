@@ -3,14 +3,52 @@ from lean_service import (
     to_compiler_snippet_response,
     to_compiler_project_response,
 )
+from lean_sessions import close_session, open_session, update_session
+from syntax_check import to_syntax_check_response
+from verification_cache import (
+    cache_stats,
+    cached_verification,
+    project_cache_key,
+    snippet_cache_key,
+)
 
 
 @celery.task(name="tasks.verify_snippet")
-def verify_snippet(lean_code: str, filename: str = "snippet.lean"):
-    return to_compiler_snippet_response(lean_code, filename)
+def verify_snippet(lean_code: str, filename: str = "snippet.lean", minimize_imports: bool = False):
+    return cached_verification(
+        snippet_cache_key(lean_code, "minimize_imports" if minimize_imports else ""),
+        lambda: to_compiler_snippet_response(lean_code, filename, minimize_imports),
+    )
+
+
+@celery.task(name="tasks.check_syntax")
+def check_syntax(lean_code: str):
+    return to_syntax_check_response(lean_code)
+
+
+@celery.task(name="tasks.open_session", bind=True)
+def open_session_task(self, lean_code: str = None):
+    return open_session(self.request.hostname, lean_code)
+
+
+@celery.task(name="tasks.update_session", bind=True)
+def update_session_task(self, session_id: str, lean_code: str):
+    return update_session(self.request.hostname, session_id, lean_code)
+
+
+@celery.task(name="tasks.close_session", bind=True)
+def close_session_task(self, session_id: str):
+    return close_session(self.request.hostname, session_id)
 
 
 @celery.task(name="tasks.verify_project_files")
 def verify_project_files(file_map: dict, entry_file: str):
-    return to_compiler_project_response(file_map, entry_file)
+    return cached_verification(
+        project_cache_key(file_map, entry_file),
+        lambda: to_compiler_project_response(file_map, entry_file),
+    )
+
 
+@celery.task(name="tasks.verification_cache_stats")
+def verification_cache_stats():
+    return cache_stats()
@@ -0,0 +1,74 @@
+"""
+Unit tests for the lean worker's diagnostics collector.
+
+Run from the lean/ directory: python -m pytest tests/ -v
+"""
+
+from lean_messages import MAX_MESSAGES, DeclarationIndex, MessageCollector
+
+
+def _one_declaration_per_line(count):
+    return DeclarationIndex([
+        {"name": f"t{line}", "type": "theorem", "line": line, "column": 9}
+        for line in range(1, count + 1)
+    ])
+
+
+class TestMessageCollector:
+    def test_error_after_message_cap_still_counts(self):
+        collector = MessageCollector("proof.lean", _one_declaration_per_line(MAX_MESSAGES + 2))
+        for line in range(1, MAX_MESSAGES + 2):
+            collector.add("warning", line, 0, "unused variable")
+        collector.add("error", MAX_MESSAGES + 2, 0, "unsolved goals")
+
+        assert len(collector.messages) == MAX_MESSAGES
+        assert all(message["severity"] == "warning" for message in collector.messages)
+        assert collector.suppressed == 2
+        assert collector.has_errors
+
+    def test_warnings_only_have_no_errors(self):
+        collector = MessageCollector("proof.lean")
+        for line in range(1, MAX_MESSAGES + 10):
+            collector.add("warning", line, 0, "declaration uses 'sorry'")
+        assert not collector.has_errors
+
+    def test_first_error_of_declaration_is_kept_past_its_cap(self):
+        index = DeclarationIndex([{"name": "t", "type": "theorem", "line": 1, "column": 9}])
+        collector = MessageCollector("proof.lean", index)
+        for _ in range(30):
+            collector.add("warning", 2, 0, "linter")
+        collector.add("error", 3, 0, "type mismatch")
+        assert collector.messages[-1]["severity"] == "error"
+        assert collector.has_errors
+
+
+class TestMergeChunkCollectors:
+    def test_error_hidden_by_a_capped_chunk_survives_the_merge(self):
+        from lean_service import _merge_chunk_collectors
+
+        count = MAX_MESSAGES + 2
+        index = _one_declaration_per_line(count)
+        chunks = [("", [(1, 1)]), ("", [(2, count)])]
+        clean = MessageCollector("chunk_0.lean")
+        capped = MessageCollector("chunk_1.lean", index)
+        for line in range(2, count):
+            capped.add("warning", line, 0, "unused variable")
+        capped.add("error", count, 0, "unsolved goals")
+        assert capped.suppressed and all(message["severity"] == "warning" for message in capped.messages)
+
+        merged = _merge_chunk_collectors("proof.lean", index, chunks, [clean, capped])
+
+        assert all(message["severity"] == "warning" for message in merged.messages)
+        assert merged.has_errors
+
+    def test_clean_chunks_merge_without_errors(self):
+        from lean_service import _merge_chunk_collectors
+
+        chunks = [("", [(1, 1)]), ("", [(2, 2)])]
+        collectors = [MessageCollector("chunk_0.lean"), MessageCollector("chunk_1.lean")]
+        collectors[1].add("warning", 2, 0, "unused variable")
+
+        merged = _merge_chunk_collectors("proof.lean", _one_declaration_per_line(2), chunks, collectors)
+
+        assert len(merged.messages) == 1
+        assert not merged.has_errors
@@ -0,0 +1,124 @@
+"""
+Unit tests for incremental edit sessions, on a stub REPL process.
+
+Run from the lean/ directory: python -m pytest tests/ -v
+"""
+
+import pytest
+
+from lean_repl import LeanReplTimeout
+from lean_sessions import LeanSession
+
+
+SOURCE = (
+    "import Mathlib\n"
+    "\n"
+    "def one : Nat := 1\n"
+    "\n"
+    "theorem a : one = 1 := rfl\n"
+    "\n"
+    "theorem b : True := by\n"
+    "  sorry\n"
+)
+
+
+class StubRepl:
+    """Answers like the REPL: a new env per command, a warning for every `sorry`."""
+
+    executable = "repl"
+
+    def __init__(self, header_seconds=0.0):
+        self.header_seconds = header_seconds
+        self.header_timeouts = []
+        self.commands = []
+        self.uses = 0
+        self.alive = True
+
+    def env_for_header(self, modules, timeout):
+        self.header_timeouts.append(timeout)
+        if self.header_seconds > timeout:
+            raise LeanReplTimeout(f"Lean REPL did not answer within {timeout} seconds")
+        return 0
+
+    def send(self, command, timeout):
+        self.commands.append(command["cmd"])
+        messages = [
+            {"severity": "warning", "pos": {"line": number, "column": 2}, "data": "declaration uses 'sorry'"}
+            for number, line in enumerate(command["cmd"].split("\n"), start=1)
+            if line.strip() == "sorry"
+        ]
+        return {"env": len(self.commands), "messages": messages}
+
+    def should_recycle(self):
+        return False
+
+    def cpu_seconds(self):
+        return 0.0
+
+    def rss_mb(self):
+        return 0.0
+
+    def close(self):
+        self.alive = False
+
+
+class TestLeanSessionUpdate:
+    def test_first_update_checks_every_block(self):
+        repl = StubRepl()
+        messages, stats = LeanSession("s1", repl).update(SOURCE)
+
+        assert len(repl.commands) == 3
+        assert stats["reused_blocks"] == 0
+        assert [message["pos"]["line"] for message in messages] == [8]
+
+    def test_edit_in_last_block_reuses_the_others(self):
+        repl = StubRepl()
+        session = LeanSession("s1", repl)
+        session.update(SOURCE)
+        repl.commands.clear()
+
+        edited = SOURCE.replace("  sorry\n", "  trivial\n")
+        messages, stats = session.update(edited)
+
+        assert repl.commands == ["theorem b : True := by\n  trivial\n"]
+        assert stats["reused_blocks"] == 3
+        assert stats["rechecked_blocks"] == 1
+        assert stats["rechecked_from_line"] == 7
+        assert messages == []
+
+    def test_messages_of_reused_and_rechecked_blocks_use_absolute_lines(self):
+        repl = StubRepl()
+        session = LeanSession("s1", repl)
+        session.update("theorem a : True := by\n  sorry\n\ntheorem b : True := trivial\n")
+        repl.commands.clear()
+
+        messages, stats = session.update(
+            "theorem a : True := by\n  sorry\n\ntheorem b : True := by\n  skip\n  sorry\n"
+        )
+
+        assert stats["reused_blocks"] == 1
+        assert len(repl.commands) == 1
+        assert [message["pos"]["line"] for message in messages] == [2, 6]
+
+    def test_changed_imports_drop_every_snapshot(self):
+        repl = StubRepl()
+        session = LeanSession("s1", repl)
+        session.update(SOURCE)
+        repl.commands.clear()
+
+        _messages, stats = session.update(SOURCE.replace("import Mathlib", "import Mathlib.Tactic"))
+
+        assert stats["reused_blocks"] == 0
+        assert len(repl.commands) == 3
+
+    def test_header_load_is_bounded_by_the_update_deadline(self, monkeypatch):
+        repl = StubRepl(header_seconds=300.0)
+        session = LeanSession("s1", repl)
+        restarted = []
+        monkeypatch.setattr(session, "_restart", lambda: restarted.append(True))
+
+        with pytest.raises(LeanReplTimeout):
+            session.update(SOURCE, timeout=5)
+
+        assert repl.header_timeouts and repl.header_timeouts[0] <= 5
+        assert restarted
@@ -0,0 +1,126 @@
+"""
+Unit tests for the per-module .olean build cache.
+
+Run from the lean/ directory: python -m pytest tests/ -v
+"""
+
+import os
+
+import pytest
+
+import olean_cache
+import verification_cache
+
+
+FILE_MAP = {
+    'Proj/Defs.lean': 'def one : Nat := 1\n',
+    'Proj/Lemmas.lean': 'import Proj.Defs\ntheorem one_eq : one = 1 := rfl\n',
+    'Proj/Other.lean': 'def unused : Nat := 0\n',
+    'Main.lean': 'import Proj.Lemmas\ntheorem t : one = 1 := one_eq\n',
+}
+
+
+@pytest.fixture
+def fake_lean(tmp_path, monkeypatch):
+    """Replace the `lean` run with one that writes the source into the .olean."""
+    monkeypatch.setattr(olean_cache, 'OLEAN_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(verification_cache, '_toolchain_fingerprint', 'leanprover/lean4:v4.0.0|abc123')
+    compiled = []
+    failing = set()
+
+    def run_lean_json(lean_executable, args, collector, timeout, cwd, env):
+        olean_path, ilean_path, rel_path = args[3], args[5], args[6]
+        compiled.append(rel_path)
+        if rel_path in failing:
+            collector.add('error', 1, 0, 'unknown identifier')
+            return 1, '', {'peak_memory_mb': 1.0, 'cpu_time_seconds': 0.1}
+        with open(os.path.join(cwd, rel_path), 'r', encoding='utf-8') as handle:
+            source = handle.read()
+        for path in (olean_path, ilean_path):
+            with open(path, 'w', encoding='utf-8') as handle:
+                handle.write(source)
+        return 0, '', {'peak_memory_mb': 1.0, 'cpu_time_seconds': 0.1}
+
+    monkeypatch.setattr(olean_cache, 'run_lean_json', run_lean_json)
+    return compiled, failing
+
+
+def _build(tmp_path, file_map, name):
+    source_root = tmp_path / name / 'src'
+    build_dir = tmp_path / name / 'build'
+    for rel_path, content in file_map.items():
+        (source_root / rel_path).parent.mkdir(parents=True, exist_ok=True)
+        (source_root / rel_path).write_text(content, encoding='utf-8')
+    report = olean_cache.build_imported_modules(
+        'lean', str(source_root), str(build_dir), file_map, 'Main.lean', env={}, timeout=60,
+    )
+    return report, build_dir
+
+
+class TestBuildOrder:
+    def test_only_imported_modules_in_dependency_order(self):
+        order = olean_cache.build_order('Main.lean', olean_cache.local_dependencies(FILE_MAP))
+        assert order == ['Proj/Defs.lean', 'Proj/Lemmas.lean']
+
+    def test_module_names_map_to_paths(self):
+        assert olean_cache.module_to_relpath('Proj.«My File»') == 'Proj/My File.lean'
+
+
+class TestBuildImportedModules:
+    def test_second_build_restores_from_cache(self, tmp_path, fake_lean):
+        compiled, _failing = fake_lean
+        first, _build_dir = _build(tmp_path, FILE_MAP, 'first')
+        second, build_dir = _build(tmp_path, FILE_MAP, 'second')
+
+        assert first['built'] == ['Proj/Defs.lean', 'Proj/Lemmas.lean']
+        assert second['built'] == []
+        assert second['reused'] == ['Proj/Defs.lean', 'Proj/Lemmas.lean']
+        assert compiled == ['Proj/Defs.lean', 'Proj/Lemmas.lean']
+        assert (build_dir / 'Proj' / 'Defs.olean').read_text(encoding='utf-8') == FILE_MAP['Proj/Defs.lean']
+        assert (build_dir / 'Proj' / 'Lemmas.ilean').exists()
+
+    def test_changed_dependency_rebuilds_its_importers(self, tmp_path, fake_lean):
+        compiled, _failing = fake_lean
+        _build(tmp_path, FILE_MAP, 'first')
+        compiled.clear()
+
+        changed = dict(FILE_MAP, **{'Proj/Defs.lean': 'def one : Nat := 0 + 1\n'})
+        report, build_dir = _build(tmp_path, changed, 'second')
+
+        assert report['built'] == ['Proj/Defs.lean', 'Proj/Lemmas.lean']
+        assert compiled == ['Proj/Defs.lean', 'Proj/Lemmas.lean']
+        assert (build_dir / 'Proj' / 'Defs.olean').read_text(encoding='utf-8') == changed['Proj/Defs.lean']
+
+    def test_unrelated_change_keeps_the_cache(self, tmp_path, fake_lean):
+        compiled, _failing = fake_lean
+        _build(tmp_path, FILE_MAP, 'first')
+        compiled.clear()
+
+        unrelated = dict(FILE_MAP, **{'Proj/Other.lean': 'def unused : Nat := 2\n'})
+        report, _build_dir = _build(tmp_path, unrelated, 'second')
+
+        assert report['reused'] == ['Proj/Defs.lean', 'Proj/Lemmas.lean']
+        assert compiled == []
+
+    def test_moved_module_is_not_shared(self, tmp_path, fake_lean):
+        _build(tmp_path, FILE_MAP, 'first')
+        moved = {
+            'Other/Defs.lean': FILE_MAP['Proj/Defs.lean'],
+            'Main.lean': 'import Other.Defs\ntheorem t : one = 1 := rfl\n',
+        }
+        report, _build_dir = _build(tmp_path, moved, 'second')
+        assert report['built'] == ['Other/Defs.lean']
+
+    def test_failed_module_stops_the_build_and_is_not_cached(self, tmp_path, fake_lean):
+        compiled, failing = fake_lean
+        failing.add('Proj/Defs.lean')
+        report, _build_dir = _build(tmp_path, FILE_MAP, 'first')
+
+        assert report['failed']['file'] == 'Proj/Defs.lean'
+        assert report['failed']['returncode'] == 1
+        assert compiled == ['Proj/Defs.lean']
+
+        failing.clear()
+        compiled.clear()
+        retry, _build_dir = _build(tmp_path, FILE_MAP, 'second')
+        assert retry['built'] == ['Proj/Defs.lean', 'Proj/Lemmas.lean']
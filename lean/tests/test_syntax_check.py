@@ -0,0 +1,86 @@
+"""
+Unit tests for the parse-only Lean syntax pre-check.
+
+Run from the lean/ directory: python -m pytest tests/ -v
+"""
+
+import pytest
+
+from syntax_check import find_syntax_errors, to_syntax_check_response
+
+
+def _messages(lean_code):
+    return [error["message"] for error in find_syntax_errors(lean_code)]
+
+
+class TestAcceptedSources:
+    @pytest.mark.parametrize("lean_code", [
+        "import Mathlib\n\ntheorem t (n : ℕ) : n + 0 = n := by\n  simp\n",
+        "-- a comment with an unmatched ( bracket\ntheorem t : True := trivial\n",
+        "/- outer /- nested ) -/ still comment -/\ndef f : Nat := 1\n",
+        'def s : String := "closing ) and ] inside a string"\n',
+        "def c : Char := ')'\n",
+        "theorem t (h h' : 1 = 1) : ⟨1, 2⟩ = (⟨1, 2⟩ : ℕ × ℕ) := rfl\n",
+        "def f : Nat → Nat\n  | 0 => 1\n  | n + 1 => f n\n",
+        "instance : Inhabited Nat where\n  default := 0\n",
+        "structure P where\n  x : Nat\n",
+        "@[simp]\ntheorem t : 1 + 1 = 2 := rfl\n",
+    ])
+    def test_no_errors(self, lean_code):
+        assert find_syntax_errors(lean_code) == []
+
+    def test_response_shape(self):
+        response = to_syntax_check_response("theorem a : True := trivial\nlemma b : True := trivial\n")
+        assert response["valid"] is True
+        assert response["return_code"] == 0
+        assert response["theorem_count"] == 2
+        assert response["syntax_only"] is True
+
+
+class TestRejectedSources:
+    def test_empty_source(self):
+        assert _messages("  \n") == ["empty source"]
+
+    def test_markdown_fence(self):
+        errors = find_syntax_errors("```lean\ntheorem t : True := trivial\n```\n")
+        assert [(error["line"], error["column"]) for error in errors] == [(1, 0), (3, 0)]
+        assert "Markdown code fence" in errors[0]["message"]
+
+    def test_unterminated_comment(self):
+        errors = find_syntax_errors("theorem t : True := trivial\n/- never closed\n")
+        assert (errors[0]["line"], errors[0]["column"], errors[0]["message"]) == (2, 0, "unterminated comment")
+
+    def test_unterminated_string(self):
+        assert "unterminated string literal" in _messages('def s : String := "open\n')
+
+    def test_mismatched_bracket(self):
+        errors = find_syntax_errors("theorem t : (1 = 1] := rfl\n")
+        assert (errors[0]["line"], errors[0]["column"]) == (1, 18)
+        assert "opened with '(' at 1:12" in errors[0]["message"]
+
+    def test_unclosed_bracket(self):
+        assert _messages("theorem t : (1 = 1 := rfl\n") == ["unclosed bracket '('"]
+
+    def test_unexpected_closing_bracket(self):
+        assert "no matching opening bracket" in _messages("theorem t : 1 = 1) := rfl\n")[0]
+
+    def test_import_after_header(self):
+        errors = find_syntax_errors("theorem t : True := trivial\nimport Mathlib\n")
+        assert (errors[0]["line"], errors[0]["message"]) == (
+            2, "invalid 'import' command, it must be used in the beginning of the file",
+        )
+
+    def test_declaration_without_body(self):
+        errors = find_syntax_errors("theorem t : True\n\ntheorem u : True := trivial\n")
+        assert [(error["line"], error["message"]) for error in errors] == [
+            (1, "declaration has no body, expected ':=', 'where' or '|'"),
+        ]
+
+    def test_lean3_begin_end(self):
+        assert any("Lean 3 syntax" in message for message in _messages("theorem t : True := begin\n  trivial\nend\n"))
+
+    def test_response_reports_errors(self):
+        response = to_syntax_check_response("theorem t : True\n")
+        assert response["valid"] is False
+        assert response["return_code"] == 1
+        assert response["message_count"] == 1
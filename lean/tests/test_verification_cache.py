@@ -0,0 +1,167 @@
+"""
+Unit tests for the lean worker's verification result cache.
+
+Run from the lean/ directory: python -m pytest tests/ -v
+"""
+
+import signal
+
+import pytest
+
+import verification_cache
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+class FakeRedis:
+    """The subset of redis.Redis used by verification_cache, in memory."""
+
+    def __init__(self):
+        self.values = {}
+        self.sorted_sets = {}
+        self.hashes = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value.encode('utf-8')
+        return True
+
+    def delete(self, *keys):
+        return sum(self.values.pop(key, None) is not None for key in keys)
+
+    def zadd(self, key, mapping, xx=False):
+        members = self.sorted_sets.setdefault(key, {})
+        for member, score in mapping.items():
+            if not xx or member in members:
+                members[member] = score
+        return len(mapping)
+
+    def zcard(self, key):
+        return len(self.sorted_sets.get(key, {}))
+
+    def zpopmin(self, key, count):
+        members = self.sorted_sets.get(key, {})
+        popped = sorted(members.items(), key=lambda item: item[1])[:count]
+        for member, _score in popped:
+            del members[member]
+        return [(member.encode('utf-8'), score) for member, score in popped]
+
+    def hincrby(self, key, field, amount):
+        fields = self.hashes.setdefault(key, {})
+        fields[field] = fields.get(field, 0) + amount
+        return fields[field]
+
+    def hgetall(self, key):
+        return {field.encode('utf-8'): str(value).encode('utf-8') for field, value in self.hashes.get(key, {}).items()}
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    client = FakeRedis()
+    monkeypatch.setattr(verification_cache, '_client', client)
+    monkeypatch.setattr(verification_cache, '_toolchain_fingerprint', 'leanprover/lean4:v4.0.0|abc123')
+    monkeypatch.setattr(verification_cache, 'CACHE_ENABLED', True)
+    return client
+
+
+def _verifier(response):
+    calls = []
+
+    def verify():
+        calls.append(1)
+        return dict(response)
+    return verify, calls
+
+
+class TestCacheKeys:
+    def test_crlf_matches_lf(self, fake_redis):
+        assert (verification_cache.snippet_cache_key('theorem t : True := trivial\r\n')
+                == verification_cache.snippet_cache_key('theorem t : True := trivial\n'))
+
+    def test_whitespace_and_variant_change_the_key(self, fake_redis):
+        base = verification_cache.snippet_cache_key('theorem t : True := trivial\n')
+        assert verification_cache.snippet_cache_key('theorem t : True := trivial  \n') != base
+        assert verification_cache.snippet_cache_key('theorem t : True := trivial\n', 'minimize_imports') != base
+
+    def test_toolchain_changes_the_key(self, fake_redis, monkeypatch):
+        base = verification_cache.snippet_cache_key('theorem t : True := trivial\n')
+        monkeypatch.setattr(verification_cache, '_toolchain_fingerprint', 'leanprover/lean4:v4.1.0|abc123')
+        assert verification_cache.snippet_cache_key('theorem t : True := trivial\n') != base
+
+    def test_project_key_ignores_file_order(self, fake_redis):
+        first = verification_cache.project_cache_key({'A.lean': 'a', 'B.lean': 'b'}, 'A.lean')
+        second = verification_cache.project_cache_key({'B.lean': 'b', 'A.lean': 'a'}, 'A.lean')
+        assert first == second
+        assert verification_cache.project_cache_key({'A.lean': 'a', 'B.lean': 'c'}, 'A.lean') != first
+
+
+class TestCachedVerification:
+    def test_miss_then_hit(self, fake_redis):
+        verify, calls = _verifier({'valid': True, 'return_code': 0, 'processing_time_seconds': 4.2})
+
+        first = verification_cache.cached_verification('key', verify)
+        second = verification_cache.cached_verification('key', verify)
+
+        assert len(calls) == 1
+        assert first['cache_hit'] is False
+        assert second['cache_hit'] is True
+        assert second['valid'] is True
+        assert second['cached_processing_time_seconds'] == 4.2
+        stats = verification_cache.cache_stats()
+        assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+
+    def test_elaboration_failure_is_cached(self, fake_redis):
+        verify, calls = _verifier({'valid': False, 'return_code': 1})
+        verification_cache.cached_verification('key', verify)
+        verification_cache.cached_verification('key', verify)
+        assert len(calls) == 1
+
+    @pytest.mark.parametrize('return_code', [-1, -signal.SIGKILL, -signal.SIGXCPU, 137])
+    def test_transient_failures_are_not_cached(self, fake_redis, return_code):
+        verify, calls = _verifier({'valid': False, 'return_code': return_code})
+        verification_cache.cached_verification('key', verify)
+        second = verification_cache.cached_verification('key', verify)
+        assert len(calls) == 2
+        assert second['cache_hit'] is False
+
+    def test_least_recently_used_entry_is_evicted(self, fake_redis, monkeypatch):
+        monkeypatch.setattr(verification_cache, 'CACHE_MAX_ENTRIES', 2)
+        clock = iter(range(100, 200))
+        monkeypatch.setattr(verification_cache.time, 'time', lambda: next(clock))
+        verify, calls = _verifier({'valid': True, 'return_code': 0})
+
+        verification_cache.cached_verification('a', verify)
+        verification_cache.cached_verification('b', verify)
+        verification_cache.cached_verification('a', verify)
+        verification_cache.cached_verification('c', verify)
+
+        assert len(calls) == 3
+        assert verification_cache.KEY_PREFIX + 'b' not in fake_redis.values
+        assert verification_cache.cached_verification('a', verify)['cache_hit'] is True
+        assert verification_cache.cache_stats()['evictions'] == 1
+
+    def test_disabled_cache_always_verifies(self, fake_redis, monkeypatch):
+        monkeypatch.setattr(verification_cache, 'CACHE_ENABLED', False)
+        verify, calls = _verifier({'valid': True, 'return_code': 0})
+        verification_cache.cached_verification('key', verify)
+        verification_cache.cached_verification('key', verify)
+        assert len(calls) == 2
+        assert fake_redis.values == {}
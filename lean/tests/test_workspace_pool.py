@@ -0,0 +1,96 @@
+"""
+Unit tests for the reusable job workspaces.
+
+Run from the lean/ directory: python -m pytest tests/ -v
+"""
+
+import os
+
+import pytest
+
+import lean_service
+from workspace_pool import Workspace, WorkspacePool
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    path = tmp_path / 'ws1'
+    path.mkdir()
+    return Workspace(str(path))
+
+
+class TestWorkspaceSync:
+    def test_unchanged_files_are_skipped(self, workspace):
+        files = {'Main.lean': 'theorem t : True := trivial\n', 'Proj/Defs.lean': 'def one : Nat := 1\n'}
+        assert workspace.sync(files) == {'written': 2, 'skipped': 0, 'removed': 0}
+        assert workspace.sync(files) == {'written': 0, 'skipped': 2, 'removed': 0}
+
+    def test_stale_inputs_and_outputs_are_removed(self, workspace):
+        workspace.sync({'Main.lean': 'a', 'Old.lean': 'b'})
+        os.makedirs(os.path.join(workspace.path, '.olean', 'Proj'))
+        with open(os.path.join(workspace.path, '.olean', 'Proj', 'Defs.olean'), 'wb') as handle:
+            handle.write(b'output of the previous job')
+
+        report = workspace.sync({'Main.lean': 'a'})
+
+        assert report == {'written': 0, 'skipped': 1, 'removed': 2}
+        assert sorted(os.listdir(workspace.path)) == ['Main.lean']
+
+    def test_file_modified_by_a_job_is_rewritten(self, workspace):
+        workspace.sync({'Main.lean': 'abc'})
+        with open(os.path.join(workspace.path, 'Main.lean'), 'w', encoding='utf-8') as handle:
+            handle.write('xyz')
+
+        assert workspace.sync({'Main.lean': 'abc'})['written'] == 1
+        with open(os.path.join(workspace.path, 'Main.lean'), 'r', encoding='utf-8') as handle:
+            assert handle.read() == 'abc'
+
+    def test_symlink_left_by_a_job_is_not_written_through(self, workspace, tmp_path):
+        outside = tmp_path / 'outside.txt'
+        outside.write_text('keep', encoding='utf-8')
+        workspace.sync({'Main.lean': 'abc'})
+        os.remove(os.path.join(workspace.path, 'Main.lean'))
+        os.symlink(outside, os.path.join(workspace.path, 'Main.lean'))
+
+        workspace.sync({'Main.lean': 'abc'})
+
+        assert outside.read_text(encoding='utf-8') == 'keep'
+        assert not os.path.islink(os.path.join(workspace.path, 'Main.lean'))
+
+    @pytest.mark.parametrize('rel_path', ['../escape.lean', 'Proj/../../escape.lean', '.'])
+    def test_paths_escaping_the_workspace_are_rejected(self, workspace, tmp_path, rel_path):
+        workspace.sync({'Main.lean': 'a'})
+        with pytest.raises(ValueError):
+            workspace.sync({'Main.lean': 'a', rel_path: 'b'})
+        assert not (tmp_path / 'escape.lean').exists()
+        assert os.listdir(workspace.path) == ['Main.lean']
+
+
+class TestWorkspacePool:
+    def test_released_workspace_is_reused(self, tmp_path):
+        pool = WorkspacePool(str(tmp_path), size=1)
+        with pool.lease() as first:
+            first.sync({'Main.lean': 'a'})
+        with pool.lease() as second:
+            assert second is first
+            assert second.sync({'Main.lean': 'a'})['skipped'] == 1
+
+    def test_failed_job_leaves_an_empty_workspace(self, tmp_path):
+        pool = WorkspacePool(str(tmp_path), size=1)
+        with pytest.raises(RuntimeError):
+            with pool.lease() as workspace:
+                workspace.sync({'Main.lean': 'a'})
+                raise RuntimeError('job failed')
+        assert os.listdir(workspace.path) == []
+
+
+class TestVerifyLeanProject:
+    def test_escaping_path_is_reported_as_a_failed_check(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(lean_service, 'find_lean_executable', lambda: 'lean')
+        monkeypatch.setattr(lean_service, 'get_workspace_pool', lambda: WorkspacePool(str(tmp_path), size=1))
+
+        result = lean_service.verify_lean_project({'Main.lean': 'a', '../escape.lean': 'b'}, 'Main.lean')
+
+        assert result['verified'] is False
+        assert 'escapes the workspace' in result['messages'][0]['message']
+        assert not (tmp_path / 'escape.lean').exists()
@@ -0,0 +1,27 @@
+import Lean
+
+/-!
+Dumps the declaration-to-module index of the pinned Mathlib build that
+`import_minimizer.py` uses to narrow `import Mathlib` headers.
+
+Output (tab separated, one record per line):
+
+    C  <declaration name>  <defining module>
+    I  <module>            <space separated direct imports>
+-/
+
+open Lean
+
+def main : IO Unit := do
+  initSearchPath (← findSysroot)
+  let env ← importModules #[{ module := `Mathlib }] {} (trustLevel := 1024)
+  let out ← IO.getStdout
+  let moduleNames := env.header.moduleNames
+  for idx in [:moduleNames.size] do
+    let imports := env.header.moduleData[idx]!.imports.map (·.module.toString)
+    out.putStrLn s!"I\t{moduleNames[idx]!}\t{" ".intercalate imports.toList}"
+  for (name, _) in env.constants.map₁.toList do
+    if name.isInternal then
+      continue
+    if let some modIdx := env.getModuleIdxFor? name then
+      out.putStrLn s!"C\t{name}\t{moduleNames[modIdx.toNat]!}"
@@ -0,0 +1,184 @@
+"""
+verification_cache.py
+~~~~~~~~~~~~~~~~~~~~~
+Content-addressed cache of compiler responses for the lean worker.
+
+Keys are the SHA-256 of the Lean source exactly as submitted (or of the
+file map plus entry file) together with the Lean toolchain and the pinned
+Mathlib commit, so a toolchain bump invalidates every entry.  Entries live
+in Redis; a sorted set ordered by last access bounds the cache to
+`LEAN_RESULT_CACHE_MAX_ENTRIES` and evicts the least recently used results
+first.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import time
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
+CACHE_ENABLED = os.environ.get('LEAN_RESULT_CACHE_ENABLED', '1') == '1'
+CACHE_MAX_ENTRIES = int(os.environ.get('LEAN_RESULT_CACHE_MAX_ENTRIES', '20000'))
+CACHE_TTL_SECONDS = int(os.environ.get('LEAN_RESULT_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+MATHLIB_DIR = os.environ.get('MATHLIB_DIR', '/tmp/mathlib4')
+
+KEY_PREFIX = 'lean:result:'
+INDEX_KEY = 'lean:result:index'
+STATS_KEY = 'lean:result:stats'
+
+# 0 is a clean check and 1 an ordinary elaboration failure; everything else
+# (timeouts, signals from resource limits, worker errors) may pass on retry.
+CACHEABLE_RETURN_CODES = (0, 1)
+
+_client = None
+_toolchain_fingerprint = None
+
+
+def _redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL)
+    return _client
+
+
+def toolchain_fingerprint():
+    """Identify the Lean toolchain and Mathlib build that produced a result."""
+    global _toolchain_fingerprint
+    if _toolchain_fingerprint is not None:
+        return _toolchain_fingerprint
+
+    toolchain = os.environ.get('LEAN_TOOLCHAIN', '')
+    if not toolchain:
+        try:
+            with open(os.path.join(MATHLIB_DIR, 'lean-toolchain'), 'r', encoding='utf-8') as handle:
+                toolchain = handle.read().strip()
+        except OSError:
+            try:
+                toolchain = subprocess.run(
+                    ['lean', '--version'], capture_output=True, text=True, timeout=5,
+                ).stdout.strip()
+            except (FileNotFoundError, subprocess.TimeoutExpired):
+                toolchain = 'unknown'
+
+    mathlib_commit = os.environ.get('MATHLIB_COMMIT', 'unknown')
+    _toolchain_fingerprint = f'{toolchain}|{mathlib_commit}'
+    return _toolchain_fingerprint
+
+
+def normalize_lean_code(lean_code: str):
+    """
+    The source as Lean reads it. Only line endings are unified (Lean itself
+    reads CRLF as LF); blank lines and trailing spaces are kept because they
+    shift reported positions or change string literals.
+    """
+    return lean_code.replace('\r\n', '\n')
+
+
+def snippet_cache_key(lean_code: str, variant: str = ''):
+    digest = hashlib.sha256()
+    digest.update(b'snippet\0' + variant.encode('utf-8') + b'\0')
+    digest.update(toolchain_fingerprint().encode('utf-8') + b'\0')
+    digest.update(normalize_lean_code(lean_code).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def project_cache_key(file_map: dict, entry_file: str):
+    digest = hashlib.sha256()
+    digest.update(b'project\0')
+    digest.update(toolchain_fingerprint().encode('utf-8') + b'\0')
+    digest.update(entry_file.strip().lstrip('/').replace('\\', '/').encode('utf-8') + b'\0')
+    for rel_path in sorted(file_map):
+        content_hash = hashlib.sha256(normalize_lean_code(file_map[rel_path]).encode('utf-8')).hexdigest()
+        digest.update(f'{rel_path.strip().lstrip("/")}\0{content_hash}\0'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _get(cache_key: str):
+    client = _redis()
+    raw = client.get(KEY_PREFIX + cache_key)
+    if raw is None:
+        client.hincrby(STATS_KEY, 'misses', 1)
+        return None
+
+    pipeline = client.pipeline()
+    pipeline.zadd(INDEX_KEY, {cache_key: time.time()}, xx=True)
+    pipeline.hincrby(STATS_KEY, 'hits', 1)
+    pipeline.execute()
+    return json.loads(raw)
+
+
+def _put(cache_key: str, response: dict):
+    client = _redis()
+    pipeline = client.pipeline()
+    pipeline.set(KEY_PREFIX + cache_key, json.dumps(response), ex=CACHE_TTL_SECONDS)
+    pipeline.zadd(INDEX_KEY, {cache_key: time.time()})
+    pipeline.zcard(INDEX_KEY)
+    size = pipeline.execute()[-1]
+
+    overflow = size - CACHE_MAX_ENTRIES
+    if overflow > 0:
+        evicted = [member for member, _score in client.zpopmin(INDEX_KEY, overflow)]
+        if evicted:
+            client.delete(*[KEY_PREFIX + member.decode('utf-8') for member in evicted])
+            client.hincrby(STATS_KEY, 'evictions', len(evicted))
+
+
+def cached_verification(cache_key: str, verify):
+    """
+    Return the cached compiler response for *cache_key*, or run *verify* and
+    store its response. Only responses whose return_code is in
+    `CACHEABLE_RETURN_CODES` are stored.
+    """
+    if not CACHE_ENABLED:
+        return verify()
+
+    started = time.time()
+    try:
+        cached = _get(cache_key)
+    except redis.RedisError as error:
+        logger.warning('Verification cache lookup failed: %s', error)
+        cached = None
+
+    if cached is not None:
+        cached['cached_processing_time_seconds'] = cached.get('processing_time_seconds', 0.0)
+        cached['processing_time_seconds'] = round(time.time() - started, 3)
+        cached['cache_hit'] = True
+        return cached
+
+    response = verify()
+    if response.get('return_code', -1) in CACHEABLE_RETURN_CODES:
+        try:
+            _put(cache_key, response)
+        except redis.RedisError as error:
+            logger.warning('Verification cache store failed: %s', error)
+
+    response['cache_hit'] = False
+    return response
+
+
+def cache_stats():
+    client = _redis()
+    stats = {key.decode('utf-8'): int(value) for key, value in client.hgetall(STATS_KEY).items()}
+    hits = stats.get('hits', 0)
+    misses = stats.get('misses', 0)
+    lookups = hits + misses
+    return {
+        'enabled': CACHE_ENABLED,
+        'hits': hits,
+        'misses': misses,
+        'evictions': stats.get('evictions', 0),
+        'entries': client.zcard(INDEX_KEY),
+        'max_entries': CACHE_MAX_ENTRIES,
+        'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+        'toolchain': toolchain_fingerprint(),
+    }
@@ -8,11 +8,13 @@ worker.
 
 Retry loop:
   1. Ask the LLM to produce Lean 4 code.
-  2. Send the code to the Lean verifier.
-  3. If valid  → return success.
-  4. If invalid and attempts remain → feed compiler errors back to the LLM
+  2. Run the parse-only syntax pre-check; if it already finds errors, skip
+     the full verification and use them as the feedback.
+  3. Otherwise send the code to the Lean verifier.
+  4. If valid  → return success.
+  5. If invalid and attempts remain → feed compiler errors back to the LLM
      as a follow-up user message and try again.
-  5. If max_retries exhausted → return failure with full attempt history.
+  6. If max_retries exhausted → return failure with full attempt history.
 
 Model ID format: "<provider>/<model-name>"
   openai/gpt-4o               → OpenAI Chat Completions API
@@ -29,6 +31,10 @@ import logging
 import requests
 from celery import Celery
 
+from result_serialization import CELERY_RESULT_SETTINGS, register as register_result_serializer
+
+register_result_serializer()
+
 logger = logging.getLogger(__name__)
 
 # ---------------------------------------------------------------------------
@@ -237,7 +243,10 @@ def _call_llm(messages: list[dict], model_id: str, api_key: str) -> str:
 def _lean_celery() -> Celery:
     """Return a Celery client connected to the lean_queue broker."""
     redis_url = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
-    return Celery('nl2fl_lean_client', broker=redis_url, backend=redis_url)
+    client = Celery('nl2fl_lean_client', broker=redis_url, backend=redis_url)
+    # Lean results are stored msgpack + zlib encoded.
+    client.conf.update(CELERY_RESULT_SETTINGS)
+    return client
 
 
 # ---------------------------------------------------------------------------
@@ -283,6 +292,21 @@ def _verify_with_lean(lean_code: str) -> dict:
     return task.get(timeout=90, disable_sync_subtasks=False)
 
 
+def _check_syntax_with_lean(lean_code: str) -> dict | None:
+    """
+    Run the Lean worker's parse-only pre-check (no imports are loaded, so it
+    answers in milliseconds). Returns its VerifyCompilerResult-shaped dict,
+    or None when the pre-check is unavailable.
+    """
+    queue = os.environ.get('CELERY_LEAN_INTERACTIVE_QUEUE', 'lean_interactive_queue')
+    try:
+        task = _lean_celery().send_task('tasks.check_syntax', args=[lean_code], queue=queue)
+        return task.get(timeout=10, disable_sync_subtasks=False)
+    except Exception as exc:
+        logger.warning('[nl2fl] syntax pre-check unavailable: %s', exc)
+        return None
+
+
 def _format_errors(errors: list[dict]) -> str:
     """Format a list of VerificationErrorItem dicts into a readable string."""
     if not errors:
@@ -397,15 +421,19 @@ def translate_and_verify(
             )
         final_lean = lean_code  # preserve original import statement
 
-        # --- Step 2: Verify ---
-        try:
-            verification = _verify_with_lean(lean_code_for_verify)
-        except Exception as exc:
-            logger.error('[nl2fl] Lean verification error on attempt %d: %s', attempt, exc)
-            verification = {
-                'valid': False,
-                'errors': [{'line': 0, 'column': 0, 'message': f'Lean worker error: {exc}'}],
-            }
+        # --- Step 2: Syntax pre-check, then full verification ---
+        verification = _check_syntax_with_lean(lean_code_for_verify)
+        if verification is None or verification.get('valid', False):
+            try:
+                verification = _verify_with_lean(lean_code_for_verify)
+            except Exception as exc:
+                logger.error('[nl2fl] Lean verification error on attempt %d: %s', attempt, exc)
+                verification = {
+                    'valid': False,
+                    'errors': [{'line': 0, 'column': 0, 'message': f'Lean worker error: {exc}'}],
+                }
+        else:
+            logger.info('[nl2fl] syntax pre-check rejected attempt %d; skipping full verification', attempt)
 
         errors: list[dict] = verification.get('errors', [])
         valid = bool(verification.get('valid', False))
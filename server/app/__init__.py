@@ -31,6 +31,8 @@ def create_app(config_class=None):
     socketio.init_app(app, message_queue=app.config['REDIS_URL'])
 
     lean_queue = app.config['CELERY_LEAN_QUEUE']
+    lean_interactive_queue = app.config['CELERY_LEAN_INTERACTIVE_QUEUE']
+    lean_session_queue = app.config['CELERY_LEAN_SESSION_QUEUE']
     computation_queue = app.config['CELERY_COMPUTATION_QUEUE']
     git_engine_queue = app.config['CELERY_GIT_ENGINE_QUEUE']
     nl2fl_queue = app.config['CELERY_NL2FL_QUEUE']
@@ -41,6 +43,12 @@ def create_app(config_class=None):
         'task_default_queue': lean_queue,
         'task_queues': (
             Queue(lean_queue, Exchange(lean_queue, type='direct'), routing_key=lean_queue),
+            Queue(
+                lean_interactive_queue,
+                Exchange(lean_interactive_queue, type='direct'),
+                routing_key=lean_interactive_queue,
+            ),
+            Queue(lean_session_queue, Exchange(lean_session_queue, type='direct'), routing_key=lean_session_queue),
             Queue(computation_queue, Exchange(computation_queue, type='direct'), routing_key=computation_queue),
             Queue(git_engine_queue, Exchange(git_engine_queue, type='direct'), routing_key=git_engine_queue),
             Queue(nl2fl_queue, Exchange(nl2fl_queue, type='direct'), routing_key=nl2fl_queue),
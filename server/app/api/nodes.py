@@ -1,12 +1,16 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from flask_caching import logger
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import decode_token, jwt_required, get_jwt_identity
+from flask_jwt_extended.exceptions import JWTExtendedException
+from flask_socketio import join_room
+from jwt.exceptions import PyJWTError
 import re
 import uuid
 from app.models.user import User
 from app.models.user_api_key import UserApiKey
 from app.services.computation_service import ComputationService
 from app.services.auth_service import AuthService
+from app.services.integrations.cluster_client import ClusterClient
 from app.services.integrations.computation_client import ComputationClient
 from app.services.integrations.compiler_client import CompilerClient
 from app.services.integrations.translate_client import TranslateClient
@@ -15,7 +19,7 @@ from app.services.lean_service import LeanService
 from app.models.project import Project
 from app.models.node import Node
 from app.exceptions import CoProofError
-from app.extensions import db
+from app.extensions import db, socketio
 
 nodes_bp = Blueprint('nodes', __name__, url_prefix='/api/v1/nodes')
 
@@ -242,10 +246,11 @@ def _resolve_api_key(user_id: str, model_id: str, api_key_body: str) -> str | No
 def verify_snippet_public():
     """
     Public endpoint: dispatches a Lean 4 snippet for verification.
-    Accepts JSON { "code": "..." } or multipart .lean file.
+    Accepts JSON { "code": "...", "minimize_imports": false } or multipart .lean file.
     Returns { task_id } immediately (non-blocking).
     """
     code = None
+    minimize_imports = False
 
     if request.content_type and 'multipart/form-data' in request.content_type:
         file = request.files.get('file')
@@ -255,9 +260,11 @@ def verify_snippet_public():
         if not filename.endswith('.lean'):
             return jsonify({"error": "Only .lean files are accepted"}), 400
         code = file.read().decode('utf-8', errors='replace')
+        minimize_imports = request.form.get('minimize_imports', '').lower() in ('1', 'true')
     else:
         data = request.get_json(silent=True) or {}
         code = data.get('code', '').strip()
+        minimize_imports = bool(data.get('minimize_imports'))
 
     if not code:
         return jsonify({"error": "No Lean code provided"}), 400
@@ -266,17 +273,82 @@ def verify_snippet_public():
         return jsonify({"error": "Code exceeds maximum allowed size (100 KB)"}), 413
 
     try:
-        celery_app = CompilerClient._get_celery()
-        task = celery_app.send_task(
+        task_id = CompilerClient.submit_task(
             'tasks.verify_snippet',
-            args=[code, 'snippet.lean'],
-            queue=CompilerClient.LEAN_QUEUE_NAME,
+            [code, 'snippet.lean', minimize_imports],
+            queue_name=CompilerClient.LEAN_INTERACTIVE_QUEUE_NAME,
         )
-        return jsonify({"task_id": task.id}), 202
+        return jsonify({"task_id": task_id}), 202
     except Exception as e:
         return jsonify({"error": str(e)}), 503
 
 
+@nodes_bp.route('/tools/check-syntax', methods=['POST'])
+def check_snippet_syntax():
+    """
+    Public endpoint: fast parse-only pre-check of a Lean 4 snippet.
+    Accepts JSON { "code": "..." }. Returns the result synchronously in the
+    VerifyCompilerResult shape with `syntax_only: true`.
+    """
+    data = request.get_json(silent=True) or {}
+    code = data.get('code', '')
+
+    if not code.strip():
+        return jsonify({"error": "No Lean code provided"}), 400
+
+    if len(code) > 100_000:
+        return jsonify({"error": "Code exceeds maximum allowed size (100 KB)"}), 413
+
+    return jsonify(CompilerClient.check_syntax(code)), 200
+
+
+@nodes_bp.route('/tools/sessions', methods=['POST'])
+@jwt_required()
+def open_verification_session():
+    """
+    Opens an incremental verification session for edit-as-you-type checking,
+    owned by the caller. Accepts optional JSON { "code": "..." }; when given,
+    the first check result is returned along with the session_id.
+    """
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    code = data.get('code') or None
+
+    if code and len(code) > 100_000:
+        return jsonify({"error": "Code exceeds maximum allowed size (100 KB)"}), 413
+
+    return jsonify(CompilerClient.open_session(user_id, code)), 201
+
+
+@nodes_bp.route('/tools/sessions/<session_id>', methods=['PUT'])
+@jwt_required()
+def update_verification_session(session_id):
+    """
+    Re-checks the full source of one of the caller's sessions. Only the
+    top-level commands from the first changed one onward are elaborated again.
+    """
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    code = data.get('code', '')
+
+    if not code.strip():
+        return jsonify({"error": "No Lean code provided"}), 400
+
+    if len(code) > 100_000:
+        return jsonify({"error": "Code exceeds maximum allowed size (100 KB)"}), 413
+
+    return jsonify(CompilerClient.update_session(user_id, session_id, code)), 200
+
+
+@nodes_bp.route('/tools/sessions/<session_id>', methods=['DELETE'])
+@jwt_required()
+def close_verification_session(session_id):
+    """
+    Closes one of the caller's sessions and frees its Lean process.
+    """
+    return jsonify(CompilerClient.close_session(get_jwt_identity(), session_id)), 200
+
+
 @nodes_bp.route('/tools/verify-snippet/<task_id>/result', methods=['GET'])
 def get_snippet_result(task_id):
     """
@@ -287,6 +359,7 @@ def get_snippet_result(task_id):
         celery_app = CompilerClient._get_celery()
         async_result = celery_app.AsyncResult(task_id)
         if async_result.ready():
+            CompilerClient.release_submitted(task_id)
             if async_result.successful():
                 return jsonify(async_result.result), 200
             return jsonify({"error": "Lean verification task failed"}), 500
@@ -295,6 +368,107 @@ def get_snippet_result(task_id):
         return jsonify({"error": str(e)}), 503
 
 
+@nodes_bp.route('/tools/logs/<log_ref>', methods=['GET'])
+def get_job_log(log_ref):
+    """
+    Returns the full log of a Lean or computation job whose result carried a
+    `log_ref` because its inline logs were capped.
+    """
+    return Response(CompilerClient.fetch_log(log_ref), mimetype='text/plain'), 200
+
+
+@nodes_bp.route('/tools/verification-cache/stats', methods=['GET'])
+def get_verification_cache_stats():
+    """
+    Returns hit/miss counters of the Lean worker verification result cache.
+    """
+    return jsonify(CompilerClient.get_cache_stats()), 200
+
+
+@nodes_bp.route('/tools/computation-cache/stats', methods=['GET'])
+def get_computation_cache_stats():
+    """
+    Returns hit/miss counters of the computation worker result cache.
+    """
+    return jsonify(ComputationClient.get_cache_stats()), 200
+
+
+@socketio.on('join_computation')
+def join_computation(data):
+    """
+    Subscribe the socket to 'computation_progress' events of one of the
+    caller's runs. Expects { "run_id": ..., "token": <access token> }; a
+    run_id not used yet is claimed for the caller, so the room can be joined
+    before the run starts. Acknowledges with { joined, error? }.
+    """
+    data = data or {}
+    run_id = str(data.get('run_id') or '')
+    if not ComputationService.RUN_ID_PATTERN.fullmatch(run_id):
+        return {"joined": False, "error": "Invalid run_id."}
+    try:
+        user_id = decode_token(str(data.get('token') or ''))['sub']
+    except (JWTExtendedException, PyJWTError):
+        return {"joined": False, "error": "Authentication required."}
+    try:
+        ComputationClient.claim_run(user_id, run_id)
+    except CoProofError as error:
+        return {"joined": False, "error": error.message}
+    join_room(f'computation:{run_id}')
+    return {"joined": True}
+
+
+@nodes_bp.route('/tools/computation-runs/<run_id>/progress', methods=['GET'])
+@jwt_required()
+def get_computation_progress(run_id):
+    """
+    Returns the latest progress report of one of the caller's computations
+    (the same payload as the 'computation_progress' socket event), or null.
+    """
+    ComputationClient.ensure_run_owner(get_jwt_identity(), run_id)
+    return jsonify({"run_id": run_id, "progress": ComputationClient.get_progress(run_id)}), 200
+
+
+@nodes_bp.route('/tools/computation-runs/<run_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_computation_run(run_id):
+    """
+    Cancels one of the caller's running computations; the worker kills it at
+    its next progress poll and the pending /compute request fails with
+    'Computation cancelled.'.
+    """
+    if not ComputationService.RUN_ID_PATTERN.fullmatch(run_id):
+        raise CoProofError('Invalid run_id.', code=400)
+    return jsonify(ComputationClient.cancel_computation(get_jwt_identity(), run_id)), 202
+
+
+@nodes_bp.route('/tools/computation-jobs', methods=['POST'])
+@jwt_required()
+def submit_computation_job():
+    """
+    Submits a computation (same payload as /compute, including executor and
+    tasks) without waiting for it. Returns 202 + { job_id, run_id, executor, state }.
+    """
+    request_data = ComputationService.normalize_execution_request(request.get_json() or {})
+    return jsonify(ClusterClient.submit_job(get_jwt_identity(), request_data)), 202
+
+
+@nodes_bp.route('/tools/computation-jobs/<uuid:job_id>', methods=['GET'])
+@jwt_required()
+def get_computation_job(job_id):
+    """
+    Returns the state of a computation job the caller submitted: queued,
+    running, completed, failed or unknown. Finished jobs include the
+    computation summary.
+    """
+    job = ClusterClient.get_job_status(get_jwt_identity(), job_id.hex)
+    result = job.pop('result', None)
+    if result is not None:
+        job['computation'] = ComputationService.summarize_computation_result(result, job.get('run_id'))
+    else:
+        job['progress'] = ComputationClient.get_progress(job['run_id']) if job.get('run_id') else None
+    return jsonify(job), 200
+
+
 @nodes_bp.route('/<uuid:project_id>/<uuid:node_id>/solve', methods=['POST'])
 @jwt_required()
 def solve_node(project_id, node_id):
@@ -358,7 +532,10 @@ def solve_node(project_id, node_id):
     if missing_imports:
         verification_payload = '\n'.join(missing_imports) + '\n\n' + verification_payload
 
-    verification = CompilerClient.verify_snippet(verification_payload)
+    verification = CompilerClient.verify_snippet(
+        verification_payload,
+        supersede_key=f'{project.id}:{node.id}',
+    )
 
     if not verification.get('valid'):
         payload_preview = '\n'.join(verification_payload.splitlines()[:20])
@@ -660,8 +837,8 @@ def compute_node(project_id, node_id):
         raise CoProofError("Node URL does not map to a valid .lean file path.", code=400)
 
     request_data = ComputationService.normalize_execution_request(data)
-    computation_result = ComputationClient.run_computation(request_data)
-    computation_summary = ComputationService.summarize_computation_result(computation_result)
+    computation_result = ComputationClient.run_computation(user_id, request_data)
+    computation_summary = ComputationService.summarize_computation_result(computation_result, request_data['run_id'])
     node.computation_spec = ComputationService.build_persisted_spec(request_data)
     node.last_computation_result = computation_summary
 
@@ -709,7 +886,10 @@ def compute_node(project_id, node_id):
         parent_map=parent_map,
         project_goal=project.goal,
     )
-    lean_verification = CompilerClient.verify_snippet(verification_payload)
+    lean_verification = CompilerClient.verify_snippet(
+        verification_payload,
+        supersede_key=f'{project.id}:{node.id}',
+    )
 
     if not lean_verification.get('valid'):
         db.session.commit()
@@ -728,7 +908,12 @@ def compute_node(project_id, node_id):
         branch=project.default_branch,
         extensions=('.lean', '.py', '.json', '.tex'),
     )
-    has_changes = any(repository_files.get(path) != content for path, content in artifact_bundle.items())
+    # Binary artifacts are covered by the hashes recorded in evidence.json.
+    has_changes = any(
+        repository_files.get(path) != content
+        for path, content in artifact_bundle.items()
+        if isinstance(content, str)
+    )
 
     if not has_changes:
         updates = {
@@ -891,7 +1076,10 @@ def split_node(project_id, node_id):
 
     def_context = LeanService.build_goaldef_context_from_project(project)
     verification_payload = LeanService.build_split_verification_payload(def_context, lean_code, project.goal)
-    verification = CompilerClient.verify_snippet(verification_payload)
+    verification = CompilerClient.verify_snippet(
+        verification_payload,
+        supersede_key=f'{project.id}:{node.id}',
+    )
 
     if not verification.get('valid'):
         payload_preview = '\n'.join(verification_payload.splitlines()[:20])
@@ -1045,13 +1233,27 @@ def verify_node_import_tree(project_id, node_id):
     reachable_files, parent_map = LeanService.resolve_import_tree(entry_file, all_lean_files)
     reachable_map = {path: all_lean_files[path] for path in reachable_files if path in all_lean_files}
 
-    verification_payload = LeanService.build_verify_payload_from_reachable_map(
-        reachable_map=reachable_map,
-        entry_file=entry_file,
-        parent_map=parent_map,
-        project_goal=project.goal,
-    )
-    verification = CompilerClient.verify_snippet(verification_payload)
+    if LeanService.definition_file_paths(reachable_map) or not project.goal:
+        # The closure is a complete module graph: build it module by module so
+        # unchanged imports come from the worker's .olean cache.
+        verification = CompilerClient.verify_project_files(
+            reachable_map,
+            entry_file,
+            supersede_key=f'{project.id}:{node.id}',
+        )
+    else:
+        # Definitions only exist as the project goal; inline them ahead of the closure.
+        verification_payload = LeanService.build_verify_payload_from_reachable_map(
+            reachable_map=reachable_map,
+            entry_file=entry_file,
+            parent_map=parent_map,
+            project_goal=project.goal,
+        )
+        verification = CompilerClient.verify_snippet(
+            verification_payload,
+            interactive=False,
+            supersede_key=f'{project.id}:{node.id}',
+        )
     sorry_locations = LeanService.collect_sorry_locations(reachable_map)
     sorry_traces = LeanService.build_sorry_traces(entry_file, sorry_locations, parent_map)
 
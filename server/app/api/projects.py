@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.services.project_service import ProjectService
+from app.services.computation_service import ComputationService
 from app.services.auth_service import AuthService
 from app.services.github_service import GitHubService
 from app.services.lean_service import LeanService
@@ -27,6 +28,7 @@ def _compact_last_computation_result(payload):
         "timing_source": payload.get("timing_source"),
         "records_count": payload.get("records_count"),
         "evidence_preview": payload.get("evidence_preview"),
+        "resources": payload.get("resources"),
     }
     return compact
 
@@ -149,6 +151,16 @@ def get_project_graph_simple(project_id):
     }), 200
 
 
+@projects_bp.route('/<uuid:project_id>/computation-usage', methods=['GET'])
+@jwt_required()
+def get_project_computation_usage(project_id):
+    """Aggregate resource usage of the last run of every computation node in the project."""
+    project = Project.query.get_or_404(project_id)
+    nodes = Node.query.filter_by(project_id=project.id, node_kind='computation').all()
+    usage = ComputationService.aggregate_resource_usage(nodes)
+    return jsonify({"project_id": str(project.id), **usage}), 200
+
+
 @projects_bp.route('/<uuid:project_id>/definitions', methods=['GET'])
 @jwt_required()
 def get_project_definitions_file(project_id):
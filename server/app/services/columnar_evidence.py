@@ -0,0 +1,257 @@
+"""Typed, column-oriented storage for computation evidence records.
+
+Records are split into row groups of ``ROW_GROUP_SIZE`` rows.  Inside a row
+group every column is stored as one block: the column's values as a msgpack
+array (types preserved: int, float, bool, str, null and nested values),
+zlib-compressed.  When some rows of the group lack the column, a second
+block of per-row presence flags tells a missing value from a null one.  Integer columns without nulls are delta-encoded first,
+which makes counters and sorted keys almost free; blocks holding integers
+beyond 64 bits fall back to JSON.  Blocks are concatenated in
+a binary data file; a small JSON index records, per row group and column,
+the offset, length and encoding of the block plus per-column types and
+min/max statistics, so a reader can load single columns or row groups
+without decompressing the rest.
+"""
+
+import hashlib
+import json
+import zlib
+from io import BytesIO
+
+import msgpack
+
+FORMAT_NAME = 'coproof-columnar'
+FORMAT_VERSION = 2
+# Version 1 files have no presence flags; their nulls read back as missing.
+READABLE_VERSIONS = (1, 2)
+MAGIC = b'CPCOL1\n'
+ROW_GROUP_SIZE = 65536
+COMPRESS_LEVEL = 6
+VALUE_COLUMN = '_value'
+
+
+def _value_type(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, str):
+        return 'str'
+    return 'json'
+
+
+def _column_type(types):
+    if not types:
+        return 'null'
+    if types == {'int', 'float'}:
+        return 'float'
+    if len(types) == 1:
+        return next(iter(types))
+    return 'mixed'
+
+
+class ColumnarEvidenceWriter:
+    """Single-pass writer: append records, then ``finish()`` for (data, index)."""
+
+    def __init__(self, row_group_size=ROW_GROUP_SIZE):
+        self.row_group_size = row_group_size
+        self._data = BytesIO()
+        self._data.write(MAGIC)
+        self._digest = hashlib.sha256(MAGIC)
+        self._columns = {}
+        self._row_groups = []
+        self._pending = {}
+        self._present = {}
+        self._pending_rows = 0
+        self.row_count = 0
+
+    def append(self, record):
+        if not isinstance(record, dict):
+            record = {VALUE_COLUMN: record}
+        for name, value in record.items():
+            name = str(name)
+            values = self._pending.get(name)
+            if values is None:
+                # Column first seen in this row group: earlier rows lack it.
+                values = self._pending[name] = [None] * self._pending_rows
+                self._present[name] = [False] * self._pending_rows
+            values.append(value)
+            self._present[name].append(True)
+            self._track(name, value)
+        self._pending_rows += 1
+        self.row_count += 1
+        for name, values in self._pending.items():
+            if len(values) < self._pending_rows:
+                values.append(None)
+                self._present[name].append(False)
+        if self._pending_rows >= self.row_group_size:
+            self._flush()
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def _track(self, name, value):
+        column = self._columns.setdefault(name, {'types': set(), 'null_count': 0, 'min': None, 'max': None})
+        value_type = _value_type(value)
+        if value_type is None:
+            return
+        column['types'].add(value_type)
+        if value_type in ('int', 'float'):
+            column['min'] = value if column['min'] is None else min(column['min'], value)
+            column['max'] = value if column['max'] is None else max(column['max'], value)
+
+    @staticmethod
+    def _encode_values(values):
+        if values and all(type(value) is int for value in values):
+            deltas = [values[0]] + [current - previous for previous, current in zip(values, values[1:])]
+            try:
+                return 'delta', msgpack.packb(deltas, use_bin_type=True)
+            except OverflowError:
+                pass
+        try:
+            return 'plain', msgpack.packb(values, use_bin_type=True)
+        except OverflowError:
+            # Integers beyond 64 bits: JSON keeps them exact.
+            return 'json', json.dumps(values, ensure_ascii=True).encode('utf-8')
+
+    def _write_block(self, values):
+        encoding, packed = self._encode_values(values)
+        block = zlib.compress(packed, COMPRESS_LEVEL)
+        offset = self._data.tell()
+        self._data.write(block)
+        self._digest.update(block)
+        return {'offset': offset, 'length': len(block), 'raw_length': len(packed), 'encoding': encoding}
+
+    def _flush(self):
+        if not self._pending_rows:
+            return
+        for name, values in self._pending.items():
+            self._columns[name]['null_count'] += values.count(None)
+        columns = {}
+        for name, values in self._pending.items():
+            columns[name] = self._write_block(values)
+            if not all(self._present[name]):
+                columns[name]['present'] = self._write_block(self._present[name])
+        self._row_groups.append({'rows': self._pending_rows, 'columns': columns})
+        self._pending = {}
+        self._present = {}
+        self._pending_rows = 0
+
+    def finish(self, data_file=None):
+        """Return (data bytes, index dict). Rows missing a column read back as null from read_column."""
+        self._flush()
+        data = self._data.getvalue()
+        columns = []
+        for name, column in self._columns.items():
+            missing = self.row_count - sum(group['rows'] for group in self._row_groups if name in group['columns'])
+            entry = {
+                'name': name,
+                'type': _column_type(column['types']),
+                'null_count': column['null_count'] + missing,
+            }
+            if column['min'] is not None:
+                entry['min'] = column['min']
+                entry['max'] = column['max']
+            columns.append(entry)
+        index = {
+            'format': FORMAT_NAME,
+            'version': FORMAT_VERSION,
+            'encoding': 'msgpack',
+            'compression': 'zlib',
+            'data_file': data_file,
+            'data_bytes': len(data),
+            'data_sha256': self._digest.hexdigest(),
+            'row_count': self.row_count,
+            'columns': columns,
+            'row_groups': self._row_groups,
+        }
+        return data, index
+
+
+class ColumnarEvidenceReader:
+    """Lazy reader: only the blocks of the requested columns and row groups are read."""
+
+    def __init__(self, index, data):
+        if index.get('format') != FORMAT_NAME or index.get('version') not in READABLE_VERSIONS:
+            raise ValueError('Unsupported evidence records format.')
+        self.index = index
+        self._source = BytesIO(data) if isinstance(data, (bytes, bytearray, memoryview)) else data
+        self._source.seek(0)
+        if self._source.read(len(MAGIC)) != MAGIC:
+            raise ValueError('Evidence records data file is not a columnar evidence file.')
+
+    @classmethod
+    def open(cls, index, data_path):
+        return cls(index, open(data_path, 'rb'))
+
+    def close(self):
+        self._source.close()
+
+    @property
+    def row_count(self):
+        return self.index['row_count']
+
+    @property
+    def columns(self):
+        return [column['name'] for column in self.index['columns']]
+
+    def _read_block(self, block):
+        self._source.seek(block['offset'])
+        packed = zlib.decompress(self._source.read(block['length']))
+        if block.get('encoding') == 'json':
+            return json.loads(packed)
+        values = msgpack.unpackb(packed, raw=False)
+        if block.get('encoding') == 'delta':
+            total = 0
+            for position, delta in enumerate(values):
+                total += delta
+                values[position] = total
+        return values
+
+    def _group_column(self, group, name):
+        block = group['columns'].get(name)
+        return self._read_block(block) if block is not None else [None] * group['rows']
+
+    def _group_presence(self, group, name, values):
+        block = group['columns'].get(name)
+        if block is None:
+            return [False] * group['rows']
+        if 'present' in block:
+            return self._read_block(block['present'])
+        if self.index['version'] == 1:
+            return [value is not None for value in values]
+        return [True] * group['rows']
+
+    def read_column(self, name, row_groups=None):
+        """All values of column *name* (optionally only the given row group numbers)."""
+        if name not in self.columns:
+            raise KeyError(name)
+        values = []
+        for number, group in enumerate(self.index['row_groups']):
+            if row_groups is None or number in row_groups:
+                values.extend(self._group_column(group, name))
+        return values
+
+    def iter_rows(self, columns=None):
+        """
+        Yield records as written, one row group at a time: columns a record
+        did not have are omitted, explicit nulls are kept, and non-dict
+        records come back as themselves.
+        """
+        names = self.columns if columns is None else list(columns)
+        for group in self.index['row_groups']:
+            group_values = [self._group_column(group, name) for name in names]
+            group_presence = [
+                self._group_presence(group, name, values) for name, values in zip(names, group_values)
+            ]
+            for row, present in zip(zip(*group_values), zip(*group_presence)):
+                record = {name: value for name, value, is_present in zip(names, row, present) if is_present}
+                if set(record) == {VALUE_COLUMN}:
+                    yield record[VALUE_COLUMN]
+                else:
+                    yield record
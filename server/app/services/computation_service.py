@@ -1,21 +1,35 @@
 import hashlib
 import json
+import os
 import re
 import gzip
-import base64
-from io import StringIO
-import csv
+import uuid
 from pathlib import PurePosixPath
 
 from app.exceptions import CoProofError
+from app.services.columnar_evidence import ColumnarEvidenceWriter
 from app.services.lean_service import LeanService
 
 
 class ComputationService:
     """Helpers for computation node request validation and artifact generation."""
 
+    # Streamed records (records_stream handles) are read from the volume the
+    # computation worker writes them to.
+    RECORDS_ROOT = os.environ.get('COMPUTATION_RECORDS_ROOT', '/var/lib/coproof/records')
+
     SUPPORTED_LANGUAGES = {'python'}
     DEFAULT_TIMEOUT_SECONDS = 120
+    SHARD_BACKENDS = {'local', 'celery'}
+    MAX_SHARDS = 64
+    # local: the worker's sandbox; local_slurm: `tasks` ranks as local processes;
+    # slurm: sbatch/srun on the cluster.
+    EXECUTORS = {'local', 'local_slurm', 'slurm'}
+    MAX_TASKS = 64
+    RUN_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{8,64}')
+    ADDITIVE_RESOURCE_FIELDS = (
+        'cpu_user_seconds', 'cpu_system_seconds', 'io_read_bytes', 'io_write_bytes', 'processes',
+    )
 
     @staticmethod
     def ensure_proof_node(node):
@@ -138,6 +152,48 @@ class ComputationService:
         if timeout_seconds <= 0 or timeout_seconds > 900:
             raise CoProofError('timeout_seconds must be between 1 and 900.', code=400)
 
+        # Sharded jobs: user code also defines shard(input_data, target, k) and
+        # optionally reduce(results); each shard gets its own timeout_seconds.
+        shards = payload.get('shards') or 1
+        try:
+            shards = int(shards)
+        except (TypeError, ValueError):
+            raise CoProofError('shards must be an integer.', code=400)
+
+        if shards <= 0 or shards > ComputationService.MAX_SHARDS:
+            raise CoProofError(f'shards must be between 1 and {ComputationService.MAX_SHARDS}.', code=400)
+
+        shard_backend = (payload.get('shard_backend') or 'local').strip().lower()
+        if shard_backend not in ComputationService.SHARD_BACKENDS:
+            supported = ', '.join(sorted(ComputationService.SHARD_BACKENDS))
+            raise CoProofError(f'Unsupported shard_backend. Supported values: {supported}', code=400)
+
+        # Cluster executors run `tasks` ranks of the entrypoint (RANK / WORLD_SIZE)
+        # and combine them with reduce(results) like shards.
+        executor = (payload.get('executor') or 'local').strip().lower()
+        if executor not in ComputationService.EXECUTORS:
+            supported = ', '.join(sorted(ComputationService.EXECUTORS))
+            raise CoProofError(f'Unsupported executor. Supported values: {supported}', code=400)
+
+        tasks = payload.get('tasks') or 1
+        try:
+            tasks = int(tasks)
+        except (TypeError, ValueError):
+            raise CoProofError('tasks must be an integer.', code=400)
+
+        if tasks <= 0 or tasks > ComputationService.MAX_TASKS:
+            raise CoProofError(f'tasks must be between 1 and {ComputationService.MAX_TASKS}.', code=400)
+        if executor == 'local' and tasks > 1:
+            raise CoProofError('tasks > 1 needs the local_slurm or slurm executor.', code=400)
+        if executor != 'local' and shards > 1:
+            raise CoProofError(f'The {executor} executor runs ranks, not shards; use tasks instead.', code=400)
+
+        # Progress reports of this run are relayed to the socket room
+        # 'computation:<run_id>'; clients pick the id to join the room first.
+        run_id = str(payload.get('run_id') or uuid.uuid4().hex)
+        if not ComputationService.RUN_ID_PATTERN.fullmatch(run_id):
+            raise CoProofError('run_id must be 8-64 letters, digits, dashes or underscores.', code=400)
+
         return {
             'language': language,
             'source_code': source_code.rstrip() + '\n',
@@ -146,6 +202,16 @@ class ComputationService:
             'target': target,
             'lean_statement': lean_statement.strip(),
             'timeout_seconds': timeout_seconds,
+            'shards': shards,
+            'shard_backend': shard_backend,
+            'executor': executor,
+            'tasks': tasks,
+            # Skip the worker's memoized result and run the program again.
+            'force': bool(payload.get('force', False)),
+            # Continue from the checkpoint of an earlier timed-out or crashed run
+            # of the same job; false discards it and starts over.
+            'resume': bool(payload.get('resume', True)),
+            'run_id': run_id,
         }
 
     @staticmethod
@@ -156,12 +222,50 @@ class ComputationService:
             'target': request_data['target'],
             'lean_statement': request_data['lean_statement'],
             'timeout_seconds': request_data['timeout_seconds'],
+            'shards': request_data.get('shards', 1),
+            'shard_backend': request_data.get('shard_backend', 'local'),
+            'executor': request_data.get('executor', 'local'),
+            'tasks': request_data.get('tasks', 1),
         }
 
     @staticmethod
-    def summarize_computation_result(computation_result):
+    def count_records(computation_result):
         records = computation_result.get('records')
         records_count = len(records) if isinstance(records, list) else 0
+        records_stream = computation_result.get('records_stream')
+        if isinstance(records_stream, dict):
+            records_count += int(records_stream.get('count') or 0)
+        return records_count
+
+    @staticmethod
+    def _records_chunk_path(chunk):
+        root = os.path.realpath(ComputationService.RECORDS_ROOT)
+        path = os.path.realpath(os.path.join(root, str(chunk)))
+        if not path.startswith(root + os.sep):
+            raise CoProofError('Invalid computation records chunk path.', code=400)
+        if not os.path.isfile(path):
+            raise CoProofError('Streamed computation records are no longer available.', code=410)
+        return path
+
+    @staticmethod
+    def iter_records(computation_result):
+        """Yield the inline records, then the streamed ones chunk by chunk."""
+        records = computation_result.get('records')
+        if isinstance(records, list):
+            yield from records
+
+        records_stream = computation_result.get('records_stream')
+        if not isinstance(records_stream, dict):
+            return
+        for chunk in records_stream.get('chunks') or []:
+            with gzip.open(ComputationService._records_chunk_path(chunk), 'rt', encoding='utf-8') as handle:
+                for line in handle:
+                    if line.strip():
+                        yield json.loads(line)
+
+    @staticmethod
+    def summarize_computation_result(computation_result, run_id=None):
+        records_count = ComputationService.count_records(computation_result)
         evidence = computation_result.get('evidence')
         evidence_preview = evidence
 
@@ -186,6 +290,17 @@ class ComputationService:
             'timing_source': computation_result.get('timing_source'),
             'records_count': records_count,
             'evidence_preview': evidence_preview,
+            'shards': computation_result.get('shards', 1),
+            'shard_backend': computation_result.get('shard_backend'),
+            'world_size': computation_result.get('world_size', 1),
+            'cache_hit': bool(computation_result.get('cache_hit', False)),
+            'accumulated_runtime_seconds': computation_result.get('accumulated_runtime_seconds'),
+            'attempts': computation_result.get('attempts'),
+            'resumed_from_checkpoint': bool(computation_result.get('resumed_from_checkpoint', False)),
+            'checkpoint_available': bool(computation_result.get('checkpoint_available', False)),
+            'cancelled': bool(computation_result.get('cancelled', False)),
+            'run_id': run_id,
+            'resources': computation_result.get('resources'),
         }
 
     @staticmethod
@@ -265,8 +380,7 @@ class ComputationService:
 
     @staticmethod
     def build_evidence_document(node_name, request_data, computation_result):
-        records = computation_result.get('records')
-        records_count = len(records) if isinstance(records, list) else 0
+        records_count = ComputationService.count_records(computation_result)
         return {
             'node_name': node_name,
             'language': request_data['language'],
@@ -281,36 +395,68 @@ class ComputationService:
             'stderr': computation_result.get('stderr', ''),
             'error': computation_result.get('error'),
             'processing_time_seconds': computation_result.get('processing_time_seconds'),
+            # Runtime over every attempt when the job was resumed from checkpoints.
+            'accumulated_runtime_seconds': computation_result.get('accumulated_runtime_seconds'),
+            'attempts': computation_result.get('attempts'),
+            # CPU time, peak RSS, I/O bytes and process count measured by the worker.
+            'resources': computation_result.get('resources'),
         }
 
     @staticmethod
-    def _gzip_b64_from_text(text):
-        compressed = gzip.compress(text.encode('utf-8'))
-        return base64.b64encode(compressed).decode('ascii')
+    def aggregate_resource_usage(nodes):
+        """
+        Totals and maxima of the resources recorded in the last computation
+        result of each computation node, plus the per-node figures sorted by
+        CPU time (heaviest first). Cache hits repeat the resources of the run
+        they were served from and are left out of the totals.
+        """
+        totals = {field: 0 for field in ComputationService.ADDITIVE_RESOURCE_FIELDS}
+        maxima = {'peak_rss_bytes': 0, 'processing_time_seconds': 0.0, 'cpu_seconds': 0.0}
+        per_node = []
+        for node in nodes:
+            result = node.last_computation_result
+            if node.node_kind != 'computation' or not isinstance(result, dict):
+                continue
+            resources = result.get('resources') or {}
+            cpu_user = resources.get('cpu_user_seconds')
+            cpu_system = resources.get('cpu_system_seconds')
+            cpu_seconds = cpu_user + cpu_system if cpu_user is not None and cpu_system is not None else None
+            if not result.get('cache_hit'):
+                for field in totals:
+                    totals[field] += resources.get(field) or 0
+            maxima['peak_rss_bytes'] = max(maxima['peak_rss_bytes'], resources.get('peak_rss_bytes') or 0)
+            maxima['processing_time_seconds'] = max(
+                maxima['processing_time_seconds'], result.get('processing_time_seconds') or 0.0
+            )
+            maxima['cpu_seconds'] = max(maxima['cpu_seconds'], cpu_seconds or 0.0)
+            per_node.append({
+                'node_id': str(node.id),
+                'name': node.name,
+                'completed': result.get('completed'),
+                'cache_hit': result.get('cache_hit'),
+                'processing_time_seconds': result.get('processing_time_seconds'),
+                'timeout_seconds': (node.computation_spec or {}).get('timeout_seconds'),
+                'cpu_seconds': round(cpu_seconds, 6) if cpu_seconds is not None else None,
+                'resources': resources or None,
+            })
+
+        per_node.sort(key=lambda entry: entry['cpu_seconds'] or 0.0, reverse=True)
+        return {
+            'computation_nodes': len(per_node),
+            'measured_nodes': sum(1 for entry in per_node if entry['resources']),
+            'totals': {field: round(value, 6) for field, value in totals.items()},
+            'maxima': maxima,
+            'nodes': per_node,
+        }
 
     @staticmethod
-    def _records_to_csv(records):
-        if not isinstance(records, list) or not records:
-            return ""
-
-        normalized = [item for item in records if isinstance(item, dict)]
-        if not normalized:
-            return ""
-
-        headers = sorted({key for item in normalized for key in item.keys()})
-        buffer = StringIO()
-        writer = csv.DictWriter(buffer, fieldnames=headers, extrasaction='ignore')
-        writer.writeheader()
-        for item in normalized:
-            row = {}
-            for key in headers:
-                value = item.get(key)
-                if isinstance(value, (dict, list)):
-                    row[key] = json.dumps(value, ensure_ascii=True, sort_keys=True)
-                else:
-                    row[key] = value
-            writer.writerow(row)
-        return buffer.getvalue()
+    def _records_to_columnar(computation_result, data_file):
+        """Single pass over all records into the columnar format; returns (data, index) or (b'', None)."""
+        writer = ColumnarEvidenceWriter()
+        writer.extend(ComputationService.iter_records(computation_result))
+        if not writer.row_count:
+            return b'', None
+        return writer.finish(data_file=data_file)
 
     @staticmethod
     def build_lean_artifact(node_name, request_data, evidence_doc, evidence_path, program_path):
@@ -354,25 +500,35 @@ class ComputationService:
         program_filename = 'computation.py' if request_data['language'] == 'python' else 'computation.txt'
         program_path = str(folder / program_filename)
         evidence_path = str(folder / 'evidence.json')
-        evidence_full_compressed_path = str(folder / 'evidence_full.json.gz.b64')
-        evidence_records_csv_compressed_path = str(folder / 'evidence_records.csv.gz.b64')
+        evidence_full_path = str(folder / 'evidence_full.json.gz')
+        evidence_records_index_path = str(folder / 'evidence_records.index.json')
+        evidence_records_data_path = str(folder / 'evidence_records.cols')
         tex_path = str(folder / 'main.tex')
 
         evidence_doc = ComputationService.build_evidence_document(node_name, request_data, computation_result)
-        full_result_json = json.dumps(computation_result, indent=2, sort_keys=True, ensure_ascii=True) + '\n'
-        records_csv = ComputationService._records_to_csv(computation_result.get('records'))
-        records_csv_gz_b64 = ComputationService._gzip_b64_from_text(records_csv) if records_csv else ''
-        full_result_gz_b64 = ComputationService._gzip_b64_from_text(full_result_json)
+        records_data, records_index = ComputationService._records_to_columnar(
+            computation_result,
+            data_file=PurePosixPath(evidence_records_data_path).name,
+        )
+        # Records live in the columnar artifact; the stream handle is local to the worker volume.
+        full_result = {
+            key: value for key, value in computation_result.items()
+            if key not in ('records', 'records_stream')
+        }
+        full_result_json = json.dumps(full_result, sort_keys=True, ensure_ascii=True, separators=(',', ':')).encode('utf-8')
+        full_result_gz = gzip.compress(full_result_json, mtime=0)
 
         evidence_doc['artifacts'] = {
-            'full_result_compressed_b64': evidence_full_compressed_path,
-            'records_csv_compressed_b64': evidence_records_csv_compressed_path if records_csv else None,
+            'full_result': evidence_full_path,
+            'records_index': evidence_records_index_path if records_index else None,
+            'records_data': evidence_records_data_path if records_index else None,
             'decompress_hint': (
-                "Python: import gzip,base64,pathlib; raw=base64.b64decode(pathlib.Path('<file>.gz.b64').read_text()); "
-                "print(gzip.decompress(raw).decode('utf-8')[:500])"
+                "Full result: gunzip evidence_full.json.gz. Records: every block listed in "
+                "evidence_records.index.json is zlib(msgpack(column values)) at its offset/length in "
+                "evidence_records.cols; app.services.columnar_evidence.ColumnarEvidenceReader reads them lazily."
             ),
-            'full_result_hash_sha256': hashlib.sha256(full_result_json.encode('utf-8')).hexdigest(),
-            'records_csv_hash_sha256': hashlib.sha256(records_csv.encode('utf-8')).hexdigest() if records_csv else None,
+            'full_result_hash_sha256': hashlib.sha256(full_result_json).hexdigest(),
+            'records_data_hash_sha256': records_index['data_sha256'] if records_index else None,
         }
 
         bundle = {
@@ -385,11 +541,12 @@ class ComputationService:
             ),
             program_path: request_data['source_code'],
             evidence_path: json.dumps(evidence_doc, indent=2, sort_keys=True, ensure_ascii=True) + '\n',
-            evidence_full_compressed_path: full_result_gz_b64 + '\n',
+            evidence_full_path: full_result_gz,
             tex_path: ComputationService.build_tex_artifact(node_name, evidence_doc),
         }
 
-        if records_csv_gz_b64:
-            bundle[evidence_records_csv_compressed_path] = records_csv_gz_b64 + '\n'
+        if records_index:
+            bundle[evidence_records_index_path] = json.dumps(records_index, indent=2, ensure_ascii=True) + '\n'
+            bundle[evidence_records_data_path] = records_data
 
         return bundle
\ No newline at end of file
@@ -160,7 +160,10 @@ class GitHubService:
 
     @staticmethod
     def commit_files(remote_repo_url, token, branch, files, commit_message):
-        """Commit multiple file contents directly to a branch using GitHub Git Data API."""
+        """
+        Commit multiple file contents directly to a branch using GitHub Git Data API.
+        Text contents are sent as UTF-8; bytes contents are committed as binary blobs.
+        """
         if not files:
             raise CoProofError("No files provided for commit operation.", code=400)
 
@@ -170,10 +173,14 @@ class GitHubService:
 
         tree_entries = []
         for path, content in files.items():
+            if isinstance(content, (bytes, bytearray)):
+                blob_payload = {"content": base64.b64encode(content).decode('ascii'), "encoding": "base64"}
+            else:
+                blob_payload = {"content": content, "encoding": "utf-8"}
             blob_response = requests.post(
                 f"https://api.github.com/repos/{full_name}/git/blobs",
                 headers=GitHubService.github_headers(token),
-                json={"content": content, "encoding": "utf-8"},
+                json=blob_payload,
                 timeout=20,
             )
 
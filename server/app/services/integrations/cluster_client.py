@@ -1,5 +1,61 @@
+import logging
+import uuid
+
+import redis
+
+from app.exceptions import CoProofError
 from app.services.integrations.computation_client import ComputationClient
 
+logger = logging.getLogger(__name__)
+
 
 class ClusterClient(ComputationClient):
-    """Compatibility alias for legacy callers still importing ClusterClient."""
+    """
+    Asynchronous computation jobs on the worker's executors (local,
+    local_slurm, slurm). Submitting returns a job id right away; the worker
+    keeps the job state, which callers poll. Synchronous runs stay on
+    ComputationClient.run_computation.
+    """
+
+    # Polling a finished Slurm job collects and reduces its rank outputs.
+    STATUS_TIMEOUT_SECONDS = 150
+    # Who submitted each job; kept as long as the worker keeps the job state.
+    JOB_OWNER_PREFIX = 'computation:job-owner:'
+
+    @classmethod
+    def submit_job(cls, owner: str, job: dict):
+        if not isinstance(job, dict):
+            raise CoProofError('Computation job payload must be an object.', code=400)
+
+        job_id = uuid.uuid4().hex
+        cls.start_run(owner, job.get('run_id') or job_id)
+        try:
+            cls._get_redis().set(cls.JOB_OWNER_PREFIX + job_id, str(owner), ex=cls.JOB_TTL_SECONDS)
+            cls._get_celery().send_task(
+                'tasks.submit_computation',
+                args=[job_id, job],
+                queue=cls.COMPUTATION_QUEUE_NAME,
+            )
+        except Exception as error:
+            logger.error(f'Computation job submission failed: {error}')
+            raise CoProofError(f'Computation Worker Unavailable: {str(error)}', code=503)
+        return {
+            'job_id': job_id,
+            'run_id': job.get('run_id') or job_id,
+            'executor': job.get('executor', 'local'),
+            'state': 'queued',
+        }
+
+    @classmethod
+    def get_job_status(cls, owner: str, job_id: str):
+        """State of a job *owner* submitted; finished jobs carry their `result`."""
+        try:
+            submitter = cls._get_redis().get(cls.JOB_OWNER_PREFIX + job_id)
+        except redis.RedisError as error:
+            logger.error(f'Computation job owner lookup failed: {error}')
+            raise CoProofError(f'Computation Service Unavailable: {str(error)}', code=503)
+        if submitter is None:
+            raise CoProofError('Computation job not found or expired.', code=404)
+        if submitter.decode('utf-8') != str(owner):
+            raise CoProofError('This computation job belongs to another user.', code=403)
+        return cls._dispatch_task('tasks.computation_job_status', [job_id], timeout=cls.STATUS_TIMEOUT_SECONDS)
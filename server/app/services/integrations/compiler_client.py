@@ -1,19 +1,51 @@
+import hashlib
+import json
 import logging
 import os
+import re
 import time
+import uuid
+import zlib
+import redis
 from celery import Celery
-from celery.exceptions import CeleryError, TimeoutError
+from celery.exceptions import CeleryError, TaskRevokedError, TimeoutError
+from celery.utils import worker_direct
 from app.exceptions import CoProofError
+from app.services.integrations.result_serialization import CELERY_RESULT_SETTINGS, register
+
+register()
 
 logger = logging.getLogger(__name__)
 
 class CompilerClient:
     """
     Interface for the external Lean worker via Celery.
+
+    Two lanes: interactive checks (a user waiting on the response) go to
+    LEAN_INTERACTIVE_QUEUE_NAME, project builds and bulk checks go to
+    LEAN_QUEUE_NAME. Each lane is consumed by its own worker pool.
     """
     REDIS_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
     LEAN_QUEUE_NAME = os.environ.get('CELERY_LEAN_QUEUE', 'lean_queue')
+    LEAN_INTERACTIVE_QUEUE_NAME = os.environ.get('CELERY_LEAN_INTERACTIVE_QUEUE', 'lean_interactive_queue')
+    LEAN_SESSION_QUEUE_NAME = os.environ.get('CELERY_LEAN_SESSION_QUEUE', 'lean_session_queue')
+    SESSION_TTL_SECONDS = int(os.environ.get('LEAN_SESSION_IDLE_SECONDS', '600'))
+    SESSION_PREFIX = 'lean:session:'
+    SESSION_USER_PREFIX = 'lean:session-user:'
+    SESSIONS_PER_USER = int(os.environ.get('LEAN_SESSIONS_PER_USER', '2'))
+    INFLIGHT_TTL_SECONDS = int(os.environ.get('LEAN_INFLIGHT_TTL_SECONDS', '300'))
+    INFLIGHT_PREFIX = 'lean:inflight:'
+    INFLIGHT_TASK_PREFIX = 'lean:inflight-task:'
+    SUPERSEDE_PREFIX = 'lean:supersede:'
+    LOG_PREFIX = 'coproof:log:'
     _celery = None
+    _redis = None
+
+    # Deletes the in-flight marker only if it still points at the given task.
+    _RELEASE_SCRIPT = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then "
+        "return redis.call('del', KEYS[1]) else return 0 end"
+    )
 
     @classmethod
     def _get_celery(cls):
@@ -23,26 +55,187 @@ class CompilerClient:
                 broker=cls.REDIS_URL,
                 backend=cls.REDIS_URL,
             )
+            cls._celery.conf.update(CELERY_RESULT_SETTINGS)
         return cls._celery
 
+    @classmethod
+    def _get_redis(cls):
+        if cls._redis is None:
+            cls._redis = redis.Redis.from_url(cls.REDIS_URL)
+        return cls._redis
+
+    @classmethod
+    def _inflight_key(cls, task_name: str, args: list, queue_name: str):
+        # Per queue, so an interactive call never waits on a batch-lane task.
+        payload = json.dumps([task_name, args, queue_name], sort_keys=True, default=str)
+        return cls.INFLIGHT_PREFIX + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def _submit_task(cls, task_name: str, args: list, queue_name=None, singleflight: bool = True):
+        """
+        Singleflight submission: returns (AsyncResult, inflight_key, shared)
+        where *shared* tells whether an identical task that was already queued
+        or running was joined instead of sending a new one.
+        Identity is the hash of task name, arguments and queue, tracked in Redis
+        under `lean:inflight:<hash>` for at most LEAN_INFLIGHT_TTL_SECONDS.
+        With singleflight=False (tasks with side effects) a new task is always sent.
+        """
+        celery_app = cls._get_celery()
+        queue_name = queue_name or cls.LEAN_QUEUE_NAME
+        if singleflight:
+            key = cls._inflight_key(task_name, args, queue_name)
+            try:
+                client = cls._get_redis()
+                for _ in range(2):
+                    task_id = str(uuid.uuid4())
+                    if client.set(key, task_id, nx=True, ex=cls.INFLIGHT_TTL_SECONDS):
+                        try:
+                            task = celery_app.send_task(
+                                task_name,
+                                args=args,
+                                queue=queue_name,
+                                task_id=task_id,
+                            )
+                        except Exception:
+                            # Nothing was sent: identical requests must not join this id.
+                            cls._release_inflight(key, task_id)
+                            raise
+                        return task, key, False
+
+                    existing = client.get(key)
+                    if existing is None:
+                        continue
+                    task = celery_app.AsyncResult(existing.decode('utf-8'))
+                    if task.state in ('FAILURE', 'REVOKED'):
+                        client.eval(cls._RELEASE_SCRIPT, 1, key, task.id)
+                        continue
+                    return task, key, True
+            except redis.RedisError as e:
+                logger.warning(f'In-flight deduplication unavailable ({task_name}): {e}')
+
+        task = celery_app.send_task(task_name, args=args, queue=queue_name)
+        return task, None, False
+
+    @classmethod
+    def _release_inflight(cls, key: str | None, task_id: str):
+        if key is None:
+            return
+        try:
+            cls._get_redis().eval(cls._RELEASE_SCRIPT, 1, key, task_id)
+        except redis.RedisError as e:
+            logger.warning(f'Could not release in-flight marker {key}: {e}')
+
+    @classmethod
+    def _supersede(cls, supersede_key: str | None, task, inflight_key: str | None):
+        """
+        Record *task* as the latest verification for *supersede_key* (e.g.
+        "<project_id>:<node_id>") and revoke the previous one, queued or
+        running, when it was for a different payload.
+        """
+        if not supersede_key:
+            return
+        key = cls.SUPERSEDE_PREFIX + supersede_key
+        current = json.dumps({'task_id': task.id, 'payload': inflight_key})
+        try:
+            pipeline = cls._get_redis().pipeline()
+            pipeline.getset(key, current)
+            pipeline.expire(key, cls.INFLIGHT_TTL_SECONDS)
+            previous_raw = pipeline.execute()[0]
+        except redis.RedisError as e:
+            logger.warning(f'Could not record latest verification for {supersede_key}: {e}')
+            return
+
+        if previous_raw is None:
+            return
+        previous = json.loads(previous_raw)
+        if previous.get('task_id') == task.id or previous.get('payload') == inflight_key:
+            return
+
+        # SIGUSR1 raises SoftTimeLimitExceeded inside the task, so the worker
+        # kills its lean subprocess and keeps the child process alive.
+        cls._get_celery().control.revoke(previous['task_id'], terminate=True, signal='SIGUSR1')
+        if previous.get('payload'):
+            cls._release_inflight(previous['payload'], previous['task_id'])
+        logger.info(f"Superseded lean task {previous['task_id']} for {supersede_key}")
+
+    @classmethod
+    def _is_superseded(cls, supersede_key: str | None, task_id: str):
+        if not supersede_key:
+            return False
+        try:
+            latest = cls._get_redis().get(cls.SUPERSEDE_PREFIX + supersede_key)
+        except redis.RedisError:
+            return False
+        return latest is not None and json.loads(latest).get('task_id') != task_id
+
+    @classmethod
+    def submit_task(
+        cls,
+        task_name: str,
+        args: list,
+        queue_name: str | None = None,
+        supersede_key: str | None = None,
+    ):
+        """
+        Non-blocking singleflight dispatch. Returns the id of the task that will carry the result.
+        Call release_submitted once the result has been read.
+        """
+        task, key, _shared = cls._submit_task(task_name, args, queue_name)
+        cls._supersede(supersede_key, task, key)
+        if key is not None:
+            try:
+                cls._get_redis().set(cls.INFLIGHT_TASK_PREFIX + task.id, key, ex=cls.INFLIGHT_TTL_SECONDS)
+            except redis.RedisError as e:
+                logger.warning(f'Could not record in-flight marker of task {task.id}: {e}')
+        return task.id
+
+    @classmethod
+    def release_submitted(cls, task_id: str):
+        """Drop the in-flight marker of a finished submit_task task, so new requests start a fresh task."""
+        try:
+            key = cls._get_redis().getdel(cls.INFLIGHT_TASK_PREFIX + task_id)
+        except redis.RedisError as e:
+            logger.warning(f'Could not release in-flight marker of task {task_id}: {e}')
+            return
+        if key is not None:
+            cls._release_inflight(key.decode('utf-8'), task_id)
+
     @classmethod
     def _dispatch_task(
         cls,
         task_name: str,
         args: list,
         timeout: int,
-        queue_name: str | None = None,
+        queue_name=None,
+        supersede_key: str | None = None,
+        singleflight: bool = True,
     ):
         try:
-            task = cls._get_celery().send_task(
-                task_name,
-                args=args,
-                queue=queue_name or cls.LEAN_QUEUE_NAME,
-            )
-            return task.get(timeout=timeout)
+            deadline = time.monotonic() + timeout
+            task, key, shared = cls._submit_task(task_name, args, queue_name, singleflight)
+            cls._supersede(supersede_key, task, key)
+            try:
+                result = task.get(timeout=timeout)
+            except TimeoutError:
+                # The task keeps running; later identical requests still attach to it.
+                raise
+            except Exception as e:
+                cls._release_inflight(key, task.id)
+                remaining = deadline - time.monotonic()
+                if not shared or remaining <= 1 or cls._is_superseded(supersede_key, task.id):
+                    raise
+                # The task we joined failed; retry once with a task of our own.
+                logger.warning(f'Shared lean task {task.id} failed ({task_name}), re-dispatching: {e}')
+                task, key, _shared = cls._submit_task(task_name, args, queue_name)
+                result = task.get(timeout=remaining)
+            cls._release_inflight(key, task.id)
+            return result
         except TimeoutError as e:
             logger.error(f'Lean worker task timeout ({task_name}): {e}')
             raise CoProofError('Lean Worker Timeout', code=504)
+        except TaskRevokedError as e:
+            logger.info(f'Lean worker task superseded ({task_name}): {e}')
+            raise CoProofError('Verification superseded by a newer request for this node', code=409)
         except CeleryError as e:
             logger.error(f'Lean worker task failure ({task_name}): {e}')
             raise CoProofError(f'Lean Worker Unavailable: {str(e)}', code=503)
@@ -52,18 +245,32 @@ class CompilerClient:
 
 
     @staticmethod
-    def verify_snippet(lean_code: str, dependencies: list = None):
+    def verify_snippet(
+        lean_code: str,
+        dependencies: list = None,
+        minimize_imports: bool = False,
+        interactive: bool = True,
+        supersede_key: str = None,
+    ):
         """
         Ephemeral Check: Sends raw code to check for syntax/type errors.
         Does NOT require a full Git repo sync.
+        With minimize_imports, `import Mathlib` is narrowed to the modules the
+        code uses; the narrowed set is returned as `narrowed_imports`.
+        `import_minimization` is "suggested" when the code was checked with
+        its full header on a warm REPL process.
+        A newer call with the same supersede_key revokes this one (HTTP 409).
         """
         try:
             started = time.perf_counter()
             data = CompilerClient._dispatch_task(
                 'tasks.verify_snippet',
-                [lean_code, 'snippet.lean'],
+                [lean_code, 'snippet.lean', bool(minimize_imports)],
                 timeout=45,
-                queue_name=CompilerClient.LEAN_QUEUE_NAME,
+                queue_name=(
+                    CompilerClient.LEAN_INTERACTIVE_QUEUE_NAME if interactive else CompilerClient.LEAN_QUEUE_NAME
+                ),
+                supersede_key=supersede_key,
             )
             elapsed = time.perf_counter() - started
 
@@ -82,10 +289,160 @@ class CompilerClient:
             raise CoProofError(f'Compiler Service Unavailable: {str(e)}', code=503)
 
     @staticmethod
-    def verify_project_files(file_map: dict, entry_file: str):
+    def check_syntax(lean_code: str):
+        """
+        Parse-only pre-check: reports certain syntax errors (fences, brackets,
+        unterminated comments, missing bodies, ...) in the `errors` shape of
+        verify_snippet without loading any imports. `valid` only means no
+        syntax error was found.
+        """
+        try:
+            started = time.perf_counter()
+            data = CompilerClient._dispatch_task(
+                'tasks.check_syntax',
+                [lean_code],
+                timeout=10,
+                queue_name=CompilerClient.LEAN_INTERACTIVE_QUEUE_NAME,
+            )
+            data['roundtrip_time_seconds'] = round(time.perf_counter() - started, 6)
+            return data
+        except CoProofError:
+            raise
+        except Exception as e:
+            logger.error(f'Syntax check failed: {e}')
+            raise CoProofError(f'Compiler Service Unavailable: {str(e)}', code=503)
+
+    @classmethod
+    def _session_worker(cls, owner: str, session_id: str):
+        """Worker holding *session_id*; 403 when the session belongs to someone else."""
+        try:
+            record = cls._get_redis().get(cls.SESSION_PREFIX + session_id)
+        except redis.RedisError as e:
+            raise CoProofError(f'Session registry unavailable: {e}', code=503)
+        try:
+            session = json.loads(record) if record is not None else None
+        except ValueError:
+            session = None
+        if not isinstance(session, dict):
+            raise CoProofError('Lean session not found or expired', code=404)
+        if session.get('owner') != str(owner):
+            raise CoProofError('This Lean session belongs to another user.', code=403)
+        return session['worker']
+
+    @classmethod
+    def _live_sessions(cls, owner: str):
+        """Session ids of *owner* that have not expired; expired ones are dropped from the set."""
+        r = cls._get_redis()
+        user_key = cls.SESSION_USER_PREFIX + str(owner)
+        session_ids = [member.decode('utf-8') for member in r.smembers(user_key)]
+        live = [sid for sid in session_ids if r.exists(cls.SESSION_PREFIX + sid)]
+        expired = set(session_ids) - set(live)
+        if expired:
+            r.srem(user_key, *expired)
+        return live
+
+    @classmethod
+    def _forget_session(cls, owner: str, session_id: str):
+        r = cls._get_redis()
+        r.delete(cls.SESSION_PREFIX + session_id)
+        r.srem(cls.SESSION_USER_PREFIX + str(owner), session_id)
+
+    @classmethod
+    def _session_result(cls, owner: str, data: dict):
+        """Remember which worker holds the session and who owns it, and surface worker-side errors."""
+        session_id = data.get('session_id')
+        if data.get('error'):
+            if data.get('expired') and session_id:
+                cls._forget_session(owner, session_id)
+            raise CoProofError(data['error'], code=404 if data.get('expired') else 503)
+        record = json.dumps({'worker': data['worker'], 'owner': str(owner)})
+        pipe = cls._get_redis().pipeline()
+        pipe.set(cls.SESSION_PREFIX + session_id, record, ex=cls.SESSION_TTL_SECONDS)
+        pipe.sadd(cls.SESSION_USER_PREFIX + str(owner), session_id)
+        pipe.expire(cls.SESSION_USER_PREFIX + str(owner), cls.SESSION_TTL_SECONDS)
+        pipe.execute()
+        return data
+
+    @classmethod
+    def open_session(cls, owner: str, lean_code: str = None):
+        """
+        Opens an incremental verification session for *owner* on a session
+        worker. The session keeps a Lean REPL with one environment per
+        top-level command, so update_session only re-elaborates from the first
+        changed block. Each user may hold LEAN_SESSIONS_PER_USER sessions.
+        Returns { session_id, ... } plus the check of *lean_code* if given.
+        """
+        limit_error = CoProofError(
+            f'You already have {cls.SESSIONS_PER_USER} open Lean sessions; close one first.',
+            code=429,
+        )
+        try:
+            if len(cls._live_sessions(owner)) >= cls.SESSIONS_PER_USER:
+                raise limit_error
+            data = cls._session_result(owner, cls._dispatch_task(
+                'tasks.open_session',
+                [lean_code],
+                timeout=300,
+                queue_name=cls.LEAN_SESSION_QUEUE_NAME,
+                singleflight=False,
+            ))
+            # Concurrent opens can both pass the check above; undo ours if so.
+            if len(cls._live_sessions(owner)) > cls.SESSIONS_PER_USER:
+                cls.close_session(owner, data['session_id'])
+                raise limit_error
+            return data
+        except CoProofError:
+            raise
+        except Exception as e:
+            logger.error(f'Opening a Lean session failed: {e}')
+            raise CoProofError(f'Compiler Service Unavailable: {str(e)}', code=503)
+
+    @classmethod
+    def update_session(cls, owner: str, session_id: str, lean_code: str):
+        """
+        Re-checks the session source. The call goes to the direct queue of the
+        worker holding the session. Result is VerifyCompilerResult-shaped plus
+        reused_blocks / rechecked_blocks / rechecked_from_line.
+        """
+        try:
+            return cls._session_result(owner, cls._dispatch_task(
+                'tasks.update_session',
+                [session_id, lean_code],
+                timeout=60,
+                queue_name=worker_direct(cls._session_worker(owner, session_id)),
+                singleflight=False,
+            ))
+        except CoProofError:
+            raise
+        except Exception as e:
+            logger.error(f'Lean session update failed: {e}')
+            raise CoProofError(f'Compiler Service Unavailable: {str(e)}', code=503)
+
+    @classmethod
+    def close_session(cls, owner: str, session_id: str):
+        try:
+            data = cls._dispatch_task(
+                'tasks.close_session',
+                [session_id],
+                timeout=10,
+                queue_name=worker_direct(cls._session_worker(owner, session_id)),
+                singleflight=False,
+            )
+            cls._forget_session(owner, session_id)
+            return data
+        except CoProofError:
+            raise
+        except Exception as e:
+            logger.error(f'Closing Lean session failed: {e}')
+            raise CoProofError(f'Compiler Service Unavailable: {str(e)}', code=503)
+
+    @staticmethod
+    def verify_project_files(file_map: dict, entry_file: str, supersede_key: str = None):
         """
         Project-aware verification: compiles one entry file with all provided Lean files available,
-        so imports are resolved consistently.
+        so imports are resolved consistently. Imported modules are built through the worker's
+        per-module .olean cache, so unchanged modules are not re-elaborated.
+        A newer call with the same supersede_key revokes this one (HTTP 409).
         """
         if not isinstance(file_map, dict) or not file_map:
             raise CoProofError('file_map must be a non-empty dictionary', code=400)
@@ -97,8 +454,10 @@ class CompilerClient:
             data = CompilerClient._dispatch_task(
                 'tasks.verify_project_files',
                 [file_map, entry_file],
-                timeout=45,
+                # The worker's budget for building imports plus the entry file is 90 s.
+                timeout=120,
                 queue_name=CompilerClient.LEAN_QUEUE_NAME,
+                supersede_key=supersede_key,
             )
             elapsed = time.perf_counter() - started
 
@@ -114,4 +473,39 @@ class CompilerClient:
             raise
         except Exception as e:
             logger.error(f'Project verification failed: {e}')
-            raise CoProofError(f'Compiler Service Unavailable: {str(e)}', code=503)
\ No newline at end of file
+            raise CoProofError(f'Compiler Service Unavailable: {str(e)}', code=503)
+
+    @classmethod
+    def fetch_log(cls, log_ref: str):
+        """
+        Full log of a lean or computation job whose result was capped (the
+        result's `log_ref`). Logs expire after COPROOF_LOG_TTL_SECONDS.
+        """
+        if not re.fullmatch(r'[0-9a-f]{32}', log_ref or ''):
+            raise CoProofError('Invalid log reference', code=400)
+        try:
+            data = cls._get_redis().get(cls.LOG_PREFIX + log_ref)
+        except redis.RedisError as e:
+            logger.error(f'Log store unavailable: {e}')
+            raise CoProofError(f'Log store unavailable: {str(e)}', code=503)
+        if data is None:
+            raise CoProofError('Log not found or expired', code=404)
+        return zlib.decompress(data).decode('utf-8', errors='replace')
+
+    @staticmethod
+    def get_cache_stats():
+        """
+        Hit/miss counters of the lean worker's content-addressed verification cache.
+        """
+        try:
+            return CompilerClient._dispatch_task(
+                'tasks.verification_cache_stats',
+                [],
+                timeout=10,
+                queue_name=CompilerClient.LEAN_QUEUE_NAME,
+            )
+        except CoProofError:
+            raise
+        except Exception as e:
+            logger.error(f'Verification cache stats failed: {e}')
+            raise CoProofError(f'Compiler Service Unavailable: {str(e)}', code=503)
@@ -1,9 +1,15 @@
+import json
 import logging
 import os
 import time
+import redis
 from celery import Celery
 from celery.exceptions import CeleryError, TimeoutError
 from app.exceptions import CoProofError
+from app.extensions import socketio
+from app.services.integrations.result_serialization import CELERY_RESULT_SETTINGS, register
+
+register()
 
 logger = logging.getLogger(__name__)
 
@@ -13,7 +19,18 @@ class ComputationClient:
 
     REDIS_URL = os.environ.get('REDIS_URL', 'redis://redis:6379/0')
     COMPUTATION_QUEUE_NAME = os.environ.get('CELERY_COMPUTATION_QUEUE', 'computation_queue')
+    # Progress reports and cancellation flags the worker keeps per run_id.
+    PROGRESS_PREFIX = 'computation:progress:'
+    CANCEL_PREFIX = 'computation:cancel:'
+    CANCEL_TTL_SECONDS = 3600
+    # The user a client-chosen run_id belongs to; kept as long as submitted jobs.
+    RUN_OWNER_PREFIX = 'computation:run-owner:'
+    JOB_TTL_SECONDS = int(os.environ.get('COMPUTATION_JOB_TTL_SECONDS', str(7 * 24 * 3600)))
+    PROGRESS_POLL_SECONDS = 1.0
+    # Local sharded and local_slurm runs may take this many timeouts in total (the worker enforces it).
+    SHARDED_TIMEOUT_FACTOR = int(os.environ.get('COMPUTATION_SHARDED_TIMEOUT_FACTOR', '4'))
     _celery = None
+    _redis = None
 
     @classmethod
     def _get_celery(cls):
@@ -23,17 +40,99 @@ class ComputationClient:
                 broker=cls.REDIS_URL,
                 backend=cls.REDIS_URL,
             )
+            cls._celery.conf.update(CELERY_RESULT_SETTINGS)
         return cls._celery
 
     @classmethod
-    def _dispatch_task(cls, task_name: str, args: list, timeout: int):
+    def _get_redis(cls):
+        if cls._redis is None:
+            cls._redis = redis.Redis.from_url(cls.REDIS_URL)
+        return cls._redis
+
+    @classmethod
+    def claim_run(cls, owner: str, run_id: str):
+        """Tie *run_id* to *owner*; 409 when another user already uses it."""
+        key = cls.RUN_OWNER_PREFIX + run_id
         try:
-            task = cls._get_celery().send_task(
-                task_name,
-                args=args,
-                queue=cls.COMPUTATION_QUEUE_NAME,
-            )
+            r = cls._get_redis()
+            if not r.set(key, str(owner), nx=True, ex=cls.JOB_TTL_SECONDS):
+                current = r.get(key)
+                if current is not None and current.decode('utf-8') != str(owner):
+                    raise CoProofError('run_id is already used by another user.', code=409)
+                r.expire(key, cls.JOB_TTL_SECONDS)
+        except redis.RedisError as error:
+            logger.error(f'Computation run claim failed: {error}')
+            raise CoProofError(f'Computation Service Unavailable: {str(error)}', code=503)
+
+    @classmethod
+    def start_run(cls, owner: str, run_id: str):
+        """Claim *run_id* and drop the cancel flag and progress an earlier run with this id left."""
+        cls.claim_run(owner, run_id)
+        try:
+            cls._get_redis().delete(cls.CANCEL_PREFIX + run_id, cls.PROGRESS_PREFIX + run_id)
+        except redis.RedisError as error:
+            logger.error(f'Computation run start failed: {error}')
+            raise CoProofError(f'Computation Service Unavailable: {str(error)}', code=503)
+
+    @classmethod
+    def _end_run(cls, run_id: str):
+        try:
+            cls._get_redis().delete(cls.CANCEL_PREFIX + run_id)
+        except redis.RedisError as error:
+            logger.warning(f'Could not clear the cancel flag of {run_id}: {error}')
+
+    @classmethod
+    def ensure_run_owner(cls, owner: str, run_id: str):
+        """404 unless *run_id* was claimed, 403 unless by *owner*."""
+        try:
+            current = cls._get_redis().get(cls.RUN_OWNER_PREFIX + run_id)
+        except redis.RedisError as error:
+            logger.error(f'Computation run owner lookup failed: {error}')
+            raise CoProofError(f'Computation Service Unavailable: {str(error)}', code=503)
+        if current is None:
+            raise CoProofError('Computation run not found or expired.', code=404)
+        if current.decode('utf-8') != str(owner):
+            raise CoProofError('This computation run belongs to another user.', code=403)
+
+    @classmethod
+    def _relay_progress(cls, run_id: str, last):
+        """Emit the run's latest progress report to its socket room when it changed."""
+        try:
+            raw = cls._get_redis().get(cls.PROGRESS_PREFIX + run_id)
+        except redis.RedisError as e:
+            logger.warning(f'Could not read computation progress for {run_id}: {e}')
+            return last
+        if raw is not None and raw != last:
+            socketio.emit('computation_progress', json.loads(raw), to=f'computation:{run_id}')
+        return raw if raw is not None else last
+
+    @classmethod
+    def _wait(cls, task, timeout: int, run_id: str | None):
+        if not run_id:
             return task.get(timeout=timeout)
+        deadline = time.monotonic() + timeout
+        last = None
+        while True:
+            try:
+                return task.get(timeout=max(0.01, min(cls.PROGRESS_POLL_SECONDS, deadline - time.monotonic())))
+            except TimeoutError:
+                if time.monotonic() >= deadline:
+                    raise
+                last = cls._relay_progress(run_id, last)
+
+    @classmethod
+    def _dispatch_tasks(cls, task_name: str, args_list: list, timeout: int, run_id: str | None = None):
+        """
+        Send one task per args entry, then wait for each result (up to *timeout*
+        each). With a *run_id*, progress reports are relayed while waiting.
+        """
+        try:
+            celery = cls._get_celery()
+            tasks = [
+                celery.send_task(task_name, args=args, queue=cls.COMPUTATION_QUEUE_NAME)
+                for args in args_list
+            ]
+            return [cls._wait(task, timeout, run_id) for task in tasks]
         except TimeoutError as error:
             logger.error(f'Computation worker task timeout ({task_name}): {error}')
             raise CoProofError('Computation Worker Timeout', code=504)
@@ -44,20 +143,64 @@ class ComputationClient:
             logger.error(f'Computation worker dispatch error ({task_name}): {error}')
             raise CoProofError(f'Computation Worker Unavailable: {str(error)}', code=503)
 
+    @classmethod
+    def _dispatch_task(cls, task_name: str, args: list, timeout: int, run_id: str | None = None):
+        return cls._dispatch_tasks(task_name, [args], timeout, run_id)[0]
+
+    @staticmethod
+    def _run_sharded(job: dict, timeout: int):
+        """
+        Fan a sharded job out over the computation workers: plan the shards,
+        run each as its own `tasks.run_computation`, then reduce the results.
+        """
+        plan = ComputationClient._dispatch_task('tasks.plan_computation_shards', [job], timeout=timeout)
+        if not plan.get('completed'):
+            return plan
+
+        shard_jobs = [
+            {**job, 'input_data': shard_input, 'shards': 1, 'shard_index': index}
+            for index, shard_input in enumerate(plan['shards'])
+        ]
+        shard_results = ComputationClient._dispatch_tasks(
+            'tasks.run_computation',
+            [[shard_job] for shard_job in shard_jobs],
+            timeout=timeout,
+            run_id=job.get('run_id'),
+        )
+        data = ComputationClient._dispatch_task(
+            'tasks.reduce_computation_shards',
+            [job, shard_results],
+            timeout=timeout,
+        )
+        data['shard_backend'] = 'celery'
+        return data
+
     @staticmethod
-    def run_computation(job: dict):
+    def run_computation(owner: str, job: dict):
         if not isinstance(job, dict):
             raise CoProofError('Computation job payload must be an object.', code=400)
 
         timeout_seconds = int(job.get('timeout_seconds') or 120)
+        run_id = job.get('run_id')
+        if run_id:
+            ComputationClient.start_run(owner, run_id)
+
+        sharded = int(job.get('shards') or 1) > 1
+        multi_part = sharded or int(job.get('tasks') or 1) > 1
 
         try:
             started = time.perf_counter()
-            data = ComputationClient._dispatch_task(
-                'tasks.run_computation',
-                [job],
-                timeout=timeout_seconds + 10,
-            )
+            if sharded and job.get('shard_backend') == 'celery':
+                data = ComputationClient._run_sharded(job, timeout=timeout_seconds + 10)
+            else:
+                # Local shards and ranks run in waves within one task, plus planning and reduce.
+                budget_seconds = timeout_seconds * (ComputationClient.SHARDED_TIMEOUT_FACTOR if multi_part else 1)
+                data = ComputationClient._dispatch_task(
+                    'tasks.run_computation',
+                    [job],
+                    timeout=budget_seconds + 10,
+                    run_id=job.get('run_id'),
+                )
             elapsed = time.perf_counter() - started
 
             if 'processing_time_seconds' not in data:
@@ -72,4 +215,41 @@ class ComputationClient:
             raise
         except Exception as error:
             logger.error(f'Computation run failed: {error}')
-            raise CoProofError(f'Computation Service Unavailable: {str(error)}', code=503)
\ No newline at end of file
+            raise CoProofError(f'Computation Service Unavailable: {str(error)}', code=503)
+        finally:
+            if run_id:
+                ComputationClient._end_run(run_id)
+
+    @staticmethod
+    def get_cache_stats():
+        """
+        Hit/miss counters of the computation worker's memoized results.
+        """
+        try:
+            return ComputationClient._dispatch_task('tasks.computation_cache_stats', [], timeout=10)
+        except CoProofError:
+            raise
+        except Exception as error:
+            logger.error(f'Computation cache stats failed: {error}')
+            raise CoProofError(f'Computation Service Unavailable: {str(error)}', code=503)
+
+    @classmethod
+    def cancel_computation(cls, owner: str, run_id: str):
+        """Ask the worker to stop *owner*'s run *run_id*; it kills the job at its next progress poll."""
+        cls.ensure_run_owner(owner, run_id)
+        try:
+            cls._get_redis().set(cls.CANCEL_PREFIX + run_id, '1', ex=cls.CANCEL_TTL_SECONDS)
+        except redis.RedisError as error:
+            logger.error(f'Computation cancel failed: {error}')
+            raise CoProofError(f'Computation Service Unavailable: {str(error)}', code=503)
+        return {'run_id': run_id, 'cancel_requested': True}
+
+    @classmethod
+    def get_progress(cls, run_id: str):
+        """Latest progress report of run *run_id*, or None."""
+        try:
+            raw = cls._get_redis().get(cls.PROGRESS_PREFIX + run_id)
+        except redis.RedisError as error:
+            logger.error(f'Computation progress lookup failed: {error}')
+            raise CoProofError(f'Computation Service Unavailable: {str(error)}', code=503)
+        return json.loads(raw) if raw is not None else None
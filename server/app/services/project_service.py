@@ -35,10 +35,13 @@ class ProjectService:
         goal = data['goal'].strip()
 
         # Validate user-provided goal context before creating a GitHub repository.
+        # Narrowed imports only speed up this check; they cover the goal, not
+        # the proofs added later, so the project keeps the imports as given.
         ProjectService._validate_goal_context(
             goal,
             goal_imports=goal_imports,
             goal_definitions=goal_definitions,
+            minimize_imports=bool(data.get('minimize_imports')),
         )
 
         raw_contributors = data.get('contributor_ids') or []
@@ -343,7 +346,7 @@ class ProjectService:
         )
 
     @staticmethod
-    def _validate_goal_context(goal, goal_imports=None, goal_definitions=None):
+    def _validate_goal_context(goal, goal_imports=None, goal_definitions=None, minimize_imports=False):
         def_content = ProjectService._generate_def_lean_from_prompt(
             goal,
             goal_imports=goal_imports,
@@ -356,9 +359,9 @@ class ProjectService:
             "  sorry\n"
         )
 
-        verification = CompilerClient.verify_snippet(snippet)
+        verification = CompilerClient.verify_snippet(snippet, minimize_imports=minimize_imports)
         if verification.get('valid'):
-            return
+            return verification
 
         formatted_errors = ProjectService._format_compiler_errors(verification.get('errors') or [])
         detail = formatted_errors or 'Lean could not validate the provided goal context.'
@@ -16,6 +16,8 @@ class Config:
     CELERY_BROKER_URL = REDIS_URL
     CELERY_RESULT_BACKEND = REDIS_URL
     CELERY_LEAN_QUEUE = os.environ.get('CELERY_LEAN_QUEUE', 'lean_queue')
+    CELERY_LEAN_INTERACTIVE_QUEUE = os.environ.get('CELERY_LEAN_INTERACTIVE_QUEUE', 'lean_interactive_queue')
+    CELERY_LEAN_SESSION_QUEUE = os.environ.get('CELERY_LEAN_SESSION_QUEUE', 'lean_session_queue')
     CELERY_COMPUTATION_QUEUE = os.environ.get('CELERY_COMPUTATION_QUEUE', 'computation_queue')
     CELERY_GIT_ENGINE_QUEUE = os.environ.get('CELERY_GIT_ENGINE_QUEUE', 'git_engine_queue')
     CELERY_NL2FL_QUEUE = os.environ.get('CELERY_NL2FL_QUEUE', 'nl2fl_queue')
@@ -50,6 +50,28 @@ class TestTokenRefresh:
         assert response.status_code == 401
 
 
+# ---------------------------------------------------------------------------
+# Lean tools
+# ---------------------------------------------------------------------------
+
+class TestCheckSyntax:
+    def test_missing_code_returns_400(self, client):
+        response = client.post(
+            "/api/v1/nodes/tools/check-syntax",
+            data=json.dumps({"code": "   "}),
+            content_type="application/json",
+        )
+        assert response.status_code == 400
+
+    def test_oversized_code_returns_413(self, client):
+        response = client.post(
+            "/api/v1/nodes/tools/check-syntax",
+            data=json.dumps({"code": "a" * 100_001}),
+            content_type="application/json",
+        )
+        assert response.status_code == 413
+
+
 # ---------------------------------------------------------------------------
 # Global error handlers
 # ---------------------------------------------------------------------------
@@ -95,3 +117,220 @@ class TestCoProofError:
         from app.exceptions import GitLockError
         err = GitLockError()
         assert err.code == 409
+
+
+class TestColumnarEvidence:
+    def _roundtrip(self, records, row_group_size=2):
+        from app.services.columnar_evidence import ColumnarEvidenceReader, ColumnarEvidenceWriter
+        writer = ColumnarEvidenceWriter(row_group_size=row_group_size)
+        writer.extend(records)
+        data, index = writer.finish(data_file="evidence_records.cols")
+        return ColumnarEvidenceReader(index, data), index
+
+    def test_roundtrip_preserves_types(self):
+        records = [
+            {"n": 1, "ok": True, "ratio": 0.5, "label": "a", "factors": [2, 3]},
+            {"n": 2, "ok": False, "ratio": 1.5, "label": "b", "factors": []},
+            {"n": 3, "ok": True, "ratio": 2.5, "label": "c", "factors": [5]},
+        ]
+        reader, _index = self._roundtrip(records)
+        assert list(reader.iter_rows()) == records
+
+    def test_roundtrip_keeps_nulls_apart_from_missing_columns(self):
+        records = [{"a": None}, {"a": 1, "b": None}, None, {}, {"b": "x"}, 7]
+        reader, _index = self._roundtrip(records)
+        assert list(reader.iter_rows()) == records
+
+    def test_missing_columns_read_as_null(self):
+        reader, index = self._roundtrip([{"a": 1}, {"a": 2}, {"b": "x"}])
+        assert reader.read_column("a") == [1, 2, None]
+        assert reader.read_column("b") == [None, None, "x"]
+        null_counts = {column["name"]: column["null_count"] for column in index["columns"]}
+        assert null_counts == {"a": 1, "b": 2}
+
+    def test_index_records_types_and_ranges(self):
+        _reader, index = self._roundtrip([{"n": 5, "x": 1}, {"n": -2, "x": 0.5}])
+        columns = {column["name"]: column for column in index["columns"]}
+        assert columns["n"]["type"] == "int"
+        assert (columns["n"]["min"], columns["n"]["max"]) == (-2, 5)
+        assert columns["x"]["type"] == "float"
+        assert index["row_count"] == 2
+
+    def test_integers_beyond_64_bits_roundtrip(self):
+        reader, _index = self._roundtrip([{"n": 10 ** 30}, {"n": 1}])
+        assert reader.read_column("n") == [10 ** 30, 1]
+
+    def test_reader_rejects_foreign_data(self):
+        from app.services.columnar_evidence import ColumnarEvidenceReader
+        _reader, index = self._roundtrip([{"n": 1}])
+        with pytest.raises(ValueError):
+            ColumnarEvidenceReader(index, b"not a columnar file")
+
+
+class TestCompilerClientSingleflight:
+    def test_inflight_key_depends_on_queue(self):
+        from app.services.integrations.compiler_client import CompilerClient
+        args = ["theorem t : True := trivial", "snippet.lean", False]
+        interactive = CompilerClient._inflight_key("tasks.verify_snippet", args, "lean_interactive_queue")
+        batch = CompilerClient._inflight_key("tasks.verify_snippet", args, "lean_queue")
+        assert interactive != batch
+        assert interactive == CompilerClient._inflight_key("tasks.verify_snippet", list(args), "lean_interactive_queue")
+
+
+# ---------------------------------------------------------------------------
+# Computation clients
+# ---------------------------------------------------------------------------
+
+class FakeRedis:
+    """The string commands the computation clients use, in memory."""
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value.encode("utf-8") if isinstance(value, str) else value
+        return True
+
+    def delete(self, *keys):
+        return sum(self.values.pop(key, None) is not None for key in keys)
+
+    def expire(self, key, seconds):
+        return key in self.values
+
+
+class FakeCelery:
+    def __init__(self):
+        self.sent = []
+
+    def send_task(self, name, args=None, queue=None):
+        self.sent.append((name, args, queue))
+
+
+@pytest.fixture
+def computation_redis(monkeypatch):
+    from app.services.integrations.cluster_client import ClusterClient
+    from app.services.integrations.computation_client import ComputationClient
+    fake = FakeRedis()
+    celery = FakeCelery()
+    for client_class in (ComputationClient, ClusterClient):
+        monkeypatch.setattr(client_class, "_redis", fake)
+        monkeypatch.setattr(client_class, "_celery", celery)
+    return fake
+
+
+class TestClusterClientJobOwner:
+    def test_owner_gets_the_job_status(self, computation_redis, monkeypatch):
+        from app.services.integrations.cluster_client import ClusterClient
+        monkeypatch.setattr(
+            ClusterClient, "_dispatch_task", classmethod(lambda cls, name, args, timeout: {"state": "running"}),
+        )
+        job = ClusterClient.submit_job("alice", {"executor": "local", "source_code": "def run(i, t): return 1"})
+        assert ClusterClient.get_job_status("alice", job["job_id"]) == {"state": "running"}
+
+    def test_other_user_gets_403(self, computation_redis):
+        from app.exceptions import CoProofError
+        from app.services.integrations.cluster_client import ClusterClient
+        job = ClusterClient.submit_job("alice", {"executor": "local"})
+        with pytest.raises(CoProofError) as error:
+            ClusterClient.get_job_status("mallory", job["job_id"])
+        assert error.value.code == 403
+
+    def test_unknown_job_gets_404(self, computation_redis):
+        from app.exceptions import CoProofError
+        from app.services.integrations.cluster_client import ClusterClient
+        with pytest.raises(CoProofError) as error:
+            ClusterClient.get_job_status("alice", "0" * 32)
+        assert error.value.code == 404
+
+
+class TestComputationRunClaims:
+    def test_run_id_of_another_user_gets_409(self, computation_redis):
+        from app.exceptions import CoProofError
+        from app.services.integrations.computation_client import ComputationClient
+        ComputationClient.claim_run("alice", "run-1")
+        with pytest.raises(CoProofError) as error:
+            ComputationClient.claim_run("mallory", "run-1")
+        assert error.value.code == 409
+
+    def test_owner_can_reuse_the_run_id(self, computation_redis):
+        from app.services.integrations.computation_client import ComputationClient
+        ComputationClient.claim_run("alice", "run-1")
+        ComputationClient.claim_run("alice", "run-1")
+        ComputationClient.ensure_run_owner("alice", "run-1")
+
+    def test_start_run_clears_a_stale_cancel_flag(self, computation_redis):
+        from app.services.integrations.computation_client import ComputationClient
+        ComputationClient.claim_run("alice", "run-1")
+        ComputationClient.cancel_computation("alice", "run-1")
+        computation_redis.set(ComputationClient.PROGRESS_PREFIX + "run-1", '{"done": 3}')
+
+        ComputationClient.start_run("alice", "run-1")
+
+        assert computation_redis.get(ComputationClient.CANCEL_PREFIX + "run-1") is None
+        assert ComputationClient.get_progress("run-1") is None
+
+    def test_start_run_of_another_users_run_keeps_its_flags(self, computation_redis):
+        from app.exceptions import CoProofError
+        from app.services.integrations.computation_client import ComputationClient
+        ComputationClient.claim_run("alice", "run-1")
+        ComputationClient.cancel_computation("alice", "run-1")
+        with pytest.raises(CoProofError):
+            ComputationClient.start_run("mallory", "run-1")
+        assert computation_redis.get(ComputationClient.CANCEL_PREFIX + "run-1") == b"1"
+
+
+class TestComputationResourceUsage:
+    @staticmethod
+    def _node(name, result, kind="computation", timeout_seconds=60):
+        from types import SimpleNamespace
+        return SimpleNamespace(
+            id=name, name=name, node_kind=kind, last_computation_result=result,
+            computation_spec={"timeout_seconds": timeout_seconds},
+        )
+
+    @staticmethod
+    def _resources(cpu_user, cpu_system, peak_rss_bytes):
+        return {
+            "cpu_user_seconds": cpu_user, "cpu_system_seconds": cpu_system, "peak_rss_bytes": peak_rss_bytes,
+            "io_read_bytes": 100, "io_write_bytes": 10, "processes": 1,
+        }
+
+    def test_totals_skip_cache_hits_and_nodes_are_sorted_by_cpu(self):
+        from app.services.computation_service import ComputationService
+        nodes = [
+            self._node("light", {"completed": True, "processing_time_seconds": 1.0,
+                                 "resources": self._resources(0.5, 0.1, 1000)}),
+            self._node("heavy", {"completed": True, "processing_time_seconds": 4.0,
+                                 "resources": self._resources(3.0, 0.5, 5000)}),
+            self._node("cached", {"completed": True, "cache_hit": True, "processing_time_seconds": 0.01,
+                                  "resources": self._resources(9.0, 1.0, 9000)}),
+        ]
+
+        usage = ComputationService.aggregate_resource_usage(nodes)
+
+        assert [entry["node_id"] for entry in usage["nodes"]] == ["cached", "heavy", "light"]
+        assert usage["totals"]["cpu_user_seconds"] == 3.5
+        assert usage["totals"]["io_read_bytes"] == 200
+        assert usage["totals"]["processes"] == 2
+        assert usage["maxima"] == {"peak_rss_bytes": 9000, "processing_time_seconds": 4.0, "cpu_seconds": 10.0}
+        assert (usage["computation_nodes"], usage["measured_nodes"]) == (3, 3)
+
+    def test_unmeasured_and_other_nodes(self):
+        from app.services.computation_service import ComputationService
+        nodes = [
+            self._node("never-run", None),
+            self._node("old-worker", {"completed": False, "processing_time_seconds": 2.0}),
+            self._node("lemma", {"resources": self._resources(1.0, 1.0, 1)}, kind="proof"),
+        ]
+
+        usage = ComputationService.aggregate_resource_usage(nodes)
+
+        assert (usage["computation_nodes"], usage["measured_nodes"]) == (1, 0)
+        assert usage["nodes"][0]["cpu_seconds"] is None
+        assert usage["nodes"][0]["resources"] is None
+        assert usage["totals"]["cpu_user_seconds"] == 0